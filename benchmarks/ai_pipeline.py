@@ -0,0 +1,92 @@
+# Message arrival -> ai_alert latency of AiWorker against a local fake OpenAI server.
+# Usage: python benchmarks/ai_pipeline.py [--llm-delay 1.5] [--batch-interval 0.5] [--batches 20]
+import argparse
+import logging
+import os
+import statistics
+import time
+from datetime import datetime, timezone
+from stubs import FakeOpenAIServer
+import app_logger
+import ai_worker
+from ai_worker import AiWorker
+from alert_monitor import Region
+from config import parse_settings
+from message_bus import MessageBus
+from telegram import Message
+
+
+class SerialAiWorker(AiWorker):
+    # The pre-pipeline behaviour: one blocking call per batch on the bus thread
+    def process_messages(self, messages):
+        with self.state_lock:
+            if not self.ai_enabled:
+                return
+            history = self.prompt.prefix()
+            entries = self._append_history(messages)
+        ai_alert = self.request_analysis(history, entries)
+        if ai_alert.alert:
+            ai_worker.message_bus.publish('ai_alert', ai_alert)
+
+
+def run(worker_class, settings, args):
+    bus = MessageBus()
+    ai_worker.message_bus = bus
+    published = {}
+    latencies = []
+
+    def on_alert(alert):
+        now = time.monotonic()
+        resolved = [batch_id for batch_id in published if f"#{batch_id} " in alert.text]
+        for batch_id in [batch_id for batch_id in published if resolved and batch_id <= max(resolved)]:
+            latencies.append(now - published.pop(batch_id))
+
+    worker = worker_class(settings)
+    bus.subscribe('ai_alert', on_alert)
+    worker.start()
+    bus.start()
+    bus.publish('alert', Region(id=14, name="Одеська область", name_en="Odesa oblast", alert=True, changed=datetime.now(timezone.utc)))
+
+    for batch_id in range(args.batches):
+        threat = batch_id % args.threat_every == 0
+        text = f"#{batch_id} Група ударних БпЛА курсом на Одесу" if threat else f"#{batch_id} Новини дня"
+        messages = [Message(id=f"bench/{batch_id}", author="bench", text=text, date=datetime.now(timezone.utc))]
+        if threat:
+            published[batch_id] = time.monotonic()
+        bus.publish('new_messages', messages)
+        time.sleep(args.batch_interval)
+    deadline = time.monotonic() + args.llm_delay * args.batches + 10
+    while published and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return latencies
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark AiWorker arrival-to-alert latency')
+    parser.add_argument('--llm-delay', type=float, default=1.5)
+    parser.add_argument('--batch-interval', type=float, default=0.5)
+    parser.add_argument('--batches', type=int, default=20)
+    parser.add_argument('--threat-every', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    app_logger.set_log_level('WARNING')
+    logging.getLogger('ai_worker_persistent').setLevel(logging.INFO)
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+    for name, worker_class in [('serial', SerialAiWorker), ('pipelined', AiWorker)]:
+        with FakeOpenAIServer(delay=args.llm_delay) as server:
+            settings = parse_settings({
+                'openai_base_url': server.base_url,
+                'analyzer_prompt': 'Classify threats',
+                'ai_workers': args.workers,
+                'ai_streaming': False,
+                'ai_gate_threshold': 0,
+                'ai_instant_alert_threshold': None,
+                'ai_near_duplicate_threshold': None,
+            })
+            latencies = sorted(run(worker_class, settings, args))
+            if not latencies:
+                print(f"{name:<10} no alerts received")
+                continue
+            print(f"{name:<10} requests {server.requests:>3}  alerts {len(latencies):>3}  "
+                  f"p50 {statistics.median(latencies):6.2f}s  p95 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]:6.2f}s  max {latencies[-1]:6.2f}s")
@@ -0,0 +1,74 @@
+# Time to first ai_alert with and without streamed completions, against a local streaming stub.
+# Usage: python benchmarks/ai_streaming.py [--ttft 0.5] [--token-delay 0.03] [--runs 5]
+import argparse
+import logging
+import os
+import statistics
+import threading
+import time
+from datetime import datetime, timezone
+from stubs import FakeOpenAIServer
+import app_logger
+import ai_worker
+from ai_worker import AiWorker
+from alert_monitor import Region
+from config import parse_settings
+from message_bus import MessageBus
+from telegram import Message
+
+
+def run(settings, runs):
+    bus = MessageBus()
+    ai_worker.message_bus = bus
+    first = []
+    complete = []
+    event = threading.Event()
+    sent = [0.0]
+
+    def on_alert(_):
+        first.append(time.monotonic() - sent[0])
+        if not settings.ai_streaming:
+            complete.append(first[-1])
+            event.set()
+
+    def on_update(_):
+        complete.append(time.monotonic() - sent[0])
+        event.set()
+
+    worker = AiWorker(settings)
+    bus.subscribe('ai_alert', on_alert)
+    bus.subscribe('ai_alert_update', on_update)
+    worker.start()
+    bus.start()
+    bus.publish('alert', Region(id=14, name="Одеська область", name_en="Odesa oblast", alert=True, changed=datetime.now(timezone.utc)))
+    for run_id in range(runs):
+        event.clear()
+        sent[0] = time.monotonic()
+        bus.publish('new_messages', [Message(id=f"bench/{run_id}", author="bench", text=f"Run {run_id}: група ударних БпЛА, ціль {run_id * 7919}", date=datetime.now(timezone.utc))])
+        event.wait(timeout=30)
+    return first, complete
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark time to first AI alert')
+    parser.add_argument('--ttft', type=float, default=0.5, help='Stub time to first token, seconds')
+    parser.add_argument('--token-delay', type=float, default=0.03, help='Stub delay per streamed token, seconds')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    app_logger.set_log_level('WARNING')
+    logging.getLogger('ai_worker_persistent').setLevel(logging.INFO)
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+    for streaming in (False, True):
+        with FakeOpenAIServer(delay=args.ttft, token_delay=args.token_delay) as server:
+            settings = parse_settings({
+                'openai_base_url': server.base_url,
+                'analyzer_prompt': 'Classify threats',
+                'ai_streaming': streaming,
+                'ai_gate_threshold': 0,
+                'ai_instant_alert_threshold': None,
+                'ai_near_duplicate_threshold': None,
+            })
+            first, complete = run(settings, args.runs)
+            name = 'streaming' if streaming else 'blocking'
+            print(f"{name:<10} first alert p50 {statistics.median(first):5.2f}s  complete verdict p50 {statistics.median(complete):5.2f}s")
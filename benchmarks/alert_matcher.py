@@ -0,0 +1,66 @@
+# Per-message cost of the compiled alert matcher vs the original keyword + region scan.
+# Usage: python benchmarks/alert_matcher.py [--messages 5000]
+import argparse
+import random
+import time
+import stubs  # noqa: F401
+from alert_monitor import AlertMatcher, AlertMonitor
+from config import parse_settings
+
+TEMPLATES = [
+    "🔴 {time} Повітряна тривога в {region}\nСлідкуйте за подальшими повідомленнями.\n#{tag}",
+    "🟢 {time} Відбій тривоги в {region}.\nСлідкуйте за подальшими повідомленнями.\n#{tag}",
+    "🔴 {time} Повітряна тривога в {region}, {other}\n#{tag}",
+    "🟡 {time} Загроза артобстрілу в {region}\n#{tag}",
+]
+
+
+def legacy_match(regions, text, all_regions=False):
+    if "Повітряна тривога" in text:
+        alert = True
+    elif "Відбій" in text:
+        alert = False
+    else:
+        return None, []
+    matched = []
+    for region in regions:
+        if region.name in text:
+            matched.append(region)
+            if not all_regions:
+                break
+    return alert, matched
+
+
+def backlog(regions, count):
+    rng = random.Random(42)
+    messages = []
+    for i in range(count):
+        region, other = rng.sample(regions, 2)
+        messages.append(rng.choice(TEMPLATES).format(
+            time=f"{20 + i // 600 % 4}:{i // 10 % 60:02d}", region=region.name, other=other.name, tag=region.name_en.replace(' ', '_')))
+    return messages
+
+
+def measure(match, messages):
+    started = time.perf_counter()
+    for text in messages:
+        match(text)
+    return (time.perf_counter() - started) / len(messages) * 1e6
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark alert message matching')
+    parser.add_argument('--messages', type=int, default=5000)
+    args = parser.parse_args()
+
+    regions = AlertMonitor(parse_settings({})).regions
+    matcher = AlertMatcher(regions)
+    messages = backlog(regions, args.messages)
+
+    legacy = measure(lambda text: legacy_match(regions, text), messages)
+    legacy_all = measure(lambda text: legacy_match(regions, text, all_regions=True), messages)
+    compiled = measure(matcher.match, messages)
+    mentions = sum(len(matcher.match(text)[1]) for text in messages)
+    print(f"legacy scan, first region {legacy:7.2f} us/message")
+    print(f"legacy scan, all regions  {legacy_all:7.2f} us/message")
+    print(f"compiled matcher          {compiled:7.2f} us/message ({mentions} region updates over {len(messages)} messages)")
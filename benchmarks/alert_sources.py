@@ -0,0 +1,85 @@
+# Redundant alert ingestion: two alert channels on a local t.me stand-in plus a JSON alert API, each
+# with its own polling interval and failure rate. Every transition of one region is posted to all three
+# at once; reports how often each source was first, each source's own lag, and the fused detection lag
+# against what the slowest single channel would have given.
+# Usage: python benchmarks/alert_sources.py [--transitions 10] [--spacing 3.0] [--fail 0.3]
+import argparse
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from stubs import AlertApiStubServer, TelegramStubServer
+import app_logger
+import telegram
+from alert_monitor import AlertMonitor
+from config import parse_settings
+from message_bus import message_bus
+
+REGION_ID = 14
+REGION = "Одеська область"
+
+
+class Probe:
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def on_event(self, region):
+        with self.lock:
+            self.events.append((region.alert, time.time()))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare alert sources and fused detection lag')
+    parser.add_argument('--transitions', type=int, default=10)
+    parser.add_argument('--spacing', type=float, default=3.0)
+    parser.add_argument('--fail', type=float, default=0.3, help='failure ratio of the fast channel')
+    args = parser.parse_args()
+    app_logger.set_log_level('CRITICAL')
+    logging.getLogger('ai_worker_persistent').setLevel(logging.WARNING)
+
+    with TelegramStubServer(posts_per_channel=0) as stub, AlertApiStubServer(fail_ratio=0.1) as api:
+        stub.fail_ratios['fast_channel'] = args.fail
+        telegram.set_base_url(stub.base_url)
+        settings = parse_settings({
+            'regions_to_monitor': [REGION_ID],
+            'alert_channels': [
+                {'name': 'fast_channel', 'polling_interval': 0.5, 'min_polling_interval': 0.25, 'backoff_polling_interval': 0.5},
+                {'name': 'slow_channel', 'polling_interval': 1.5, 'min_polling_interval': 1.5, 'backoff_polling_interval': 1.5},
+            ],
+            'alert_api_sources': [
+                {'name': 'api', 'url': api.url, 'interval': 1.0, 'items_key': 'regions'},
+            ],
+        })
+        monitor = AlertMonitor(settings)
+        probe = Probe()
+        message_bus.subscribe('alert', probe.on_event)
+        message_bus.subscribe('clear', probe.on_event)
+        message_bus.start()
+        monitor.start()
+        time.sleep(2)
+
+        posted = []
+        for index in range(args.transitions):
+            alert = index % 2 == 0
+            text = f"{'Повітряна тривога' if alert else 'Відбій тривоги'} в {REGION}"
+            now = datetime.now(timezone.utc)
+            posted.append((alert, now.timestamp()))
+            stub.add_post('fast_channel', text, now)
+            stub.add_post('slow_channel', text, now)
+            api.set_state(REGION_ID, alert, now)
+            time.sleep(args.spacing)
+        time.sleep(2)
+
+    with probe.lock:
+        events = list(probe.events)
+    detected = [at - posted_at for (alert, posted_at), (event_alert, at) in zip(posted, events) if alert == event_alert]
+    print(f"fused: {len(events)}/{len(posted)} transitions, lag p50 {percentile(detected, 0.5):.2f}s max {max(detected, default=0):.2f}s")
+    for name, stats in sorted(monitor.source_stats.snapshot().items()):
+        print(f"{name:<13} first {stats.won:2d}, duplicates {stats.duplicates:2d}, stale {stats.stale:2d}, "
+              f"failed polls {stats.errors:3d}/{stats.polls:<4d} lag avg {stats.lag_avg:.2f}s")
@@ -0,0 +1,140 @@
+# Cross-process bus: codec size and speed against pickle, and the round trip scraper -> analyzer ->
+# sender through the Unix-socket broker, with an echo "analyzer" in a child process answering every
+# new_messages batch with an ai_alert. Senders join a group, so each alert reaches exactly one of them.
+# Usage: python benchmarks/bus_transport.py [--batches 500] [--batch-size 5] [--senders 2]
+import argparse
+import multiprocessing
+import os
+import pickle
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from stubs import SAMPLE_TEXTS
+import app_logger
+from ai_worker import AiAlert
+from alert_monitor import create_regions
+from bus_transport import BusBroker, BusTransport, decode_event, encode_event
+from message_bus import message_bus
+from telegram import Message
+
+
+def batch(index, size):
+    now = datetime.now(timezone.utc)
+    return [Message(id=f"channel{i}/{index * size + i}", author=f"channel{i}", text=SAMPLE_TEXTS[(index + i) % len(SAMPLE_TEXTS)], date=now)
+            for i in range(size)]
+
+
+def codec(size, count=2000):
+    messages = batch(0, size)
+    alert = AiAlert(alert=True, attacker="DRONE", text=SAMPLE_TEXTS[2], confidence=0.9, original_text=SAMPLE_TEXTS[2], detected=time.monotonic(), region_id=14)
+    for name, payload, topic in (("new_messages", messages, 'new_messages'), ("region", create_regions()[13], 'alert'), ("ai_alert", alert, 'ai_alert')):
+        started = time.perf_counter()
+        for _ in range(count):
+            frame = encode_event(topic, payload)
+            decode_event(frame)
+        ours = (time.perf_counter() - started) / count
+        started = time.perf_counter()
+        for _ in range(count):
+            pickled = pickle.dumps(payload)
+            pickle.loads(pickled)
+        pickled_time = (time.perf_counter() - started) / count
+        print(f"{name:<13} frame {len(frame):5d} B, {ours * 1e6:6.1f} us encode+decode  |  pickle {len(pickled):5d} B, {pickled_time * 1e6:6.1f} us")
+
+
+def analyzer(path, ready):
+    # Child process: answers each batch with an ai_alert carrying the batch's first message id
+    app_logger.set_log_level('WARNING')
+
+    class Echo:
+        def on_messages(self, messages):
+            message_bus.publish('ai_alert', AiAlert(alert=True, attacker="DRONE", text=str(messages[0].id), confidence=0.9,
+                                                    original_text="", detected=time.monotonic()))
+
+    echo = Echo()
+    message_bus.subscribe('new_messages', echo.on_messages)
+    transport = BusTransport(path, message_bus, outgoing=['ai_alert'], incoming=['new_messages'], name='analyzer')
+    transport.start()
+    message_bus.start()
+    transport.connected.wait()
+    ready.set()
+    while True:
+        time.sleep(1)
+
+
+def sender(path, ready, results):
+    app_logger.set_log_level('WARNING')
+
+    class Probe:
+        def on_ai_alert(self, alert):
+            results.put((alert.text, time.time()))
+
+    probe = Probe()
+    message_bus.subscribe('ai_alert', probe.on_ai_alert)
+    transport = BusTransport(path, message_bus, incoming=['ai_alert'], group='sender', name=f'sender{os.getpid()}')
+    transport.start()
+    message_bus.start()
+    transport.connected.wait()
+    ready.set()
+    while True:
+        time.sleep(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the cross-process bus transport')
+    parser.add_argument('--batches', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=5)
+    parser.add_argument('--senders', type=int, default=2)
+    parser.add_argument('--interval', type=float, default=0.002)
+    args = parser.parse_args()
+    app_logger.set_log_level('WARNING')
+    codec(args.batch_size)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bus.sock')
+        broker = BusBroker(path)
+        broker.start()
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        events = [context.Event() for _ in range(args.senders + 1)]
+        processes = [context.Process(target=analyzer, args=(path, events[0]), daemon=True)]
+        processes += [context.Process(target=sender, args=(path, event, results), daemon=True) for event in events[1:]]
+        for process in processes:
+            process.start()
+        for event in events:
+            event.wait(30)
+        time.sleep(0.5)
+
+        transport = BusTransport(path, message_bus, outgoing=['new_messages'], name='scraper')
+        transport.start()
+        message_bus.start()
+        transport.connected.wait()
+        sent = {}
+        started = time.perf_counter()
+        for index in range(args.batches):
+            messages = batch(index, args.batch_size)
+            sent[str(messages[0].id)] = time.time()
+            message_bus.publish('new_messages', messages)
+            time.sleep(args.interval)
+        received = {}
+        deadline = time.monotonic() + 10
+        while len(received) < args.batches and time.monotonic() < deadline:
+            try:
+                text, at = results.get(timeout=1)
+            except Exception:
+                continue
+            if text in received:
+                received[text] = None
+            else:
+                received[text] = at
+        elapsed = time.perf_counter() - started
+        latencies = sorted(received[text] - sent[text] for text in received if received[text] is not None)
+        duplicates = sum(1 for value in received.values() if value is None)
+        for process in processes:
+            process.terminate()
+        broker.stop()
+
+    p50 = latencies[len(latencies) // 2] if latencies else 0.0
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0.0
+    print(f"round trip scraper -> analyzer -> {args.senders} senders: {len(latencies)}/{args.batches} alerts, {duplicates} duplicates, "
+          f"p50 {p50 * 1000:.2f} ms p99 {p99 * 1000:.2f} ms, {args.batches / elapsed:.0f} batches/s")
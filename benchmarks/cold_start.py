@@ -0,0 +1,115 @@
+# Cold start of main.py: import time, and for a real process against a local t.me stand-in the time
+# from exec to the first alert channel request, to a ready health file, and from SIGTERM to exit.
+# Firebase credentials are deliberately missing, so role "all" shows the alert path does not wait for
+# the push backend; readiness is measured with role "scraper", which needs no credentials.
+# --src runs another tree, e.g. a worktree of an older commit, for a before/after comparison.
+# Usage: python benchmarks/cold_start.py [--runs 5] [--src path/to/src]
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import yaml
+from stubs import TelegramStubServer
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+
+def import_time(src, module='main'):
+    # Cumulative microseconds of the module's own -X importtime line
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=src, capture_output=True, text=True).stderr
+    for line in reversed(output.splitlines()):
+        parts = [part.strip() for part in line.split('|')]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1e6
+    raise RuntimeError(f"No import time for {module}:\n{output[-2000:]}")
+
+
+def read_health(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def run(src, stub, directory, role):
+    settings_path = os.path.join(directory, 'settings.yml')
+    health_path = os.path.join(directory, 'health.json')
+    channel = f"alerts_{role}_{time.monotonic_ns()}"
+    with open(settings_path, 'w') as file:
+        yaml.safe_dump({
+            'alert_channel': channel,
+            'info_channels': [],
+            'telegram_base_url': stub.base_url,
+            'metrics_port': None,
+            'state_path': os.path.join(directory, 'state.db'),
+            'log_file': os.path.join(directory, 'execution.log'),
+            'health_file': health_path,
+            'health_interval': 0.05,
+            'firebase_credentials_path': os.path.join(directory, 'missing.json'),
+        }, file)
+    environment = dict(os.environ, OPENAI_API_KEY='cold-start')
+    if role == 'scraper':
+        # main.py suffixes per-role files, and shard 0 is named scraper0
+        health_path = os.path.join(directory, 'health-scraper0.json')
+    if os.path.exists(health_path):
+        os.remove(health_path)
+    command = [sys.executable, 'main.py', '--settings', settings_path, '--log-level', 'WARNING', '--role', role]
+    if role == 'scraper':
+        command += ['--shard', '0/1']
+    started = time.monotonic()
+    process = subprocess.Popen(command, cwd=src, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    result = {'first_poll': None, 'ready': None, 'stop': None, 'exit': None}
+    deadline = started + 30
+    while time.monotonic() < deadline and process.poll() is None:
+        now = time.monotonic()
+        if result['first_poll'] is None and stub.channel_requests.get(channel):
+            result['first_poll'] = now - started
+        if result['ready'] is None:
+            health = read_health(health_path)
+            if health and health['status'] == 'ready':
+                result['ready'] = now - started
+        if result['first_poll'] is not None and (result['ready'] is not None or role == 'all' and now - started > result['first_poll'] + 1):
+            break
+        time.sleep(0.002)
+    stopping = time.monotonic()
+    process.send_signal(signal.SIGTERM)
+    try:
+        result['exit'] = process.wait(10)
+        result['stop'] = time.monotonic() - stopping
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    health = read_health(health_path)
+    result['final_status'] = health['status'] if health else None
+    return result
+
+
+def summary(values):
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return "n/a"
+    return f"median {values[len(values) // 2]:.2f}s min {values[0]:.2f}s"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure import time and time to first alert poll of main.py')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--src', type=str, default=SRC)
+    args = parser.parse_args()
+    src = os.path.abspath(args.src)
+
+    imports = [import_time(src) for _ in range(args.runs)]
+    print(f"import main: {summary(imports)}")
+    with TelegramStubServer(posts_per_channel=5) as stub, tempfile.TemporaryDirectory() as directory:
+        for role in ('all', 'scraper'):
+            results = [run(src, stub, directory, role) for _ in range(args.runs)]
+            print(f"role {role:<8} first alert poll {summary([result['first_poll'] for result in results])}, "
+                  f"ready {summary([result['ready'] for result in results])}, "
+                  f"SIGTERM to exit {summary([result['stop'] for result in results])}, "
+                  f"exit codes {sorted({result['exit'] for result in results}, key=str)}, "
+                  f"final health {sorted({result['final_status'] for result in results}, key=str)}")
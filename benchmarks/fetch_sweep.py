@@ -0,0 +1,48 @@
+# Sweep latency of the info channel fetch against a local t.me stub.
+# Usage: python benchmarks/fetch_sweep.py [--delay 0.15] [--channels 1 5 10 20 40]
+import argparse
+import time
+import requests
+from stubs import TelegramStubServer
+import telegram
+from channel_fetcher import ChannelFetcher
+
+
+def sequential_sweep(channel_names, sleep):
+    for channel_name in channel_names:
+        telegram.fetch_latest_messages(channel_name, http=requests)
+        time.sleep(sleep)
+
+
+def concurrent_sweep(fetcher, channel_names):
+    fetcher.fetch_all(channel_names)
+
+
+def measure(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark info channel sweep latency')
+    parser.add_argument('--delay', type=float, default=0.15, help='Stub server response delay, seconds')
+    parser.add_argument('--channels', type=int, nargs='+', default=[1, 5, 10, 20, 40])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--host-limit', type=int, default=4)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    with TelegramStubServer(delay=args.delay) as stub:
+        telegram.set_base_url(stub.base_url)
+        fetcher = ChannelFetcher(max_workers=args.workers, per_host_limit=args.host_limit)
+        print(f"{'channels':>8} {'sequential+0.3s':>16} {'sequential':>12} {'concurrent':>12}")
+        for count in args.channels:
+            channel_names = [f"channel{i}" for i in range(count)]
+            baseline = measure(lambda: sequential_sweep(channel_names, 0.3), 1)
+            no_sleep = measure(lambda: sequential_sweep(channel_names, 0), args.repeats)
+            pooled = measure(lambda: concurrent_sweep(fetcher, channel_names), args.repeats)
+            print(f"{count:>8} {baseline:>15.2f}s {no_sleep:>11.2f}s {pooled:>11.2f}s")
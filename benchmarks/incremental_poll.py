@@ -0,0 +1,41 @@
+# Per-poll cost of full-page scraping vs cursor-based incremental polling of quiet channels.
+# Usage: python benchmarks/incremental_poll.py [--channels 20] [--polls 20] [--no-etags]
+import argparse
+import time
+from stubs import TelegramStubServer
+import telegram
+from telegram import ChannelCursor
+
+
+def run(stub, channel_names, polls, poll):
+    requests_before, bytes_before = stub.requests, stub.bytes_sent
+    cpu_started = time.process_time()
+    for _ in range(polls):
+        for channel_name in channel_names:
+            poll(channel_name)
+    cpu = time.process_time() - cpu_started
+    count = polls * len(channel_names)
+    return (stub.bytes_sent - bytes_before) / count, cpu / count * 1000, (stub.requests - requests_before) / count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark incremental channel polling')
+    parser.add_argument('--channels', type=int, default=20)
+    parser.add_argument('--polls', type=int, default=20)
+    parser.add_argument('--no-etags', action='store_true', help='Stub does not send ETag, only the body digest saves parsing')
+    args = parser.parse_args()
+
+    with TelegramStubServer(etags=not args.no_etags) as stub:
+        telegram.set_base_url(stub.base_url)
+        channel_names = [f"channel{i}" for i in range(args.channels)]
+        cursors = {channel_name: ChannelCursor() for channel_name in channel_names}
+        for channel_name in channel_names:
+            telegram.fetch_new_messages(channel_name, cursors[channel_name])
+
+        full = run(stub, channel_names, args.polls, lambda name: telegram.fetch_latest_messages(name))
+        incremental = run(stub, channel_names, args.polls, lambda name: telegram.fetch_new_messages(name, cursors[name]))
+
+        print(f"{'mode':<12} {'bytes/poll':>12} {'cpu ms/poll':>12} {'requests/poll':>14}")
+        print(f"{'full page':<12} {full[0]:>12.0f} {full[1]:>12.3f} {full[2]:>14.2f}")
+        print(f"{'incremental':<12} {incremental[0]:>12.0f} {incremental[1]:>12.3f} {incremental[2]:>14.2f}")
+        print(f"fetch stats: {telegram.fetch_stats}")
@@ -0,0 +1,98 @@
+# LLM call latency and lost batches against a local OpenAI stand-in with injected latency spikes and
+# failures: a single request per call (hedging off), a hedged duplicate to the same endpoint after the
+# p95-derived delay, and a hedge to a separate fallback endpoint without spikes.
+# Usage: python benchmarks/llm_hedging.py [--calls 500] [--spike-ratio 0.015] [--spike-delay 3] [--fail-ratio 0.01]
+import argparse
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from stubs import SAMPLE_TEXTS, FakeOpenAIServer
+import app_logger
+from ai_worker import AiWorker
+from config import parse_settings
+from telegram import Message
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(settings, calls, warmup, concurrency):
+    worker = AiWorker(settings)
+    worker.start()
+    lock = threading.Lock()
+    latencies = []
+    errors = []
+    start = datetime.now(timezone.utc)
+    counter = iter(range(warmup + calls))
+
+    def analyze(index):
+        message = Message(id=f"bench/{index}", author=f"channel{index % 7}", text=f"{SAMPLE_TEXTS[index % len(SAMPLE_TEXTS)]} #{index}",
+                          date=start + timedelta(seconds=index))
+        with lock:
+            history = worker.prompt.prefix()
+            entries = worker._append_history([message])
+        started = time.monotonic()
+        try:
+            worker.request_analysis(history, entries)
+            error = None
+        except Exception as e:
+            error = type(e).__name__
+        elapsed = time.monotonic() - started
+        if index >= warmup:
+            with lock:
+                latencies.append(elapsed)
+                if error:
+                    errors.append(error)
+
+    def loop():
+        for index in counter:
+            analyze(index)
+
+    threads = [threading.Thread(target=loop) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, worker.llm.hedge_delay()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare LLM tail latency with and without hedged requests')
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=30, help='Calls before measuring, to fill the latency window')
+    parser.add_argument('--concurrency', type=int, default=2)
+    parser.add_argument('--delay', type=float, default=0.15, help='Stub time to first token, seconds')
+    parser.add_argument('--token-delay', type=float, default=0.005)
+    parser.add_argument('--spike-ratio', type=float, default=0.015, help='Below 1 - ai_hedge_percentile, or the hedge delay learns the spikes')
+    parser.add_argument('--spike-delay', type=float, default=3.0)
+    parser.add_argument('--fail-ratio', type=float, default=0.01)
+    parser.add_argument('--deadline', type=float, default=20.0)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    app_logger.set_log_level('CRITICAL')
+    logging.getLogger('ai_worker_persistent').setLevel(logging.CRITICAL)
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+    print(f"{args.calls} calls, {args.concurrency} at a time; primary first token {args.delay:g}s, "
+          f"{args.spike_ratio * 100:g}% spikes of {args.spike_delay:g}s, {args.fail_ratio * 100:g}% failures")
+    for mode in ('single', 'hedged', 'fallback'):
+        with FakeOpenAIServer(delay=args.delay, token_delay=args.token_delay, spike_ratio=args.spike_ratio, spike_delay=args.spike_delay,
+                              fail_ratio=args.fail_ratio, seed=args.seed) as primary, \
+                FakeOpenAIServer(delay=args.delay, token_delay=args.token_delay) as fallback:
+            config = {
+                'openai_base_url': primary.base_url,
+                'analyzer_prompt': 'Classify threats',
+                'ai_deadline': args.deadline,
+                'ai_hedging': mode != 'single',
+            }
+            if mode == 'fallback':
+                config['ai_fallback_base_url'] = fallback.base_url
+            latencies, errors, hedge_delay = run(parse_settings(config), args.calls, args.warmup, args.concurrency)
+            requests = primary.requests + fallback.requests
+            print(f"{mode:<9} p50 {percentile(latencies, 0.5):5.2f}s p95 {percentile(latencies, 0.95):5.2f}s "
+                  f"p99 {percentile(latencies, 0.99):5.2f}s max {max(latencies):5.2f}s, {len(errors)} lost batches, "
+                  f"{requests / (args.calls + args.warmup):.2f} requests/call, hedge delay {hedge_delay:.2f}s")
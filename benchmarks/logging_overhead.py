@@ -0,0 +1,111 @@
+# Caller-side cost of logging during an alert burst: the old synchronous file handler with eager
+# f-strings vs the queue-backed pipeline with deferred formatting. --disk-stall emulates a slow disk.
+# Usage: python benchmarks/logging_overhead.py [--calls 200] [--history 30] [--disk-stall 0.005] [--format json]
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from logging.handlers import TimedRotatingFileHandler
+from stubs import SAMPLE_TEXTS
+import app_logger
+
+
+def prompt_lines(count, offset):
+    return [{"role": "user", "content": f"> NEW 21:{(offset + i) % 60:02d}:00 channel{i}: {SAMPLE_TEXTS[(offset + i) % len(SAMPLE_TEXTS)]}"} for i in range(count)]
+
+
+def join_lines(lines):
+    return "\n".join(line['content'] for line in lines)
+
+
+RESPONSE = {"alert": True, "attacker": "DRONE", "risk": 0.9, "trigger": SAMPLE_TEXTS[2]}
+
+
+def legacy_call(logger, persistent, lines):
+    # What AiWorker did per request before: strings built whether or not anyone reads them
+    all_messages = join_lines(lines)
+    message = f"Sending messages to AI:\n\n{all_messages}\n"
+    logger.debug(message)
+    persistent.debug(message)
+    content = json.dumps(RESPONSE, ensure_ascii=False)
+    persistent.debug(f"AI response:\n\n{content}\n")
+    persistent.debug(f"AI response payload:\n\n{json.dumps(json.loads(content), indent=2, ensure_ascii=False)}\n")
+    logger.info(f"AI detected an alert: {RESPONSE}")
+
+
+def queued_call(logger, persistent, lines):
+    all_messages = app_logger.lazy(join_lines, lines)
+    logger.debug("Sending messages to AI:\n\n%s\n", all_messages)
+    persistent.debug("Sending messages to AI:\n\n%s\n", all_messages)
+    content = json.dumps(RESPONSE, ensure_ascii=False)
+    persistent.debug("AI response:\n\n%s\n", content)
+    persistent.debug("AI response payload:\n\n%s\n", app_logger.lazy(json.dumps, json.loads(content), indent=2, ensure_ascii=False))
+    logger.info("AI detected an alert: %s", RESPONSE)
+
+
+def stall(handler, seconds):
+    emit = handler.emit
+
+    def slow_emit(record):
+        time.sleep(seconds)
+        emit(record)
+    handler.emit = slow_emit
+
+
+def run(call, logger, persistent, args):
+    latencies = []
+    for index in range(args.calls):
+        lines = prompt_lines(args.history, index)
+        started = time.perf_counter()
+        call(logger, persistent, lines)
+        latencies.append(time.perf_counter() - started)
+    return sorted(latencies)
+
+
+def report(name, latencies, drain):
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:<8} per call p50 {p50 * 1e6:9.1f} us  p99 {p99 * 1e6:9.1f} us  max {latencies[-1] * 1e6:9.1f} us  "
+          f"total {sum(latencies) * 1000:8.1f} ms  writer drain {drain * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark logging overhead on the alert path')
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--history', type=int, default=30)
+    parser.add_argument('--disk-stall', type=float, default=0.0, help='Extra seconds per file write')
+    parser.add_argument('--format', choices=['text', 'json'], default='text')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        legacy_logger = logging.getLogger('bench_legacy')
+        legacy_logger.setLevel(logging.INFO)
+        legacy_logger.propagate = False
+        legacy_persistent = logging.getLogger('bench_legacy_persistent')
+        legacy_persistent.setLevel(logging.DEBUG)
+        legacy_persistent.propagate = False
+        handler = TimedRotatingFileHandler(os.path.join(directory, 'legacy.log'), when="midnight", backupCount=10, encoding='utf-8')
+        handler.setFormatter(logging.Formatter(app_logger.LOG_FORMAT))
+        stall(handler, args.disk_stall)
+        legacy_persistent.addHandler(handler)
+        latencies = run(legacy_call, legacy_logger, legacy_persistent, args)
+        report('legacy', latencies, 0.0)
+        handler.close()
+
+        log_file = os.path.join(directory, 'queued.log')
+        app_logger.configure(args.format, log_file, max_bytes=1024 * 1024, backup_count=3)
+        for listener_handler in app_logger.listener.handlers:
+            if isinstance(listener_handler, logging.StreamHandler) and not isinstance(listener_handler, logging.FileHandler):
+                listener_handler.setLevel(logging.CRITICAL)
+        stall(app_logger.listener.handlers[1], args.disk_stall)
+        logger = app_logger.get('bench_queued')
+        persistent = app_logger.get_persistent('bench_queued_persistent')
+        latencies = run(queued_call, logger, persistent, args)
+        started = time.perf_counter()
+        app_logger.listener.stop()
+        drain = time.perf_counter() - started
+        report('queued', latencies, drain)
+        written = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory) if name.startswith('queued'))
+        print(f"queued pipeline wrote {written / 1024:.0f} KiB ({args.format}), dropped {app_logger.queue_handler.dropped} records")
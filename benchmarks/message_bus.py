@@ -0,0 +1,88 @@
+# alert delivery latency while a slow new_messages consumer is busy: the old single-thread bus vs the
+# priority-aware bus with per-subscriber threads.
+# Usage: python benchmarks/message_bus.py [--handler-delay 0.5] [--batches 20]
+import argparse
+import queue
+import threading
+import time
+from stubs import PAGE_SIZE
+import app_logger
+from message_bus import MessageBus
+
+
+class LegacyBus:
+    # The previous bus: one unbounded queue, every callback run on a single thread
+    def __init__(self):
+        self.subscribers = {}
+        self.message_queue = queue.Queue()
+
+    def subscribe(self, topic, callback):
+        self.subscribers.setdefault(topic, []).append(callback)
+
+    def publish(self, topic, message):
+        self.message_queue.put((topic, message))
+
+    def _process_messages(self):
+        while True:
+            topic, message = self.message_queue.get()
+            for callback in self.subscribers.get(topic, []):
+                callback(message)
+
+    def start(self):
+        threading.Thread(target=self._process_messages, daemon=True).start()
+
+
+class SlowAnalyzer:
+    def __init__(self, delay):
+        self.delay = delay
+        self.batches = 0
+        self.messages = 0
+
+    def process_messages(self, messages):
+        self.batches += 1
+        self.messages += len(messages)
+        time.sleep(self.delay)
+
+
+class AlertListener:
+    def __init__(self):
+        self.latencies = []
+        self.done = threading.Event()
+
+    def process_alert_event(self, published):
+        self.latencies.append(time.monotonic() - published)
+        self.done.set()
+
+
+def run(bus, args):
+    analyzer = SlowAnalyzer(args.handler_delay)
+    listener = AlertListener()
+    bus.subscribe('new_messages', analyzer.process_messages)
+    bus.subscribe('alert', listener.process_alert_event)
+    bus.start()
+    for batch in range(args.batches):
+        bus.publish('new_messages', [f"message {batch}-{i}" for i in range(PAGE_SIZE)])
+        if batch % 5 == 4:
+            listener.done.clear()
+            bus.publish('alert', time.monotonic())
+            listener.done.wait(args.handler_delay * args.batches + 5)
+        time.sleep(args.publish_interval)
+    return analyzer, listener
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark message bus alert latency under a slow consumer')
+    parser.add_argument('--handler-delay', type=float, default=0.5, help='Time the new_messages handler takes per batch')
+    parser.add_argument('--publish-interval', type=float, default=0.1)
+    parser.add_argument('--batches', type=int, default=20)
+    args = parser.parse_args()
+    app_logger.set_log_level('WARNING')
+
+    for name, bus in [('legacy', LegacyBus()), ('priority', MessageBus())]:
+        analyzer, listener = run(bus, args)
+        latencies = listener.latencies
+        print(f"{name:9} alert latency avg {sum(latencies) / len(latencies) * 1000:8.1f} ms  max {max(latencies) * 1000:8.1f} ms  "
+              f"(analyzer saw {analyzer.messages} messages in {analyzer.batches} batches by the last alert)")
+        if isinstance(bus, MessageBus):
+            stats = bus.topic_stats()['new_messages']
+            print(f"{'':9} new_messages: {stats.coalesced} coalesced, max depth {stats.max_depth}")
@@ -0,0 +1,130 @@
+# Cost of serving more regions from one process: N per-region AiWorkers share the fetch pipeline,
+# the LLM client and its thread pool, and each keeps its own history. Reports idle and active memory
+# per region, CPU per message batch and LLM calls, plus token fan-out vs a single topic send.
+# The OpenAI stand-in runs in this process, so its request handling is part of the CPU figure.
+# Usage: python benchmarks/multi_region.py [--regions 25] [--batches 40] [--sweep 1,5,25]
+import argparse
+import os
+import subprocess
+import sys
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from openai import OpenAI
+from stubs import SAMPLE_TEXTS, FakeFcm, FakeOpenAIServer
+import app_logger
+from ai_worker import AiWorker
+from alert_monitor import AlertMonitor
+from config import parse_settings
+from message_bus import message_bus
+from push_fanout import PushFanout, PushTemplate
+from telegram import Message
+
+
+def batches(count, size):
+    for index in range(count):
+        now = datetime.now(timezone.utc)
+        yield [Message(id=index * size + i, author=f"channel{i}", text=f"{SAMPLE_TEXTS[(index + i) % len(SAMPLE_TEXTS)]} #{index}.{i}", date=now)
+               for i in range(size)]
+
+
+def rss():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def wait_idle(workers, openai_server, timeout=60):
+    deadline = time.monotonic() + timeout
+    last = -1
+    while time.monotonic() < deadline:
+        busy = any(worker.in_flight or worker.pending for worker in workers)
+        if not busy and openai_server.requests == last:
+            return
+        last = openai_server.requests
+        time.sleep(0.2)
+
+
+def run(args):
+    with FakeOpenAIServer(delay=args.llm_delay) as openai_server:
+        settings = parse_settings({
+            'openai_base_url': openai_server.base_url,
+            'analyzer_prompt': 'Classify threats for {region}',
+            'ai_gate_threshold': 0.0,
+            'regions_to_monitor': list(range(1, args.regions + 1)),
+        })
+        regions = {region.id: region for region in AlertMonitor(settings).regions}
+        region_list = [regions[region_id] for region_id in settings.regions_to_monitor]
+
+        before = rss()
+        threads_before = threading.active_count()
+        client = OpenAI(api_key='bench', base_url=settings.openai_base_url)
+        executor = ThreadPoolExecutor(max_workers=settings.ai_workers, thread_name_prefix='ai-worker')
+        workers = [AiWorker(settings, region=region, client=client, executor=executor) for region in region_list]
+        for worker in workers:
+            worker.start()
+        message_bus.start()
+        time.sleep(0.2)
+        idle = rss() - before
+
+        for region in region_list:
+            region.changed = datetime.now(timezone.utc)
+            message_bus.publish('alert', region)
+        cpu_started = time.process_time()
+        for batch in batches(args.batches, args.batch_size):
+            message_bus.publish('new_messages', batch)
+            time.sleep(args.interval)
+        wait_idle(workers, openai_server)
+        cpu = time.process_time() - cpu_started
+        active = rss() - before
+        history = sum(len(worker.prompt) for worker in workers)
+
+        print(f"{args.regions:>3} regions: idle {idle / 1024 / args.regions:7.1f} KiB/region, alerting {active / 1024 / args.regions:7.1f} KiB/region "
+              f"({history // args.regions} history messages each), cpu {cpu * 1000 / args.batches:6.2f} ms/batch "
+              f"({cpu * 1000 / args.batches / args.regions:5.2f} ms/batch/region), {openai_server.requests} LLM calls, "
+              f"+{threading.active_count() - threads_before} threads")
+
+
+def delivery(args):
+    template = PushTemplate(data={"alert": "True"}, notification=None, android=None)
+    tokens = [f"fcm-token-{i:08d}" for i in range(args.tokens)]
+    fcm = FakeFcm(latency=args.fcm_latency, jitter=0.0, unregistered_ratio=0.0, unavailable_ratio=0.0)
+    topic_calls = []
+
+    def send_message(message):
+        topic_calls.append(message.topic)
+        time.sleep(args.fcm_latency)
+        return 'projects/stub/messages/1'
+
+    fanout = PushFanout(send_multicast=fcm, send_message=send_message)
+    report = fanout.send(tokens, template)
+    print(f"token fan-out: {args.tokens} devices in {report.duration:.2f}s with {fcm.calls} FCM calls")
+    report = fanout.send_topic('region-14', template)
+    print(f"topic send:    1 FCM call in {report.duration:.2f}s regardless of subscriber count")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark per-region AiWorkers in one process')
+    parser.add_argument('--regions', type=int, default=25)
+    parser.add_argument('--batches', type=int, default=40)
+    parser.add_argument('--batch-size', type=int, default=5)
+    parser.add_argument('--interval', type=float, default=0.05, help='Seconds between message batches')
+    parser.add_argument('--llm-delay', type=float, default=0.05)
+    parser.add_argument('--tokens', type=int, default=20000)
+    parser.add_argument('--fcm-latency', type=float, default=0.1)
+    parser.add_argument('--sweep', type=str, help='Comma-separated region counts, each run in a fresh process')
+    args = parser.parse_args()
+    app_logger.set_log_level('WARNING')
+    logging.getLogger('ai_worker_persistent').setLevel(logging.WARNING)
+    os.environ.setdefault('OPENAI_API_KEY', 'bench')
+
+    if args.sweep:
+        for count in args.sweep.split(','):
+            command = [sys.executable, __file__, '--regions', count, '--batches', str(args.batches), '--batch-size', str(args.batch_size),
+                       '--interval', str(args.interval), '--llm-delay', str(args.llm_delay), '--tokens', '0']
+            subprocess.run(command, check=True)
+    else:
+        run(args)
+    if args.tokens:
+        delivery(args)
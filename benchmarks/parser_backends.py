@@ -0,0 +1,36 @@
+# Parse cost of the BeautifulSoup and streaming t.me page parsers on a recorded-style fixture.
+# Usage: python benchmarks/parser_backends.py [--fixture benchmarks/fixtures/channel.html] [--iterations 200]
+import argparse
+import os
+import time
+from stubs import render_channel_page, synthetic_posts
+import telegram
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'channel.html')
+STOP_LIST = ['Підписатися', 'Надіслати новину', '|']
+
+
+def measure(parser, content, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        parser(content, 'odesa_news', STOP_LIST)
+    return (time.perf_counter() - started) / iterations * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark t.me page parser backends')
+    parser.add_argument('--fixture', type=str, default=FIXTURE)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    pages = {
+        'fixture': open(args.fixture, 'rb').read(),
+        'synthetic-100': render_channel_page('odesa_news', synthetic_posts(100)).encode('utf-8'),
+    }
+    for name, content in pages.items():
+        expected = telegram.parse_messages_soup(content, 'odesa_news', STOP_LIST)
+        actual = telegram.parse_messages_stream(content, 'odesa_news', STOP_LIST)
+        assert expected == actual, f"Parser outputs differ on {name}"
+        soup = measure(telegram.parse_messages_soup, content, args.iterations)
+        stream = measure(telegram.parse_messages_stream, content, args.iterations)
+        print(f"{name:<14} {len(expected):>4} messages  soup {soup:7.3f} ms  stream {stream:7.3f} ms  x{soup / stream:.1f}")
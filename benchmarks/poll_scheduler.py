@@ -0,0 +1,123 @@
+# Simulated alert night: detection latency vs request volume for fixed-interval polling and the adaptive PollScheduler.
+# Runs on a fake clock against a model of t.me that answers 429 above a requests-per-minute limit.
+# Usage: python benchmarks/poll_scheduler.py [--channels 30] [--hours 2] [--tme-limit 240]
+import argparse
+import bisect
+import random
+from collections import deque
+import stubs  # noqa: F401 (puts src/ on sys.path)
+import app_logger
+from poll_scheduler import PollScheduler
+
+TICK = 0.1
+RETRY_AFTER = 30.0
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeTelegram:
+    # Serves post timestamps per channel and rate limits per sliding minute like t.me does per IP
+    def __init__(self, posts, limit_per_minute):
+        self.posts = posts
+        self.limit = limit_per_minute
+        self.window = deque()
+        self.requests = 0
+        self.rejected = 0
+
+    def poll(self, now, channel, seen_until):
+        self.requests += 1
+        while self.window and self.window[0] <= now - 60:
+            self.window.popleft()
+        if len(self.window) >= self.limit:
+            self.rejected += 1
+            return None
+        self.window.append(now)
+        timestamps = self.posts[channel]
+        return timestamps[bisect.bisect_right(timestamps, seen_until):bisect.bisect_right(timestamps, now)]
+
+
+def generate_posts(channels, duration, rng):
+    # A few hot channels, some that post now and then, most nearly dormant
+    posts = {}
+    for index in range(channels):
+        share = index / channels
+        mean_gap = 30 if share < 0.1 else 300 if share < 0.4 else 3600
+        timestamps, now = [], rng.expovariate(1 / mean_gap)
+        while now < duration:
+            timestamps.append(now)
+            now += rng.expovariate(1 / mean_gap)
+        posts[f"channel{index}"] = timestamps
+    return posts
+
+
+def summarize(name, latencies, telegram, duration):
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+    mean = sum(latencies) / len(latencies) if latencies else 0.0
+    print(f"{name:<24} requests/min {telegram.requests / duration * 60:7.1f}  429s {telegram.rejected:6}  "
+          f"latency avg {mean:6.1f}s  p95 {p95:6.1f}s  ({len(latencies)} posts)")
+
+
+def simulate_fixed(posts, duration, interval, limit):
+    # Current InfoMonitor: every channel on every sweep, errors just wait for the next sweep
+    telegram = FakeTelegram(posts, limit)
+    seen_until = dict.fromkeys(posts, 0.0)
+    latencies = []
+    now = 0.0
+    while now < duration:
+        for channel in posts:
+            new = telegram.poll(now, channel, seen_until[channel])
+            if new is None:
+                continue
+            latencies.extend(now - timestamp for timestamp in new)
+            seen_until[channel] = now
+        now += interval
+    return telegram, latencies
+
+
+def simulate_adaptive(posts, duration, interval, min_interval, max_interval, limit, rate, seed):
+    clock = FakeClock()
+    scheduler = PollScheduler(rate=rate, burst=rate * 2, clock=clock, rng=random.Random(seed))
+    for channel in posts:
+        scheduler.add(channel, interval, min_interval, max_interval)
+    telegram = FakeTelegram(posts, limit)
+    seen_until = dict.fromkeys(posts, 0.0)
+    latencies = []
+    names = list(posts)
+    while clock.now < duration:
+        for channel in scheduler.due(names):
+            new = telegram.poll(clock.now, channel, seen_until[channel])
+            if new is None:
+                scheduler.rate_limited(channel, RETRY_AFTER)
+                continue
+            latencies.extend(clock.now - timestamp for timestamp in new)
+            seen_until[channel] = clock.now
+            scheduler.record(channel, len(new))
+        clock.now += max(TICK, round(scheduler.next_wakeup(names) / TICK) * TICK)
+    return telegram, latencies
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate channel polling strategies')
+    parser.add_argument('--channels', type=int, default=30)
+    parser.add_argument('--hours', type=float, default=2)
+    parser.add_argument('--tme-limit', type=int, default=240, help='Requests per minute t.me accepts before answering 429')
+    parser.add_argument('--rate', type=float, default=3.0, help='Scheduler request budget, requests per second')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    app_logger.set_log_level('ERROR')
+
+    duration = args.hours * 3600
+    posts = generate_posts(args.channels, duration, random.Random(args.seed))
+    for interval in (2, 5, 10, 30):
+        telegram, latencies = simulate_fixed(posts, duration, interval, args.tme_limit)
+        summarize(f"fixed {interval}s", latencies, telegram, duration)
+    for min_interval, max_interval in ((1, 30), (2, 60), (5, 120)):
+        telegram, latencies = simulate_adaptive(posts, duration, 5, min_interval, max_interval, args.tme_limit, args.rate, args.seed)
+        summarize(f"adaptive {min_interval}-{max_interval}s", latencies, telegram, duration)
@@ -0,0 +1,117 @@
+# Replays AI requests recorded in the ai_worker_persistent log through the pre-classifier
+# and compares its gate/instant decisions with the LLM verdicts that were logged. An instant alert
+# the LLM did not confirm is a false alert pushed to every subscriber; known all-clear messages are
+# also scored on every run, since none of them may ever be instant.
+# Usage: python benchmarks/pre_classifier_eval.py /var/log/pyalerts/execution.log* [--gate 0.3] [--instant 0.85]
+import argparse
+import gzip
+import json
+import re
+import sys
+import time
+import stubs  # noqa: F401
+from config import parse_settings
+from pre_classifier import PreClassifier, parse_rules
+
+ENTRY_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3} - \w+ - (\S+) - ', re.MULTILINE)
+NEW_LINE_PATTERN = re.compile(r'^> NEW \d{2}:\d{2}:\d{2} [^:]+: (.*)$', re.MULTILINE)
+
+ALL_CLEAR_SAMPLES = [
+    "Відбій загрози балістичного озброєння",
+    "Відбій загрози застосування балістики",
+    "Відбій тривоги в Одеська область",
+    "Відміна загрози КАБ",
+    "Всі шахеди збито над областю",
+    "Ракету збито ППО",
+    "Усі БпЛА знешкоджено",
+    "Загрозу крилатих ракет скасовано",
+]
+
+
+def read_entries(paths):
+    # Handles text and JSON-lines logs, plain or gzipped after rotation
+    for path in paths:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8', errors='replace') as file:
+            content = file.read()
+        if content.startswith('{'):
+            for line in content.splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('logger') == 'ai_worker_persistent':
+                    yield entry.get('message', '').strip()
+            continue
+        matches = list(ENTRY_PATTERN.finditer(content))
+        for match, following in zip(matches, matches[1:] + [None]):
+            if match.group(1) == 'ai_worker_persistent':
+                yield content[match.end():following.start() if following else len(content)].strip()
+
+
+def read_requests(paths):
+    texts = None
+    for entry in read_entries(paths):
+        if entry.startswith('Sending messages to AI:'):
+            texts = NEW_LINE_PATTERN.findall(entry)
+        elif entry.startswith('AI response payload:') and texts is not None:
+            try:
+                verdict = json.loads(entry[len('AI response payload:'):])
+            except ValueError:
+                continue
+            yield texts, bool(verdict.get('alert'))
+            texts = None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evaluate the pre-classifier against logged LLM verdicts')
+    parser.add_argument('logs', nargs='+')
+    parser.add_argument('--settings', type=str, help='settings.yml with pre_classifier_rules and thresholds')
+    parser.add_argument('--gate', type=float)
+    parser.add_argument('--instant', type=float)
+    args = parser.parse_args()
+
+    config = {}
+    if args.settings:
+        import yaml
+        with open(args.settings) as file:
+            config = yaml.safe_load(file)
+    settings = parse_settings(config)
+    gate = args.gate if args.gate is not None else settings.ai_gate_threshold
+    instant = args.instant if args.instant is not None else settings.ai_instant_alert_threshold
+    classifier = PreClassifier(parse_rules(settings.pre_classifier_rules))
+
+    false_clear = [text for text in ALL_CLEAR_SAMPLES if instant is not None and classifier.score(text).value >= instant]
+    batches = api_calls = llm_alerts = missed = instant_alerts = instant_agreed = scored = 0
+    elapsed = 0.0
+    for texts, llm_alert in read_requests(args.logs):
+        if not texts:
+            continue
+        started = time.perf_counter()
+        scores = [classifier.score(text).value for text in texts]
+        elapsed += time.perf_counter() - started
+        scored += len(texts)
+        batches += 1
+        llm_alerts += llm_alert
+        rest = [score for score in scores if instant is None or score < instant]
+        is_instant = len(rest) < len(scores)
+        is_forwarded = bool(rest) and max(rest) >= gate
+        instant_alerts += is_instant
+        instant_agreed += is_instant and llm_alert
+        api_calls += is_forwarded
+        missed += llm_alert and not (is_forwarded or is_instant)
+
+    print(f"all-clear samples scored as instant alerts: {len(false_clear)}/{len(ALL_CLEAR_SAMPLES)}")
+    for text in false_clear:
+        print(f"  {classifier.score(text).value:.2f} {text}")
+    if not batches:
+        print("No AI requests found in the given logs")
+    else:
+        print(f"requests replayed      {batches}")
+        print(f"LLM alerts             {llm_alerts}")
+        print(f"API calls              {api_calls} ({(1 - api_calls / batches) * 100:.1f}% fewer)")
+        print(f"missed LLM alerts      {missed} (recall {(1 - missed / llm_alerts) * 100 if llm_alerts else 100:.1f}%)")
+        print(f"instant alerts         {instant_alerts} ({instant_agreed} confirmed by the LLM)")
+        print(f"false instant alerts   {instant_alerts - instant_agreed}")
+        print(f"classifier cost        {elapsed / scored * 1e6:.1f} us/message")
+    sys.exit(1 if false_clear else 0)
@@ -0,0 +1,121 @@
+# Prompt assembly per LLM call: the previous per-call rendering of every history message against
+# PromptBuilder, which renders each message once. Also reports prompt tokens per request and how many
+# of them repeat the previous request's prefix, which is what provider-side prompt caching can reuse.
+# Traffic is a replay scenario (JSON lines, see replay.py) or the replay's synthetic night.
+# Usage: python benchmarks/prompt_builder.py [--scenario night.jsonl] [--history-size 10] [--budget 1500]
+import argparse
+import random
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pytz import timezone
+from replay import load_scenario, synthetic_scenario
+from telegram import Message
+from prompt_builder import PromptBuilder, estimate_tokens
+
+SYSTEM_PROMPT = "Classify threats to Odesa oblast. " * 40
+
+
+class PerCallBuilder:
+    # The layout and rendering AiWorker used before PromptBuilder
+    def __init__(self, target_timezone, max_messages, token_budget):
+        self.target_timezone = target_timezone
+        self.max_messages = max_messages
+        self.token_budget = token_budget
+        self.history = deque()
+        self.tokens = 0
+
+    def append(self, messages):
+        for message in messages:
+            self.history.append(message)
+            self.tokens += estimate_tokens(message.text)
+        while self.history and (len(self.history) > self.max_messages or self.tokens > self.token_budget):
+            self.tokens -= estimate_tokens(self.history.popleft().text)
+
+    def build(self, history, messages):
+        system_messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        history_messages = [
+            {"role": "user", "content": f"> HISTORY {msg.date.astimezone(self.target_timezone).strftime('%H:%M:%S')} {msg.author}: {msg.text}"} for msg in history
+        ]
+        new_messages = [
+            {"role": "user", "content": f"> NEW {msg.date.astimezone(self.target_timezone).strftime('%H:%M:%S')} {msg.author}: {msg.text}"} for msg in messages
+        ]
+        request = system_messages + history_messages + new_messages + [
+            {"role": "assistant", "content": f"Local time: {datetime.utcnow().astimezone(self.target_timezone).isoformat()}"}
+        ]
+        return request, sum(estimate_tokens(message['content']) for message in request)
+
+
+def batches(events, rng):
+    start = datetime(2024, 3, 1, 20, 0, tzinfo=dt_timezone.utc)
+    messages = [Message(id=f"{event['channel']}/{index}", author=event['channel'], text=event['text'], date=start + timedelta(seconds=event['at']))
+                for index, event in enumerate(events)]
+    index = 0
+    while index < len(messages):
+        size = rng.randint(1, 3)
+        yield messages[index:index + size]
+        index += size
+
+
+def reused_tokens(previous, request):
+    reused = 0
+    for old, new in zip(previous, request):
+        if old['content'] != new['content']:
+            break
+        reused += estimate_tokens(new['content'])
+    return reused
+
+
+def run_per_call(traffic, target_timezone, args):
+    builder = PerCallBuilder(target_timezone, args.history_size, args.budget)
+    elapsed = tokens = reused = 0
+    previous = []
+    for messages in traffic:
+        started = time.perf_counter()
+        history = list(builder.history)
+        builder.append(messages)
+        request, count = builder.build(history, messages)
+        elapsed += time.perf_counter() - started
+        tokens += count
+        reused += reused_tokens(previous, request)
+        previous = request
+    return elapsed, tokens, reused
+
+
+def run_builder(traffic, target_timezone, args, trim_ratio):
+    builder = PromptBuilder(SYSTEM_PROMPT, target_timezone, args.history_size, args.budget, trim_ratio)
+    elapsed = tokens = reused = 0
+    for messages in traffic:
+        started = time.perf_counter()
+        history = builder.prefix()
+        entries = builder.append(messages)
+        prompt = builder.build(history, entries)
+        elapsed += time.perf_counter() - started
+        tokens += prompt.tokens
+        reused += prompt.reused_tokens
+    return elapsed, tokens, reused
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare per-call prompt rendering with PromptBuilder')
+    parser.add_argument('--scenario', type=str, help='JSON lines scenario; synthetic when omitted')
+    parser.add_argument('--duration', type=float, default=7200, help='Synthetic scenario length, seconds')
+    parser.add_argument('--history-size', type=int, default=10)
+    parser.add_argument('--budget', type=int, default=1500)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    if args.scenario:
+        events = load_scenario(args.scenario)
+    else:
+        events = synthetic_scenario('air_alert_ua', [f"channel{i}" for i in range(20)], args.duration, 60, 10, rng, reposts=4)
+    traffic = list(batches(events, rng))
+    target_timezone = timezone('Europe/Kyiv')
+    calls = len(traffic)
+
+    print(f"{calls} calls over {len(events)} messages, history {args.history_size} messages / {args.budget} tokens")
+    results = [("per-call render", run_per_call(traffic, target_timezone, args))]
+    results += [(f"builder trim {trim_ratio:g}", run_builder(traffic, target_timezone, args, trim_ratio)) for trim_ratio in (1.0, 0.75, 0.5)]
+    for name, (elapsed, tokens, reused) in results:
+        print(f"{name:<18} build {elapsed / calls * 1e6:6.1f} us/call, {tokens / calls:6.0f} prompt tokens/request, "
+              f"{reused / calls:6.0f} repeat the previous prefix ({reused / tokens * 100:4.1f}%), {(tokens - reused) / calls:5.0f} uncached")
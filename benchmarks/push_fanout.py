@@ -0,0 +1,54 @@
+# Push delivery time on the alert path: the serial 500-token batch loop vs the pipelined fan-out.
+# Usage: python benchmarks/push_fanout.py [--tokens 100000] [--latency 0.15] [--workers 8]
+import argparse
+import time
+from stubs import FakeFcm
+import app_logger
+from ai_worker import AiAlert
+from notifications_sender import NotificationsSender
+from push_fanout import PushFanout
+
+BATCH_SIZE = 500
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def legacy_send(tokens, alert, send_multicast):
+    # Mirrors the old send_push_notifications: one batch at a time, message rebuilt per batch, no retries
+    started = time.monotonic()
+    completions = []
+    for start in range(0, len(tokens), BATCH_SIZE):
+        send_multicast(NotificationsSender.build_template(alert).for_tokens(tokens[start:start + BATCH_SIZE]))
+        completions.append(time.monotonic() - started)
+    return completions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark FCM push fan-out')
+    parser.add_argument('--tokens', type=int, default=100000)
+    parser.add_argument('--latency', type=float, default=0.15, help='Simulated FCM batch round-trip, seconds')
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--unregistered-ratio', type=float, default=0.02)
+    parser.add_argument('--unavailable-ratio', type=float, default=0.01)
+    args = parser.parse_args()
+    app_logger.set_log_level('WARNING')
+
+    tokens = [f"fcm-token-{i:08d}" for i in range(args.tokens)]
+    alert = AiAlert(alert=True, attacker='DRONE', text='Група ударних БпЛА курсом на Одесу', confidence=0.9, original_text='')
+
+    fcm = FakeFcm(args.latency, args.jitter, args.unregistered_ratio, args.unavailable_ratio)
+    completions = legacy_send(tokens, alert, fcm)
+    print(f"serial     total {completions[-1]:7.2f}s  p50 {percentile(completions, 0.5):7.2f}s  "
+          f"p99 {percentile(completions, 0.99):7.2f}s  ({fcm.calls} calls, transient failures dropped)")
+
+    fcm = FakeFcm(args.latency, args.jitter, args.unregistered_ratio, args.unavailable_ratio)
+    fanout = PushFanout(max_workers=args.workers, backoff=0.05, send_multicast=fcm)
+    report = fanout.send(tokens, NotificationsSender.build_template(alert))
+    print(f"fan-out    total {report.duration:7.2f}s  p50 {report.percentile(0.5):7.2f}s  "
+          f"p99 {report.percentile(0.99):7.2f}s  ({fcm.calls} calls, {report.retried} retried)")
+    print(f"delivered {report.delivered}/{report.tokens}, failed {report.failed}, "
+          f"{len(report.invalid_tokens)} unregistered tokens queued for pruning")
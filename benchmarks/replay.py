@@ -0,0 +1,260 @@
+# End-to-end replay of an alert night: AlertMonitor -> InfoMonitor -> AiWorker -> AlertCoalescer -> NotificationsSender
+# against local t.me, OpenAI, Firestore and FCM stand-ins. Scenario times are compressed by --speedup,
+# polling intervals with them; LLM and FCM latencies are real time.
+# Scenario files are JSON lines: {"at": 12.5, "channel": "kpszsu", "text": "..."}; posts to --alert-channel
+# drive AlertMonitor. Without --scenario a synthetic night is generated, where each threat is reposted by
+# --reposts channels within --repost-spread seconds as news channels do. --coalesce-window 0 pushes every AI alert.
+# Usage: python benchmarks/replay.py [--scenario night.jsonl] [--speedup 20] [--duration 1800] [--tokens 20000]
+#        [--reposts 4] [--coalesce-window 120]
+import argparse
+import json
+import logging
+import os
+import random
+import resource
+import threading
+import time
+from stubs import THREAT_WORDS, FakeFcm, FakeFirestore, FakeOpenAIServer, TelegramStubServer, populate_tokens
+import app_logger
+import telegram
+from ai_worker import AiWorker
+from alert_coalescer import AlertCoalescer
+from alert_monitor import AlertMonitor
+from config import parse_settings
+from info_monitor import InfoMonitor
+from message_bus import message_bus
+from notifications_sender import NotificationsSender
+from poll_scheduler import poll_scheduler
+
+BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60, float('inf')]
+REGION = "Одеська область"
+THREAT_TEMPLATES = [
+    "Група ударних БпЛА рухається курсом на {place}",
+    "Загроза застосування шахедів, {place}",
+    "Пуски крилатих ракет, напрямок {place}",
+    "Швидкісна ціль на {place}",
+]
+NOISE_TEMPLATES = [
+    "Курс валют на сьогодні, {place}",
+    "Прогноз погоди на вихідні: {place} без опадів",
+    "Новини дня: {place}",
+    "Оновлення графіків відключень світла, {place}",
+]
+PLACES = ["Одесу", "Ізмаїл", "Чорноморськ", "Білгород-Дністровський", "Южне", "Миколаїв", "Подільськ", "Болград"]
+
+
+def synthetic_scenario(alert_channel, channels, duration, threat_every, noise_every, rng, reposts=1, repost_spread=30.0):
+    events = [{"at": 5.0, "channel": alert_channel, "text": f"Повітряна тривога в {REGION}"}]
+    for templates, mean_gap, copies in ((THREAT_TEMPLATES, threat_every, reposts), (NOISE_TEMPLATES, noise_every, 1)):
+        at = 10.0 + rng.expovariate(1 / mean_gap)
+        while at < duration - 20:
+            text = rng.choice(templates).format(place=rng.choice(PLACES))
+            for copy, channel in enumerate(rng.sample(channels, min(copies, len(channels)))):
+                events.append({"at": at + (rng.uniform(0, repost_spread) if copy else 0.0), "channel": channel, "text": text})
+            at += rng.expovariate(1 / mean_gap)
+    events.append({"at": duration - 10, "channel": alert_channel, "text": f"Відбій тривоги в {REGION}"})
+    return sorted(events, key=lambda event: event["at"])
+
+
+def load_scenario(path):
+    with open(path, encoding='utf-8') as file:
+        return sorted((json.loads(line) for line in file if line.strip()), key=lambda event: event["at"])
+
+
+class Probe:
+    # Timestamps every stage; one subscriber object so events are seen in publish order
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.posted = {}
+        self.alert_posts = []
+        self.alert_events = []
+        self.ingested = {}
+        self.ai_alerts = []
+        self.push_alerts = []
+        self.pushes = {}
+        self.messages_ingested = 0
+
+    def post(self, marker, kind):
+        with self.lock:
+            self.posted[marker] = (time.monotonic(), kind)
+            if kind == "alert":
+                self.alert_posts.append(marker)
+
+    def on_alert(self, region):
+        with self.lock:
+            self.alert_events.append(time.monotonic())
+
+    def on_new_messages(self, messages):
+        now = time.monotonic()
+        with self.lock:
+            self.messages_ingested += len(messages)
+            for message in messages:
+                marker = message.text.split(']', 1)[0].lstrip('[')
+                self.ingested.setdefault(marker, now)
+
+    def on_ai_alert(self, alert):
+        with self.lock:
+            self.ai_alerts.append((time.monotonic(), alert))
+
+    def on_push_alert(self, alert):
+        with self.lock:
+            self.push_alerts.append(alert)
+
+    def on_push(self, alert, started, report):
+        with self.lock:
+            self.pushes[id(alert)] = (started, time.monotonic(), report)
+
+
+class ReplaySender(NotificationsSender):
+    def __init__(self, settings, db, probe):
+        super().__init__(settings, db=db)
+        self.probe = probe
+
+    def send_push_notifications(self, tokens, alert):
+        started = time.monotonic()
+        report = super().send_push_notifications(tokens, alert)
+        self.probe.on_push(alert, started, report)
+        return report
+
+
+def stage_latencies(probe):
+    stages = {name: [] for name in ("alert detection", "channel ingest", "ai verdict", "push fan-out", "post to push")}
+    for posted_marker, event_time in zip(probe.alert_posts, probe.alert_events):
+        stages["alert detection"].append(event_time - probe.posted[posted_marker][0])
+    for marker, (posted, kind) in probe.posted.items():
+        ingested = probe.ingested.get(marker)
+        if ingested is None or kind == "alert":
+            continue
+        stages["channel ingest"].append(ingested - posted)
+        if kind != "threat":
+            continue
+        verdict = next(((at, alert) for at, alert in probe.ai_alerts if at >= ingested), None)
+        if verdict is None:
+            continue
+        stages["ai verdict"].append(verdict[0] - ingested)
+        push = probe.pushes.get(id(verdict[1]))
+        if push is not None:
+            stages["push fan-out"].append(push[1] - verdict[0])
+            stages["post to push"].append(push[1] - posted)
+    return stages
+
+
+def print_histogram(name, values):
+    if not values:
+        print(f"{name:<16} no samples")
+        return
+    values = sorted(values)
+
+    def percentile(fraction):
+        return values[min(len(values) - 1, int(len(values) * fraction))]
+
+    print(f"{name:<16} n={len(values):<5} p50 {percentile(0.5):7.2f}s  p95 {percentile(0.95):7.2f}s  p99 {percentile(0.99):7.2f}s  max {values[-1]:7.2f}s")
+    lower = 0.0
+    for upper in BUCKETS:
+        count = sum(1 for value in values if lower <= value < upper)
+        if count:
+            label = f"< {upper:g}s" if upper != float('inf') else f">= {lower:g}s"
+            print(f"{'':18}{label:>9} {count:6} {'#' * max(1, round(40 * count / len(values)))}")
+        lower = upper
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay an alert night through the whole pipeline')
+    parser.add_argument('--scenario', type=str, help='JSON lines scenario; synthetic when omitted')
+    parser.add_argument('--speedup', type=float, default=20)
+    parser.add_argument('--duration', type=float, default=1800, help='Synthetic scenario length, scenario seconds')
+    parser.add_argument('--channels', type=int, default=20)
+    parser.add_argument('--threat-every', type=float, default=60, help='Mean gap between threat posts, scenario seconds')
+    parser.add_argument('--noise-every', type=float, default=10, help='Mean gap between unrelated posts, scenario seconds')
+    parser.add_argument('--alert-channel', type=str, default='air_alert_ua')
+    parser.add_argument('--llm-delay', type=float, default=0.8)
+    parser.add_argument('--tokens', type=int, default=20000)
+    parser.add_argument('--fcm-latency', type=float, default=0.1)
+    parser.add_argument('--fcm-unavailable', type=float, default=0.002, help='Share of tokens failing with a transient error')
+    parser.add_argument('--reposts', type=int, default=4, help='Channels reposting each synthetic threat')
+    parser.add_argument('--repost-spread', type=float, default=30, help='Reposts follow within this many scenario seconds')
+    parser.add_argument('--coalesce-window', type=float, default=120, help='Scenario seconds; 0 disables coalescing')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    app_logger.set_log_level('WARNING')
+    logging.getLogger('ai_worker_persistent').setLevel(logging.WARNING)
+    os.environ.setdefault('OPENAI_API_KEY', 'replay')
+
+    channels = [f"channel{i}" for i in range(args.channels)]
+    if args.scenario:
+        events = load_scenario(args.scenario)
+        channels = sorted({event["channel"] for event in events if event["channel"] != args.alert_channel})
+    else:
+        events = synthetic_scenario(args.alert_channel, channels, args.duration, args.threat_every, args.noise_every, random.Random(args.seed),
+                                    args.reposts, args.repost_spread)
+
+    with TelegramStubServer(posts_per_channel=0) as stub, FakeOpenAIServer(delay=args.llm_delay) as openai_server:
+        scaled = 1 / args.speedup
+        settings = parse_settings({
+            'alert_channel': args.alert_channel,
+            'alert_polling_interval': 5 * scaled,
+            'alert_min_polling_interval': 2 * scaled,
+            'alert_backoff_polling_interval': 60 * scaled,
+            'info_channels': channels,
+            'info_polling_interval': 5 * scaled,
+            'info_min_polling_interval': 2 * scaled,
+            'info_max_polling_interval': 60 * scaled,
+            'telegram_base_url': stub.base_url,
+            'openai_base_url': openai_server.base_url,
+            'analyzer_prompt': 'Classify threats',
+            'alert_coalesce_window': args.coalesce_window * scaled,
+        })
+        telegram.set_base_url(settings.telegram_base_url)
+        poll_scheduler.configure(settings.telegram_rate_limit * args.speedup, settings.telegram_rate_burst, settings.poll_jitter)
+
+        db = FakeFirestore()
+        populate_tokens(db, args.tokens, expired_ratio=0.0)
+        fcm = FakeFcm(latency=args.fcm_latency, jitter=args.fcm_latency / 2, unavailable_ratio=args.fcm_unavailable)
+        probe = Probe()
+        alert_monitor = AlertMonitor(settings)
+        info_monitor = InfoMonitor(settings)
+        ai_worker = AiWorker(settings)
+        coalescer = AlertCoalescer(settings)
+        sender = ReplaySender(settings, db, probe)
+        sender.fanout.send_multicast = fcm
+
+        message_bus.subscribe('alert', probe.on_alert)
+        message_bus.subscribe('new_messages', probe.on_new_messages)
+        message_bus.subscribe('ai_alert', probe.on_ai_alert)
+        message_bus.subscribe('push_alert', probe.on_push_alert)
+        message_bus.start()
+        alert_monitor.start()
+        info_monitor.start()
+        ai_worker.start()
+        coalescer.start()
+        sender.start()
+        sender.registry.loaded.wait()
+
+        cpu_started = time.process_time()
+        started = time.monotonic()
+        for index, event in enumerate(events):
+            delay = started + event["at"] * scaled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            kind = "alert" if event["channel"] == args.alert_channel else "threat" if any(word in event["text"] for word in THREAT_WORDS) else "noise"
+            marker = str(index)
+            probe.post(marker, kind)
+            stub.add_post(event["channel"], f"[{marker}] {event['text']}")
+        drain_deadline = time.monotonic() + max(5.0, args.llm_delay * 4) + 60
+        time.sleep(max(5.0, args.llm_delay * 4))
+        while len(probe.pushes) < len(probe.push_alerts) and time.monotonic() < drain_deadline:
+            time.sleep(0.1)
+        elapsed = time.monotonic() - started
+        cpu = time.process_time() - cpu_started
+
+        print(f"scenario: {len(events)} posts over {events[-1]['at']:.0f}s replayed in {elapsed:.1f}s (x{args.speedup:g}), "
+              f"{len(channels)} channels, {args.tokens} devices")
+        for name, values in stage_latencies(probe).items():
+            print_histogram(name, values)
+        delivered = sum(push[2].delivered for push in probe.pushes.values())
+        print(f"throughput: {stub.requests / elapsed:.1f} t.me requests/s, {probe.messages_ingested / elapsed:.1f} messages/s ingested, "
+              f"{openai_server.requests} LLM calls, {len(probe.pushes)} pushes, {delivered / elapsed:.0f} notifications/s")
+        print(f"push volume: {len(probe.pushes)} pushes for {len(probe.ai_alerts)} AI alerts "
+              f"({len(probe.ai_alerts) - len(probe.push_alerts)} coalesced, window {args.coalesce_window:g}s), {fcm.calls} FCM calls")
+        print(f"cpu {cpu:.2f}s ({cpu / elapsed * 100:.1f}% of one core), max rss {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+        print(f"fetch stats: {telegram.fetch_stats}")
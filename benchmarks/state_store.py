@@ -0,0 +1,69 @@
+# Restart cost and write-path overhead of the SQLite state snapshot: how long load() takes for a
+# realistic alert night, what a put_* costs the caller, and what one batched flush costs the writer.
+# Usage: python benchmarks/state_store.py [--regions 25] [--channels 50] [--history 30] [--sent 1000] [--updates 2000]
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from stubs import SAMPLE_TEXTS
+from state_store import StateStore
+from telegram import Message
+
+
+def history(count, offset=0):
+    now = datetime.now(timezone.utc)
+    return [Message(id=offset + i, author=f"channel{i % 7}", text=SAMPLE_TEXTS[(offset + i) % len(SAMPLE_TEXTS)],
+                    date=now - timedelta(seconds=count - i)) for i in range(count)]
+
+
+def populate(store, args):
+    now = datetime.now(timezone.utc)
+    for region_id in range(args.regions):
+        store.put_region(region_id, region_id % 3 == 0, now)
+    for index in range(args.channels):
+        store.put_cursor(f"info:channel{index}", 100000 + index)
+    store.put_cursor('alert:air_alert_ua', 500000)
+    store.put_history('default', history(args.history))
+    sent_at = time.time()
+    for index in range(args.sent):
+        store.put_sent_alert(f"{index:032x}", sent_at - index)
+    store.put_value('info_monitor', {'alert_region_ids': [0, 3, 6], 'newer_than': now.isoformat()})
+    store.flush()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the state snapshot store')
+    parser.add_argument('--regions', type=int, default=25)
+    parser.add_argument('--channels', type=int, default=50)
+    parser.add_argument('--history', type=int, default=30)
+    parser.add_argument('--sent', type=int, default=1000)
+    parser.add_argument('--updates', type=int, default=2000, help='put_* calls between two flushes')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'state.db')
+        populate(StateStore(path), args)
+
+        loads = []
+        for _ in range(20):
+            started = time.perf_counter()
+            state = StateStore(path).load()
+            loads.append(time.perf_counter() - started)
+        loads.sort()
+        print(f"open + load: p50 {loads[len(loads) // 2] * 1000:.2f} ms  max {loads[-1] * 1000:.2f} ms  "
+              f"({len(state.regions)} regions, {len(state.cursors)} cursors, "
+              f"{sum(len(messages) for messages in state.ai_history.values())} history messages, {len(state.sent_alerts)} sent alerts)")
+
+        store = StateStore(path)
+        messages = history(args.history)
+        started = time.perf_counter()
+        for index in range(args.updates):
+            store.put_cursor(f"info:channel{index % args.channels}", 200000 + index)
+            store.put_history('default', messages[index % len(messages):] + messages[:index % len(messages)])
+        put = (time.perf_counter() - started) / (args.updates * 2)
+        started = time.perf_counter()
+        store.flush()
+        flush = time.perf_counter() - started
+        print(f"caller put: {put * 1e6:.2f} us per call; one batched flush of {args.updates * 2} updates: {flush * 1000:.2f} ms")
+        print(f"database size {sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)) / 1024:.0f} KiB")
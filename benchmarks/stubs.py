@@ -0,0 +1,588 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+PAGE_SIZE = 20
+
+SAMPLE_TEXTS = [
+    "Повітряна тривога в Одеська область",
+    "Відбій тривоги в Одеська область",
+    "Група ударних БпЛА рухається курсом на Одесу",
+    "Курс валют на сьогодні: долар подешевшав",
+    "Моніторинг: пуски крилатих ракет з акваторії Чорного моря",
+    "Прогноз погоди на вихідні: без опадів",
+]
+
+
+def render_post(channel_name, post_id, text, date):
+    return f"""
+<div class="tgme_widget_message_wrap js-widget_message_wrap">
+  <div class="tgme_widget_message text_not_supported_wrap js-widget_message" data-post="{channel_name}/{post_id}" data-view="eyJjIjotMTAwMTIzNDU2Nzg5MH0">
+    <div class="tgme_widget_message_user"><a href="https://t.me/{channel_name}"><i class="tgme_widget_message_user_photo bgcolor2" style="background-color:#FF8A80" data-content="{channel_name[:1].upper()}"><img src="https://cdn4.cdn-telegram.org/file/avatar.jpg"></i></a></div>
+    <div class="tgme_widget_message_bubble">
+      <i class="tgme_widget_message_bubble_tail"><svg class="bubble_icon" width="11px" height="20px" viewBox="0 0 11 20"><g fill="none"><path class="background" fill="#ffffff" d="M11,0 L11,20 L0,20 C5,20 11,15 11,0 Z"></path></g></svg></i>
+      <div class="tgme_widget_message_author accent_color"><a class="tgme_widget_message_owner_name" href="https://t.me/{channel_name}"><span dir="auto">{escape(channel_name)}</span></a></div>
+      <div class="tgme_widget_message_text js-message_text" dir="auto"><b>{escape(text)}</b><br/>{escape(text)} &#33; <a href="https://t.me/{channel_name}">Підписатися</a></div>
+      <div class="tgme_widget_message_footer compact js-message_footer">
+        <div class="tgme_widget_message_info short js-message_info">
+          <span class="tgme_widget_message_views">12.{post_id % 10}K</span><span class="copyonly">&nbsp;views</span>
+          <span class="tgme_widget_message_meta"><a class="tgme_widget_message_date" href="https://t.me/{channel_name}/{post_id}"><time datetime="{date.isoformat()}" class="time">{date.strftime('%H:%M')}</time></a></span>
+        </div>
+      </div>
+    </div>
+  </div>
+</div>"""
+
+
+def render_channel_page(channel_name, posts):
+    body = ''.join(render_post(channel_name, post_id, text, date) for post_id, text, date in posts)
+    return f"""<!DOCTYPE html>
+<html>
+  <head>
+    <meta charset="utf-8">
+    <title>{escape(channel_name)} – Telegram</title>
+    <script>var TWidgetAuth = {{"api_url":"https://t.me/api?hash=abc"}};</script>
+    <style>.tgme_widget_message {{ margin: 0; }}</style>
+  </head>
+  <body class="widget_frame_base tgme_webpreview_body">
+    <main class="tgme_main"><section class="tgme_channel_history js-message_history">{body}
+    </section></main>
+  </body>
+</html>"""
+
+
+def synthetic_posts(count=20, first_id=1000, start=None, interval=timedelta(minutes=1)):
+    start = start or datetime(2024, 3, 1, 20, 0, tzinfo=timezone.utc)
+    return [
+        (first_id + i, SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)], start + interval * i)
+        for i in range(count)
+    ]
+
+
+class TelegramStubServer:
+    def __init__(self, delay=0.0, posts_per_channel=20, etags=True, fail_ratio=0.0, seed=1):
+        import random
+        self.delay = delay
+        # Share of requests answered with a 502, per channel overrides in fail_ratios
+        self.fail_ratio = fail_ratio
+        self.fail_ratios = {}
+        self.random = random.Random(seed)
+        self.posts_per_channel = posts_per_channel
+        self.etags = etags
+        self.posts = {}
+        self.pages = {}
+        self.requests = 0
+        self.channel_requests = {}
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def channel_posts(self, channel_name):
+        with self.lock:
+            if channel_name not in self.posts:
+                self.posts[channel_name] = synthetic_posts(self.posts_per_channel)
+            return self.posts[channel_name]
+
+    def add_post(self, channel_name, text, date=None):
+        posts = self.channel_posts(channel_name)
+        with self.lock:
+            post_id = posts[-1][0] + 1 if posts else 1
+            posts.append((post_id, text, date or datetime.now(timezone.utc)))
+            return post_id
+
+    def page(self, channel_name, after=None, before=None):
+        posts = self.channel_posts(channel_name)
+        key = (channel_name, after, before, len(posts))
+        if key not in self.pages:
+            if after is not None:
+                selected = [post for post in posts if post[0] > after][:PAGE_SIZE]
+            elif before is not None:
+                selected = [post for post in posts if post[0] < before][-PAGE_SIZE:]
+            else:
+                selected = posts[-PAGE_SIZE:]
+            self.pages[key] = render_channel_page(channel_name, selected).encode('utf-8')
+        return self.pages[key]
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                stub.requests += 1
+                if stub.delay:
+                    time.sleep(stub.delay)
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                channel_name = url.path.rstrip('/').split('/')[-1]
+                stub.channel_requests[channel_name] = stub.channel_requests.get(channel_name, 0) + 1
+                if stub.random.random() < stub.fail_ratios.get(channel_name, stub.fail_ratio):
+                    self.send_response(502)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                after = int(query['after'][0]) if 'after' in query else None
+                before = int(query['before'][0]) if 'before' in query else None
+                body = stub.page(channel_name, after=after, before=before)
+                etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+                if stub.etags and self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                if stub.etags:
+                    self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+                stub.bytes_sent += len(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+
+class WebhookStubServer:
+    # Partner endpoint stand-in. behaviours maps a path to {"delay": s, "status": code, "fail_first": n};
+    # every request is recorded with its arrival time, and new TCP connections are counted
+    def __init__(self, behaviours=None):
+        self.behaviours = behaviours or {}
+        self.received = []
+        self.connections = 0
+        self.attempts = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server.server_address[1]}{path}"
+
+    def requests_for(self, path):
+        with self.lock:
+            return [request for request in self.received if request["path"] == path]
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with stub.lock:
+                    stub.connections += 1
+
+            def handle_request(self):
+                url = urlparse(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                behaviour = stub.behaviours.get(url.path, {})
+                with stub.lock:
+                    attempt = stub.attempts[url.path] = stub.attempts.get(url.path, 0) + 1
+                if behaviour.get("delay"):
+                    time.sleep(behaviour["delay"])
+                status = behaviour.get("status", 200)
+                if attempt <= behaviour.get("fail_first", 0):
+                    status = 503
+                if status < 400:
+                    with stub.lock:
+                        stub.received.append({"path": url.path, "method": self.command, "query": parse_qs(url.query), "json": body, "at": time.monotonic()})
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            do_GET = do_POST = do_PUT = handle_request
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class AlertApiStubServer:
+    # JSON alert API stand-in: GET / returns every region's state with ETag support
+    def __init__(self, region_ids=range(1, 26), fail_ratio=0.0, seed=1):
+        import random
+        self.states = {region_id: (False, None) for region_id in region_ids}
+        self.fail_ratio = fail_ratio
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/alerts"
+
+    def set_state(self, region_id, alert, changed=None):
+        with self.lock:
+            self.states[region_id] = (alert, changed or datetime.now(timezone.utc))
+
+    def body(self):
+        with self.lock:
+            items = [{"region_id": region_id, "alert": alert, "changed": changed.isoformat() if changed else None}
+                     for region_id, (alert, changed) in sorted(self.states.items())]
+        return json.dumps({"regions": items}).encode('utf-8')
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                stub.requests += 1
+                if stub.random.random() < stub.fail_ratio:
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = stub.body()
+                etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+THREAT_WORDS = ['БпЛА', 'ракет', 'шахед', 'Швидкісна ціль']
+
+
+class FakeOpenAIServer:
+    # delay is the time to the first token, token_delay the generation time per ~4 characters.
+    # A spike_ratio share of requests waits spike_delay instead of delay, and a fail_ratio
+    # share is answered with a 500.
+    def __init__(self, delay=1.0, token_delay=0.0, spike_ratio=0.0, spike_delay=10.0, fail_ratio=0.0, seed=1):
+        import random
+        self.delay = delay
+        self.token_delay = token_delay
+        self.spike_ratio = spike_ratio
+        self.spike_delay = spike_delay
+        self.fail_ratio = fail_ratio
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.spikes = 0
+        self.failures = 0
+        self.prompt_chars = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def verdict(self, messages):
+        new_lines = [line for message in messages if message['role'] == 'user' for line in message['content'].splitlines() if line.startswith('> NEW')]
+        trigger = next((line for line in new_lines if any(word in line for word in THREAT_WORDS)), None)
+        if trigger:
+            return {"alert": True, "attacker": "DRONE" if 'БпЛА' in trigger or 'шахед' in trigger else "MISSILE", "risk": 0.9, "trigger": trigger}
+        return {"alert": False, "attacker": "UNKNOWN", "risk": 0.1, "trigger": ""}
+
+    def tokens(self, request):
+        content = json.dumps(self.verdict(request['messages']), ensure_ascii=False)
+        return [content[i:i + 4] for i in range(0, len(content), 4)]
+
+    def chunk(self, request, delta, finish_reason=None):
+        return {
+            "id": f"chatcmpl-{self.requests}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get('model', 'gpt-3.5-turbo'),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    def completion(self, request):
+        verdict = self.verdict(request['messages'])
+        return {
+            "id": f"chatcmpl-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get('model', 'gpt-3.5-turbo'),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": json.dumps(verdict, ensure_ascii=False)}}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 30, "total_tokens": 130},
+        }
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                stub.requests += 1
+                request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                stub.prompt_chars.append(sum(len(message['content']) for message in request['messages']))
+                draw = stub.random.random()
+                if draw < stub.fail_ratio:
+                    stub.failures += 1
+                    body = json.dumps({"error": {"message": "Injected failure", "type": "server_error"}}).encode('utf-8')
+                    self.send_response(500)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                if draw < stub.fail_ratio + stub.spike_ratio:
+                    stub.spikes += 1
+                    time.sleep(stub.spike_delay)
+                elif stub.delay:
+                    time.sleep(stub.delay)
+                if request.get('stream'):
+                    self.stream(request)
+                    return
+                time.sleep(stub.token_delay * len(stub.tokens(request)))
+                body = json.dumps(stub.completion(request)).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def stream(self, request):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                events = [stub.chunk(request, {"role": "assistant", "content": ""})]
+                events += [stub.chunk(request, {"content": token}) for token in stub.tokens(request)]
+                events += [stub.chunk(request, {}, finish_reason="stop")]
+                try:
+                    for index, event in enumerate(events):
+                        if index > 1 and stub.token_delay:
+                            time.sleep(stub.token_delay)
+                        self.write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8'))
+                    self.write_chunk(b"data: [DONE]\n\n")
+                    self.write_chunk(b"")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client closed a cancelled stream
+                    self.close_connection = True
+
+            def write_chunk(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeChangeType(Enum):
+    ADDED = 1
+    MODIFIED = 2
+    REMOVED = 3
+
+
+@dataclass
+class FakeDocumentChange:
+    type: FakeChangeType
+    document: 'FakeDocument'
+
+
+class FakeDocumentReference:
+    def __init__(self, collection, doc_id):
+        self.collection = collection
+        self.id = doc_id
+
+    def delete(self):
+        time.sleep(self.collection.rpc_latency)
+        self.collection.remove([self.id])
+
+    def set(self, data):
+        self.collection.put(self.id, data)
+
+
+class FakeDocument:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.data = data
+
+    def to_dict(self):
+        return dict(self.data)
+
+
+class FakeWatch:
+    def __init__(self, collection, callback):
+        self.collection = collection
+        self.callback = callback
+
+    def unsubscribe(self):
+        self.collection.watches.remove(self)
+
+
+class FakeCollection:
+    def __init__(self, rpc_latency):
+        self.rpc_latency = rpc_latency
+        self.documents = {}
+        self.watches = []
+        self.lock = threading.Lock()
+
+    def document(self, doc_id):
+        return FakeDocumentReference(self, doc_id)
+
+    def get(self):
+        time.sleep(self.rpc_latency)
+        with self.lock:
+            return [FakeDocument(self.document(doc_id), data) for doc_id, data in self.documents.items()]
+
+    def _notify(self, changes):
+        for watch in list(self.watches):
+            watch.callback(None, changes, datetime.now(timezone.utc))
+
+    def put(self, doc_id, data):
+        with self.lock:
+            change_type = FakeChangeType.MODIFIED if doc_id in self.documents else FakeChangeType.ADDED
+            self.documents[doc_id] = data
+        self._notify([FakeDocumentChange(change_type, FakeDocument(self.document(doc_id), data))])
+
+    def remove(self, doc_ids):
+        with self.lock:
+            removed = [FakeDocument(self.document(doc_id), self.documents.pop(doc_id)) for doc_id in doc_ids if doc_id in self.documents]
+        self._notify([FakeDocumentChange(FakeChangeType.REMOVED, document) for document in removed])
+
+    def on_snapshot(self, callback):
+        watch = FakeWatch(self, callback)
+        documents = self.get()
+        self.watches.append(watch)
+        threading.Thread(target=callback, args=(documents, [FakeDocumentChange(FakeChangeType.ADDED, document) for document in documents], datetime.now(timezone.utc)), daemon=True).start()
+        return watch
+
+
+class FakeBatch:
+    def __init__(self, firestore):
+        self.firestore = firestore
+        self.deletes = []
+
+    def delete(self, reference):
+        self.deletes.append(reference)
+
+    def commit(self):
+        time.sleep(self.firestore.rpc_latency)
+        for collection in {id(reference.collection): reference.collection for reference in self.deletes}.values():
+            collection.remove([reference.id for reference in self.deletes if reference.collection is collection])
+        self.firestore.batch_commits += 1
+
+
+class FakeFirestore:
+    # In-memory stand-in for the parts of the Firestore client the sender uses
+    def __init__(self, rpc_latency=0.0):
+        self.rpc_latency = rpc_latency
+        self.collections = {}
+        self.batch_commits = 0
+
+    def collection(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(self.rpc_latency)
+        return self.collections[name]
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+def populate_tokens(firestore, count, expired_ratio=0.05, collection='fcm_tokens'):
+    now_ms = int(time.time() * 1000)
+    expired_ms = now_ms - 70 * 24 * 3600 * 1000
+    fcm_tokens = firestore.collection(collection)
+    for i in range(count):
+        fcm_tokens.documents[f"device{i}"] = {
+            "timestamp": expired_ms if i < count * expired_ratio else now_ms,
+            "token": f"fcm-token-{i:08d}-" + "x" * 120,
+            "uid": f"user{i}",
+        }
+
+
+class FakeFcm:
+    # Drop-in for messaging.send_multicast: per-call latency plus per-token failures
+    def __init__(self, latency=0.15, jitter=0.1, unregistered_ratio=0.02, unavailable_ratio=0.01, seed=1):
+        import random
+        self.latency = latency
+        self.jitter = jitter
+        self.unregistered_ratio = unregistered_ratio
+        self.unavailable_ratio = unavailable_ratio
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def __call__(self, multicast_message, dry_run=False, app=None):
+        from firebase_admin import exceptions, messaging
+        with self.lock:
+            self.calls += 1
+            delay = self.latency + self.random.random() * self.jitter
+            draws = [self.random.random() for _ in multicast_message.tokens]
+        time.sleep(delay)
+        responses = []
+        for draw in draws:
+            if draw < self.unregistered_ratio:
+                responses.append(messaging.SendResponse(None, messaging.UnregisteredError('Requested entity was not found.')))
+            elif draw < self.unregistered_ratio + self.unavailable_ratio:
+                responses.append(messaging.SendResponse(None, exceptions.UnavailableError('The service is currently unavailable.')))
+            else:
+                responses.append(messaging.SendResponse({'name': 'projects/stub/messages/1'}, None))
+        return messaging.BatchResponse(responses)
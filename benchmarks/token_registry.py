@@ -0,0 +1,57 @@
+# Token lookup latency on the alert path: full Firestore read per alert vs the resident registry.
+# Usage: python benchmarks/token_registry.py [--tokens 100000] [--rpc-latency 0.05]
+import argparse
+import time
+from datetime import datetime, timedelta
+from stubs import FakeFirestore, populate_tokens
+import app_logger
+from token_registry import FcmTokenRecord, TokenRegistry
+
+TOKEN_DEADLINE = timedelta(weeks=8)
+
+
+def legacy_fetch(db):
+    tokens = []
+    for doc in db.collection('fcm_tokens').get():
+        record = FcmTokenRecord.from_dict(doc.to_dict())
+        if datetime.utcnow() - record.timestamp > TOKEN_DEADLINE:
+            doc.reference.delete()
+        else:
+            tokens.append(record.token)
+    return tokens
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, len(result)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark notification token lookup')
+    parser.add_argument('--tokens', type=int, default=100000)
+    parser.add_argument('--expired-ratio', type=float, default=0.01)
+    parser.add_argument('--rpc-latency', type=float, default=0.05, help='Simulated Firestore round-trip, seconds')
+    args = parser.parse_args()
+    app_logger.set_log_level('WARNING')
+
+    db = FakeFirestore(rpc_latency=args.rpc_latency)
+    populate_tokens(db, args.tokens, args.expired_ratio)
+    first = timed(lambda: legacy_fetch(db))
+    second = timed(lambda: legacy_fetch(db))
+    print(f"legacy first alert     {first[0] * 1000:10.1f} ms ({first[1]} tokens, expired deleted one by one)")
+    print(f"legacy next alert      {second[0] * 1000:10.1f} ms")
+
+    db = FakeFirestore(rpc_latency=args.rpc_latency)
+    populate_tokens(db, args.tokens, args.expired_ratio)
+    registry = TokenRegistry(db, TOKEN_DEADLINE, sweep_interval=3600)
+    started = time.perf_counter()
+    registry.start()
+    registry.loaded.wait()
+    loaded = time.perf_counter() - started
+    first = timed(registry.tokens)
+    db.collection('fcm_tokens').put('device-new', {"timestamp": int(time.time() * 1000), "token": "fcm-token-new", "uid": "new"})
+    second = timed(registry.tokens)
+    print(f"registry startup load  {loaded * 1000:10.1f} ms (off the alert path)")
+    print(f"registry first alert   {first[0] * 1000:10.1f} ms ({first[1]} tokens)")
+    print(f"registry after change  {second[0] * 1000:10.1f} ms ({second[1]} tokens)")
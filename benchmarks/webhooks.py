@@ -0,0 +1,137 @@
+# Webhook delivery against a local partner stand-in: a fast JSON endpoint, a GET endpoint with query
+# arguments, one that fails its first requests, a slow one and one that is down. Checks rendering,
+# retries, the circuit breaker and outbox bounds, and that the push path on the bus is not delayed.
+# Usage: python benchmarks/webhooks.py [--alerts 50] [--interval 0.02] [--slow-delay 1.0]
+import argparse
+import logging
+import time
+from datetime import datetime, timezone
+from stubs import WebhookStubServer
+import app_logger
+from ai_worker import AiAlert
+from alert_monitor import Region
+from config import parse_settings
+from message_bus import message_bus
+from webhook_sender import WebhookSender, compile_template
+
+PAYLOAD = {
+    "source": "pyalerts",
+    "event": "{event}",
+    "threat": {"attacker": "{attacker}", "risk": "{confidence}", "summary": "{attacker}: {text}"},
+    "region": "{region_id}",
+}
+
+
+class PushProbe:
+    # Stands in for NotificationsSender: records how long ai_alert took to reach it
+    def __init__(self):
+        self.latencies = []
+
+    def on_ai_alert(self, alert):
+        self.latencies.append(time.monotonic() - alert.detected)
+
+
+def naive_render(value, context):
+    if isinstance(value, dict):
+        return {key: naive_render(item, context) for key, item in value.items()}
+    if isinstance(value, str):
+        return value.format(**context)
+    return value
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def render_cost(count=20000):
+    context = {"event": "ai_alert", "attacker": "DRONE", "confidence": 0.93, "text": "Група ударних БпЛА", "region_id": 14}
+    render = compile_template(PAYLOAD)
+    started = time.perf_counter()
+    for _ in range(count):
+        naive_render(PAYLOAD, context)
+    naive = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(count):
+        render(context)
+    compiled = time.perf_counter() - started
+    print(f"payload render: per-event format {naive / count * 1e6:.1f} us, precompiled {compiled / count * 1e6:.1f} us")
+
+
+def check(name, condition, detail=''):
+    print(f"{'ok  ' if condition else 'FAIL'} {name}{f' ({detail})' if detail else ''}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exercise the webhook sender against a local stub')
+    parser.add_argument('--alerts', type=int, default=50)
+    parser.add_argument('--interval', type=float, default=0.02)
+    parser.add_argument('--slow-delay', type=float, default=1.0)
+    args = parser.parse_args()
+    app_logger.set_log_level('ERROR')
+    logging.getLogger('ai_worker_persistent').setLevel(logging.WARNING)
+
+    behaviours = {
+        "/partner": {},
+        "/query": {},
+        "/flaky": {"fail_first": 2},
+        "/slow": {"delay": args.slow_delay},
+        "/down": {"status": 500},
+    }
+    with WebhookStubServer(behaviours) as stub:
+        settings = parse_settings({
+            'webhooks': [
+                {'name': 'partner', 'method': 'POST', 'url': stub.url('/partner'), 'payload': PAYLOAD},
+                {'name': 'query', 'method': 'GET', 'url': stub.url('/query'), 'events': ['alert', 'clear'],
+                 'query_args': [{'name': 'region', 'value': '{region_en}'}, {'name': 'state', 'value': '{event}'}]},
+                {'name': 'flaky', 'method': 'POST', 'url': stub.url('/flaky'), 'payload': PAYLOAD, 'events': ['alert']},
+                {'name': 'slow', 'method': 'POST', 'url': stub.url('/slow'), 'payload': PAYLOAD, 'timeout': args.slow_delay * 3},
+                {'name': 'down', 'method': 'POST', 'url': stub.url('/down'), 'payload': PAYLOAD},
+            ],
+            'webhook_outbox_size': 10,
+            'webhook_max_retries': 2,
+            'webhook_retry_backoff': 0.02,
+            'webhook_breaker_threshold': 3,
+            'webhook_breaker_reset': 60,
+        })
+        sender = WebhookSender(settings)
+        probe = PushProbe()
+        message_bus.subscribe('ai_alert', probe.on_ai_alert)
+        sender.start()
+        message_bus.start()
+
+        region = Region(id=14, name="Одеська область", name_en="Odesa", alert=True, changed=datetime.now(timezone.utc))
+        message_bus.publish('alert', region)
+        published = {}
+        for index in range(args.alerts):
+            text = f"alert {index}"
+            published[text] = time.monotonic()
+            message_bus.publish('ai_alert', AiAlert(alert=True, attacker="DRONE", text=text, confidence=0.9, original_text=text,
+                                                    detected=time.monotonic(), region_id=14))
+            time.sleep(args.interval)
+        region.alert = False
+        message_bus.publish('clear', region)
+        time.sleep(0.5)
+        sender.stop(timeout=args.slow_delay * 15)
+        endpoints = {endpoint.name: endpoint for endpoint in sender.endpoints}
+
+        partner = stub.requests_for('/partner')
+        latencies = [request["at"] - published[request["json"]["threat"]["summary"].split(': ', 1)[1]]
+                     for request in partner if request["json"]["event"] == 'ai_alert']
+        print(f"partner: {len(partner)} events, publish to receipt p50 {percentile(latencies, 0.5) * 1000:.1f} ms "
+              f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms over {stub.connections} TCP connections for all endpoints")
+        print(f"push path on the bus: p50 {percentile(probe.latencies, 0.5) * 1000:.2f} ms, max {max(probe.latencies) * 1000:.2f} ms")
+        print(f"slow: {len(stub.requests_for('/slow'))} delivered, {endpoints['slow'].dropped} dropped from its outbox")
+        print(f"down: {stub.attempts.get('/down', 0)} requests for {args.alerts + 2} events, breaker {endpoints['down'].breaker.state}")
+
+        sample = next(request["json"] for request in partner if request["json"]["event"] == 'ai_alert')
+        check("typed placeholders", sample["threat"]["risk"] == 0.9 and sample["region"] == 14, str(sample["threat"]))
+        query = stub.requests_for('/query')
+        check("query arguments", [request["query"] for request in query] == [{'region': ['Odesa'], 'state': ['alert']}, {'region': ['Odesa'], 'state': ['clear']}],
+              str([request["query"] for request in query]))
+        check("event filter and retries", len(stub.requests_for('/flaky')) == 1 and stub.attempts.get('/flaky') == 3)
+        check("all partner events delivered", len(partner) == args.alerts + 2, str(len(partner)))
+        check("circuit breaker", endpoints['down'].breaker.state == 'open' and stub.attempts.get('/down', 0) == 3 * (settings.webhook_max_retries + 1))
+        check("slow partner bounded", endpoints['slow'].dropped > 0 or args.slow_delay * (args.alerts + 2) < args.alerts * args.interval + 0.5)
+        check("push path unaffected", max(probe.latencies) < 0.05, f"{max(probe.latencies) * 1000:.1f} ms")
+    render_cost()
@@ -0,0 +1,238 @@
+import hashlib
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+from telegram import Message
+import metrics
+
+cache_lookups = metrics.counter('pyalerts_ai_cache_lookups_total', 'Messages looked up in the AI analysis cache')
+cache_hits = metrics.counter('pyalerts_ai_cache_hits_total', 'AI analysis cache hits by match kind', ['kind'])
+cache_calls_saved = metrics.counter('pyalerts_ai_cache_calls_saved_total', 'LLM calls skipped because every message had a cached verdict', ['reused'])
+cache_saved_seconds = metrics.counter('pyalerts_ai_cache_saved_seconds_total', 'Estimated LLM latency saved by skipped calls')
+
+URL_PATTERN = re.compile(r'https?://\S+|t\.me/\S+|@\w+')
+NON_WORD_PATTERN = re.compile(r'[\W_]+')
+MERSENNE_PRIME = (1 << 61) - 1
+MISSING = object()
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize('NFKC', text).lower()
+    text = URL_PATTERN.sub(' ', text)
+    return ' '.join(NON_WORD_PATTERN.sub(' ', text).split())
+
+
+def content_key(normalized: str) -> str:
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class TtlLruCache:
+    def __init__(self, max_size: int, ttl: float, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+
+    def get(self, key, default=MISSING):
+        entry = self.entries.get(key)
+        if entry is None:
+            return default
+        expires, value = entry
+        if expires < self.clock():
+            del self.entries[key]
+            return default
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = (self.clock() + self.ttl, value)
+        self.entries.move_to_end(key)
+        evicted = []
+        while len(self.entries) > self.max_size:
+            evicted.append(self.entries.popitem(last=False)[0])
+        return evicted
+
+    def pop(self, key):
+        entry = self.entries.pop(key, None)
+        return entry[1] if entry is not None else MISSING
+
+    def __contains__(self, key):
+        return self.get(key) is not MISSING
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class NearDuplicateIndex:
+    # MinHash signatures over word trigrams, bucketed with LSH bands
+    def __init__(self, threshold: float, num_perm: int = 32, bands: int = 8, shingle_size: int = 3):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = random.Random(1)
+        self.permutations = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME)) for _ in range(num_perm)]
+        self.signatures = {}
+        self.buckets = {}
+
+    def signature(self, normalized: str) -> Tuple[int, ...]:
+        words = normalized.split()
+        if len(words) <= self.shingle_size:
+            shingles = {normalized}
+        else:
+            shingles = {' '.join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+        hashes = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little') for shingle in shingles]
+        return tuple(min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in self.permutations)
+
+    def _bands(self, signature):
+        return [(band, signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    def find(self, signature) -> Optional[str]:
+        candidates = set()
+        for band in self._bands(signature):
+            candidates.update(self.buckets.get(band, ()))
+        best_key, best_similarity = None, self.threshold
+        for key in candidates:
+            other = self.signatures[key]
+            similarity = sum(1 for a, b in zip(signature, other) if a == b) / len(signature)
+            if similarity >= best_similarity:
+                best_key, best_similarity = key, similarity
+        return best_key
+
+    def add(self, key, signature):
+        self.signatures[key] = signature
+        for band in self._bands(signature):
+            self.buckets.setdefault(band, set()).add(key)
+
+    def remove(self, key):
+        signature = self.signatures.pop(key, None)
+        if signature is None:
+            return
+        for band in self._bands(signature):
+            bucket = self.buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self.buckets[band]
+
+
+@dataclass
+class CacheStats:
+    lookups: int = 0
+    exact_hits: int = 0
+    near_hits: int = 0
+    verdicts_reused: int = 0
+    calls_saved: int = 0
+    saved_latency: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        return (self.exact_hits + self.near_hits) / self.lookups if self.lookups else 0.0
+
+
+@dataclass(frozen=True)
+class Pending:
+    # Placeholder for a message that is being analysed; `since` is on the cache clock
+    since: float
+
+
+@dataclass
+class CacheLookup:
+    fresh: List[Message] = field(default_factory=list)
+    verdicts: list = field(default_factory=list)
+
+
+class AnalysisCache:
+    def __init__(self, max_size: int, ttl: float, near_duplicate_threshold: Optional[float] = None, pending_ttl: float = 60.0):
+        self.entries = TtlLruCache(max_size, ttl)
+        self.pending_ttl = pending_ttl
+        self.near_duplicates = NearDuplicateIndex(near_duplicate_threshold) if near_duplicate_threshold else None
+        self.stats = CacheStats()
+        self.lock = threading.Lock()
+
+    def _store(self, key, value, signature=None):
+        for evicted in self.entries.put(key, value):
+            if self.near_duplicates:
+                self.near_duplicates.remove(evicted)
+        if self.near_duplicates and signature is not None:
+            self.near_duplicates.add(key, signature)
+
+    def _verdict(self, key):
+        # A Pending placeholder reads as "no alert" while the analysis may still finish,
+        # and as a miss once it is older than pending_ttl
+        verdict = self.entries.get(key)
+        if isinstance(verdict, Pending):
+            return None if self.entries.clock() - verdict.since < self.pending_ttl else MISSING
+        return verdict
+
+    def lookup(self, messages: List[Message]) -> CacheLookup:
+        # Splits messages into unseen ones and verdicts cached for reposts; unseen
+        # messages are remembered right away so duplicates in flight are dropped too.
+        # Every fresh message must end in record() or release().
+        result = CacheLookup()
+        near_hits = 0
+        with self.lock:
+            for message in messages:
+                self.stats.lookups += 1
+                normalized = normalize_text(message.text)
+                key = content_key(normalized)
+                verdict = self._verdict(key)
+                if verdict is not MISSING:
+                    self.stats.exact_hits += 1
+                    result.verdicts.append(verdict)
+                    continue
+                signature = None
+                if self.near_duplicates:
+                    signature = self.near_duplicates.signature(normalized)
+                    match = self.near_duplicates.find(signature)
+                    verdict = self._verdict(match) if match else MISSING
+                    if verdict is not MISSING:
+                        self.stats.near_hits += 1
+                        near_hits += 1
+                        result.verdicts.append(verdict)
+                        continue
+                self._store(key, Pending(self.entries.clock()), signature)
+                result.fresh.append(message)
+        cache_lookups.inc(len(messages))
+        exact_hits = len(messages) - len(result.fresh) - near_hits
+        if exact_hits:
+            cache_hits.labels('exact').inc(exact_hits)
+        if near_hits:
+            cache_hits.labels('near').inc(near_hits)
+        return result
+
+    def record(self, messages: List[Message], verdict):
+        with self.lock:
+            targets = messages
+            if verdict.alert and verdict.text:
+                trigger = normalize_text(verdict.text)
+                targets = [message for message in messages if normalize_text(message.text) in trigger or trigger in normalize_text(message.text)] or messages
+            for message in messages:
+                key = content_key(normalize_text(message.text))
+                if key in self.entries:
+                    self.entries.put(key, verdict if message in targets else None)
+
+    def release(self, messages: List[Message]):
+        # Forgets placeholders of messages that were not analysed (failed, timed out, gated
+        # or dropped), so that a repost of them is analysed rather than treated as seen
+        with self.lock:
+            for message in messages:
+                key = content_key(normalize_text(message.text))
+                if isinstance(self.entries.get(key), Pending):
+                    self.entries.pop(key)
+                    if self.near_duplicates:
+                        self.near_duplicates.remove(key)
+
+    def record_saved_call(self, latency: float, reused: bool):
+        with self.lock:
+            self.stats.calls_saved += 1
+            self.stats.saved_latency += latency
+            if reused:
+                self.stats.verdicts_reused += 1
+        cache_calls_saved.labels(str(reused).lower()).inc()
+        cache_saved_seconds.inc(latency)
@@ -1,20 +1,50 @@
 import os
 import json
-from datetime import datetime
-from dataclasses import dataclass
-from collections import deque
-from threading import Lock
-from typing import List
-from openai import OpenAI
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from threading import Event, Lock, Thread
+from typing import List, Optional, Tuple
 from pytz import timezone
 from telegram import Message
+from ai_cache import AnalysisCache
+from pre_classifier import PreClassifier, parse_rules
+from json_stream import JsonFieldStream
+from llm_executor import Cancelled, DeadlineExceeded, HedgedExecutor, LlmBackend
+from prompt_builder import PromptBuilder, PromptEntry, estimate_tokens
 from message_bus import message_bus
 from config import Settings
+from state_store import StateStore
 import app_logger
+import metrics
 
 logger = app_logger.get(__name__)
 persistent_logger = app_logger.get_persistent('ai_worker_persistent')
 
+llm_seconds = metrics.histogram('pyalerts_llm_seconds', 'LLM request duration', ['outcome'])
+llm_tokens = metrics.counter('pyalerts_llm_tokens_total', 'Estimated LLM tokens', ['kind'])
+
+RESPONSE_FORMAT_PROMPT = (
+    'Respond with a single JSON object and nothing else, with exactly these keys in this order: '
+    '"alert" (boolean), "attacker" (string), "risk" (number from 0 to 1), '
+    '"trigger" (string, the message that caused the verdict, at most 200 characters).'
+)
+
+
+_clients = {}
+_clients_lock = Lock()
+
+
+def openai_client(base_url: str):
+    # The openai package takes about half a second to import, so it is loaded on first
+    # use instead of at startup; workers with the same base_url share one client.
+    # HedgedExecutor retries on another backend, so the client itself does not retry.
+    with _clients_lock:
+        if base_url not in _clients:
+            from openai import OpenAI
+            _clients[base_url] = OpenAI(api_key=os.environ['OPENAI_API_KEY'], base_url=base_url, max_retries=0)
+        return _clients[base_url]
+
 
 @dataclass
 class AiAlert:
@@ -23,6 +53,10 @@ class AiAlert:
     text: str = None
     confidence: float = None
     original_text: str = None
+    # Monotonic time the triggering messages reached AiWorker, for end-to-end latency
+    detected: Optional[float] = field(default=None, repr=False, compare=False)
+    # Region the verdict belongs to; None for a worker that serves every monitored region
+    region_id: Optional[int] = None
 
     @staticmethod
     def from_dict(data: dict):
@@ -35,80 +69,330 @@ class AiAlert:
         )
 
 
+def _join_prompt(messages) -> str:
+    # History and new messages, without the system prompt and the local time
+    return "\n".join(message['content'] for message in messages[1:-1])
+
+
 class AiWorker:
-    def __init__(self, settings: Settings):
-        self.history = deque(maxlen=10)
+    def __init__(self, settings: Settings, store: StateStore = None, region=None, client=None, executor: ThreadPoolExecutor = None,
+                 llm: HedgedExecutor = None):
+        # region narrows the worker to one Region: its own alert state, history and prompt.
+        # client, executor and llm can be shared between the workers of a multi-region process.
+        self.store = store
+        self.region_id = region.id if region is not None else None
+        self.scope = f'region-{region.id}' if region is not None else 'default'
         self.state_lock = Lock()
         self.ai_enabled = False
-        self.system_prompt = settings.analyzer_prompt
+        self.alert_region_ids = set()
+        self.pending = []
+        self.pending_since = None
+        self.in_flight = 0
+        self.max_in_flight = settings.ai_workers
+        self.sequence = 0
+        self.last_completed = 0
+        self.generation = 0
+        # A placeholder outliving two deadlines belongs to an analysis that was lost
+        self.cache = AnalysisCache(settings.ai_cache_size, settings.ai_cache_ttl, settings.ai_near_duplicate_threshold,
+                                   pending_ttl=2 * settings.ai_deadline)
+        self.call_latency = None
+        self.pre_classifier = PreClassifier(parse_rules(settings.pre_classifier_rules))
+        self.gate_threshold = settings.ai_gate_threshold
+        self.instant_alert_threshold = settings.ai_instant_alert_threshold
+        self.executor = executor or ThreadPoolExecutor(max_workers=settings.ai_workers, thread_name_prefix='ai-worker')
+        analyzer_prompt = settings.analyzer_prompt.replace('{region}', region.name) if region is not None else settings.analyzer_prompt
+        self.system_prompt = f"{analyzer_prompt}\n\n{RESPONSE_FORMAT_PROMPT}"
+        self.model = settings.ai_model
+        self.max_tokens = settings.ai_max_tokens
+        self.streaming = settings.ai_streaming
+        self.json_mode = settings.ai_json_mode
         self.target_timezone = timezone(settings.timezone_name)
-        self.chatgpt_api = OpenAI(api_key=os.environ['OPENAI_API_KEY'])
+        self.prompt = PromptBuilder(self.system_prompt, self.target_timezone, settings.ai_history_size, settings.ai_history_token_budget,
+                                    settings.ai_history_trim_ratio)
+        self.base_url = settings.openai_base_url
+        self.llm = llm or HedgedExecutor.from_settings(settings)
+        self.backends = [LlmBackend('primary', settings.ai_model, settings.openai_base_url)]
+        if settings.ai_fallback_model or settings.ai_fallback_base_url:
+            self.backends.append(LlmBackend('fallback', settings.ai_fallback_model or settings.ai_model, settings.ai_fallback_base_url or settings.openai_base_url))
+        self.client_timeout = settings.startup_timeout
+        self.chatgpt_api = client
+        self.ready = Event()
+        if client is not None:
+            self.ready.set()
+        if self.store is not None:
+            self._restore()
+
+    def _restore(self):
+        state = self.store.restored
+        values = state.values.get(f'ai_worker:{self.scope}') or {}
+        self.alert_region_ids = set(values.get('alert_region_ids', []))
+        self.ai_enabled = bool(self.alert_region_ids)
+        if self.ai_enabled:
+            self._append_history(state.ai_history.get(self.scope, []))
+            logger.info(f"Restored AI state with {len(self.prompt)} history messages")
+
+    def _save_state(self):
+        if self.store is not None:
+            self.store.put_value(f'ai_worker:{self.scope}', {'alert_region_ids': sorted(self.alert_region_ids)})
 
     def start(self):
         message_bus.subscribe('new_messages', self.process_messages)
         message_bus.subscribe('alert', self.process_alert_event)
         message_bus.subscribe('clear', self.process_clear_event)
+        if not self.ready.is_set():
+            Thread(target=self._create_client, name='ai-client-init', daemon=True).start()
         logger.info('AiWorker started')
 
-    def process_alert_event(self, _):
+    def _create_client(self):
+        try:
+            self.chatgpt_api = openai_client(self.base_url)
+            self.ready.set()
+        except Exception as e:
+            logger.error(f"Error creating the OpenAI client: {e}")
+
+    def _client(self, backend: LlmBackend = None):
+        # Analysis requested while the client is still being created waits for it
+        if backend is not None and backend.base_url != self.base_url:
+            return openai_client(backend.base_url)
+        if not self.ready.wait(self.client_timeout):
+            raise RuntimeError("OpenAI client is not initialized")
+        return self.chatgpt_api
+
+    def process_alert_event(self, region):
+        if self.region_id is not None and region.id != self.region_id:
+            return
         with self.state_lock:
-            self.history.clear()
+            if not self.alert_region_ids:
+                self._reset()
+            self.alert_region_ids.add(region.id)
             self.ai_enabled = True
+            self._save_state()
             logger.debug("AI analyzer enabled")
 
-    def process_clear_event(self, _):
+    def process_clear_event(self, region):
+        if self.region_id is not None and region.id != self.region_id:
+            return
         with self.state_lock:
-            self.history.clear()
+            self.alert_region_ids.discard(region.id)
+            self._save_state()
+            if self.alert_region_ids:
+                return
+            self._reset()
             self.ai_enabled = False
             logger.debug("AI analyzer disabled")
 
+    def _reset(self):
+        self.prompt.clear()
+        self.cache.release(self.pending)
+        self.pending = []
+        self.pending_since = None
+        self.generation += 1
+        if self.store is not None:
+            self.store.put_history(self.scope, [])
+
+    def _append_history(self, messages: List[Message]) -> List[PromptEntry]:
+        entries = self.prompt.append(messages)
+        if self.store is not None:
+            self.store.put_history(self.scope, self.prompt.messages)
+        return entries
+
     def process_messages(self, messages: List[Message]):
         with self.state_lock:
             if not self.ai_enabled:
                 return
+        lookup = self.cache.lookup(messages)
+        if not lookup.fresh:
+            self._reuse_verdicts(lookup.verdicts)
+            return
+        scores = self.pre_classifier.score_batch(lookup.fresh)
+        instant = []
+        rest = []
+        for message, score in zip(lookup.fresh, scores):
+            if self.instant_alert_threshold is not None and score.value >= self.instant_alert_threshold:
+                instant.append((message, score))
+            else:
+                rest.append((message, score))
+        forward = bool(rest) and max(score.value for _, score in rest) >= self.gate_threshold
+
+        ai_alert = None
+        with self.state_lock:
+            if not self.ai_enabled:
+                self.cache.release(lookup.fresh)
+                return
+            if instant:
+                message, score = max(instant, key=lambda item: item[1].value)
+                ai_alert = AiAlert(alert=True, attacker=score.attacker or "UNKNOWN", text=message.text, confidence=score.value, original_text=message.text,
+                                   detected=time.monotonic(), region_id=self.region_id)
+                self.cache.record([message], ai_alert)
+                self.cache.release([other for other, _ in instant if other is not message])
+                self._append_history([message for message, _ in instant])
+            if forward:
+                self.pending.extend(message for message, _ in rest)
+                if self.pending_since is None:
+                    self.pending_since = time.monotonic()
+                self._dispatch()
+            else:
+                logger.debug("Pre-classifier filtered out %d messages", len(rest))
+                self.cache.release([message for message, _ in rest])
+                self._append_history([message for message, _ in rest])
+        # Published outside state_lock: a full subscriber queue blocks the publisher
+        if ai_alert is not None:
+            logger.info(f"Pre-classifier detected an alert: {ai_alert}")
+            message_bus.publish('ai_alert', ai_alert)
+
+    def _reuse_verdicts(self, verdicts):
+        alerts = [verdict for verdict in verdicts if verdict is not None and verdict.alert]
+        self.cache.record_saved_call(self.call_latency or 0.0, reused=bool(alerts))
+        logger.debug("Skipped AI call for %d repeated messages, cache stats: %s, hit rate %.2f", len(verdicts), self.cache.stats, self.cache.stats.hit_rate)
+        if alerts:
+            logger.info(f"Reusing cached AI alert: {alerts[-1]}")
+            message_bus.publish('ai_alert', replace(alerts[-1], detected=time.monotonic()))
 
-        system_messages = [
-            {"role": "system", "content": self.system_prompt}
-        ]
+    def _dispatch(self):
+        if not self.pending or self.in_flight >= self.max_in_flight:
+            return
+        messages, self.pending = self.pending, []
+        received, self.pending_since = self.pending_since, None
+        history = self.prompt.prefix()
+        entries = self._append_history(messages)
+        self.sequence += 1
+        self.in_flight += 1
+        self.executor.submit(self._analyze, self.sequence, self.generation, history, entries, received)
 
-        history_messages = [
-            {"role": "user", "content": f"> HISTORY {msg.date.astimezone(self.target_timezone).strftime('%H:%M:%S')} {msg.author}: {msg.text}"} for msg in self.history
-        ]
+    def _publish_early(self, sequence, generation, fields: dict, received: float):
+        if not fields.get('alert'):
+            return None
+        with self.state_lock:
+            if generation != self.generation or sequence < self.last_completed:
+                return None
+        ai_alert = AiAlert(alert=True, attacker=fields.get('attacker', "UNKNOWN"), text="", confidence=0.0, original_text="", detected=received,
+                           region_id=self.region_id)
+        logger.info(f"AI alert streamed {time.monotonic() - received:.2f}s after messages arrived: {ai_alert}")
+        message_bus.publish('ai_alert', ai_alert)
+        return ai_alert
 
-        new_messages = [
-            {"role": "user", "content": f"> NEW {msg.date.astimezone(self.target_timezone).strftime('%H:%M:%S')} {msg.author}: {msg.text}"} for msg in messages
-        ]
+    def _analyze(self, sequence, generation, history: Tuple[PromptEntry, ...], entries: List[PromptEntry], received: float):
+        early_alerts = []
 
-        for message in messages:
-            self.history.append(message)
+        def on_fields(fields):
+            early_alerts.append(self._publish_early(sequence, generation, fields, received))
 
-        history_string = "\n".join([msg['content'] for msg in history_messages])
-        new_string = "\n".join([msg['content'] for msg in new_messages])
-        all_messages = "\n".join([history_string, new_string])
-        debug_log_message = f"Sending messages to AI:\n\n{all_messages}\n"
-        logger.debug(debug_log_message)
-        persistent_logger.debug(debug_log_message)
+        started = time.monotonic()
         try:
-            ai_response = self.chatgpt_api.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=system_messages + history_messages + new_messages + [
-                    {
-                        "role": "assistant",
-                        "content": f"Local time: {datetime.utcnow().astimezone(self.target_timezone).isoformat()}"
-                    }
-                ],
-                temperature=0.01,
-                max_tokens=4096,
-                top_p=1,
-                frequency_penalty=0,
-                presence_penalty=0
-            )
-            persistent_logger.debug(f"AI response:\n\n{ai_response}\n")
-            response = json.loads(ai_response.choices[0].message.content)
-            persistent_logger.debug(f"AI response payload:\n\n{json.dumps(response, indent=2, ensure_ascii=False)}\n")
-            ai_response = AiAlert.from_dict(response)
-            if ai_response.alert:
-                logger.info(f"AI detected an alert: {ai_response}")
-                message_bus.publish('ai_alert', ai_response)
+            ai_alert = self.request_analysis(history, entries, on_fields)
+            ai_alert.detected = received
+            ai_alert.region_id = self.region_id
+            elapsed = time.monotonic() - started
+            llm_seconds.labels('ok').observe(elapsed)
+            self.call_latency = elapsed if self.call_latency is None else 0.8 * self.call_latency + 0.2 * elapsed
+            self.cache.record([entry.message for entry in entries], ai_alert)
         except Exception as e:
+            llm_seconds.labels('deadline' if isinstance(e, DeadlineExceeded) else 'error').observe(time.monotonic() - started)
             logger.error(f"Error processing messages with AI: {e}")
+            self.cache.release([entry.message for entry in entries])
+            ai_alert = None
+
+        early_alert = early_alerts[0] if early_alerts else None
+        outcome = None
+        with self.state_lock:
+            self.in_flight -= 1
+            if generation != self.generation or sequence < self.last_completed:
+                logger.debug("Discarding stale AI result #%d", sequence)
+            elif ai_alert is not None:
+                self.last_completed = sequence
+                if early_alert is not None:
+                    outcome = 'update' if ai_alert.alert else 'retracted'
+                elif ai_alert.alert:
+                    outcome = 'alert'
+            self._dispatch()
+        if outcome == 'update':
+            logger.info(f"AI alert completed {time.monotonic() - received:.2f}s after messages arrived: {ai_alert}")
+            message_bus.publish('ai_alert_update', ai_alert)
+        elif outcome == 'retracted':
+            # Not an update: it would reach devices and webhooks as a second alert
+            logger.warning(f"AI verdict retracted the streamed alert {time.monotonic() - received:.2f}s after messages arrived: {ai_alert}")
+        elif outcome == 'alert':
+            logger.info(f"AI detected an alert {time.monotonic() - received:.2f}s after messages arrived: {ai_alert}")
+            message_bus.publish('ai_alert', ai_alert)
+
+    def request_analysis(self, history: Tuple[PromptEntry, ...], entries: List[PromptEntry], on_fields=None) -> AiAlert:
+        prompt = self.prompt.build(history, entries)
+        all_messages = app_logger.lazy(_join_prompt, prompt.messages)
+        logger.debug("Sending messages to AI:\n\n%s\n", all_messages)
+        persistent_logger.debug("Sending messages to AI:\n\n%s\n", all_messages)
+        request = dict(
+            model=self.model,
+            messages=prompt.messages,
+            temperature=0.01,
+            max_tokens=self.max_tokens,
+            top_p=1,
+            frequency_penalty=0,
+            presence_penalty=0
+        )
+        if self.json_mode:
+            request['response_format'] = {"type": "json_object"}
+
+        # Only the first attempt to stream the verdict fields publishes an early alert
+        fields_lock = Lock()
+        fields_seen = []
+
+        def first_fields(fields):
+            with fields_lock:
+                if fields_seen:
+                    return
+                fields_seen.append(fields)
+            on_fields(fields)
+
+        content, response = self.llm.call(
+            lambda backend, cancelled, timeout: self._attempt(request, first_fields if on_fields else None, backend, cancelled, timeout),
+            self.backends)
+        llm_tokens.labels('prompt').inc(prompt.tokens)
+        llm_tokens.labels('prompt_prefix_reused').inc(prompt.reused_tokens)
+        llm_tokens.labels('completion').inc(estimate_tokens(content))
+        persistent_logger.debug("AI response payload:\n\n%s\n", app_logger.lazy(json.dumps, response, indent=2, ensure_ascii=False))
+        return AiAlert.from_dict(response)
+
+    def _attempt(self, request: dict, on_fields, backend: LlmBackend, cancelled: Event, timeout: float) -> Tuple[str, dict]:
+        # One request to one backend. A response that is not a verdict object is a failure,
+        # so that HedgedExecutor lets another attempt win.
+        client = self._client(backend)
+        request = dict(request, model=backend.model, timeout=timeout)
+        if self.streaming:
+            content = self._stream_completion(client, request, on_fields, cancelled)
+            persistent_logger.debug("AI response from %s:\n\n%s\n", backend.name, content)
+        else:
+            # A blocking request cannot be interrupted; it ends at the latest on its timeout
+            ai_response = client.chat.completions.create(**request)
+            persistent_logger.debug("AI response from %s:\n\n%s\n", backend.name, ai_response)
+            content = ai_response.choices[0].message.content
+        if cancelled.is_set():
+            raise Cancelled()
+        response = json.loads(content)
+        if not isinstance(response, dict) or 'alert' not in response:
+            raise ValueError(f"Unexpected AI response: {content[:200]}")
+        return content, response
+
+    def _stream_completion(self, client, request: dict, on_fields=None, cancelled: Event = None) -> str:
+        parser = JsonFieldStream() if on_fields else None
+        chunks = []
+        stream = client.chat.completions.create(stream=True, **request)
+        for chunk in stream:
+            if cancelled is not None and cancelled.is_set():
+                # Another attempt won: stop reading and drop the connection
+                stream.close()
+                raise Cancelled()
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            delta = chunk.choices[0].delta.content
+            chunks.append(delta)
+            if parser is None:
+                continue
+            try:
+                parser.feed(delta)
+            except ValueError:
+                parser = None
+                continue
+            if 'alert' in parser.fields and 'attacker' in parser.fields:
+                on_fields(dict(parser.fields))
+                parser = None
+        return ''.join(chunks)
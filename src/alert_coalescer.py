@@ -0,0 +1,120 @@
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Set
+from message_bus import message_bus
+from ai_worker import AiAlert
+from ai_cache import content_key, normalize_text
+from config import Settings
+import app_logger
+import metrics
+
+logger = app_logger.get(__name__)
+
+coalescer_alerts = metrics.counter('pyalerts_coalescer_alerts_total', 'AI alerts by coalescing outcome', ['outcome'])
+
+# Outcomes; the first three are delivered
+NEW = 'new'
+NEW_ATTACKER = 'new_attacker'
+HIGHER_CONFIDENCE = 'higher_confidence'
+REPEAT = 'repeat'
+COALESCED = 'coalesced'
+UPDATE = 'update'
+DELIVERED = frozenset({NEW, NEW_ATTACKER, HIGHER_CONFIDENCE})
+
+
+@dataclass
+class RegionThreat:
+    # What devices were last told about a region's threat
+    delivered_at: float
+    confidence: float
+    attackers: Set[str] = field(default_factory=set)
+    fingerprints: Set[str] = field(default_factory=set)
+    suppressed: int = 0
+    # A streamed early alert went out without text; its ai_alert_update replaces it
+    partial: bool = False
+
+
+class AlertCoalescer:
+    # Sits between ai_alert and push delivery. Within `window` seconds of the last
+    # pushed alert for a region only escalations are forwarded as push_alert: a new
+    # attacker, or a confidence at least `escalation_step` above what was pushed.
+    # The complete verdict for a streamed early alert that was pushed goes out as
+    # a second push_alert, which replaces the first on devices (same collapse key).
+    # Runs next to the AI workers so that it sees every alert even when several
+    # senders share the delivery load.
+    def __init__(self, settings: Settings, clock=time.monotonic):
+        self.window = settings.alert_coalesce_window
+        self.escalation_step = settings.alert_escalation_step
+        self.clock = clock
+        self.threats: Dict[Optional[int], RegionThreat] = {}
+        self.lock = threading.Lock()
+
+    def start(self):
+        message_bus.subscribe('ai_alert', self.handle_ai_alert)
+        message_bus.subscribe('ai_alert_update', self.handle_ai_alert_update)
+        message_bus.subscribe('clear', self.handle_clear)
+        logger.info(f"AlertCoalescer started with a {self.window:g}s window")
+
+    @staticmethod
+    def fingerprint(alert: AiAlert) -> str:
+        return content_key(normalize_text(f"{alert.attacker} {alert.original_text or alert.text or ''}"))
+
+    def offer(self, alert: AiAlert) -> str:
+        attacker = normalize_text(alert.attacker or '')
+        confidence = alert.confidence or 0.0
+        fingerprint = self.fingerprint(alert)
+        now = self.clock()
+        with self.lock:
+            threat = self.threats.get(alert.region_id)
+            if threat is None or not self.window or now - threat.delivered_at >= self.window:
+                outcome = NEW
+                threat = self.threats[alert.region_id] = RegionThreat(delivered_at=now, confidence=confidence)
+            elif attacker not in threat.attackers:
+                outcome = NEW_ATTACKER
+            elif confidence >= threat.confidence + self.escalation_step:
+                outcome = HIGHER_CONFIDENCE
+            else:
+                threat.suppressed += 1
+                outcome = REPEAT if fingerprint in threat.fingerprints else COALESCED
+            if outcome in DELIVERED:
+                threat.delivered_at = now
+                threat.confidence = max(threat.confidence, confidence)
+                threat.attackers.add(attacker)
+                threat.partial = not alert.text
+            threat.fingerprints.add(fingerprint)
+        coalescer_alerts.labels(outcome).inc()
+        return outcome
+
+    def handle_ai_alert(self, alert: AiAlert):
+        outcome = self.offer(alert)
+        if outcome in DELIVERED:
+            message_bus.publish('push_alert', alert)
+        else:
+            logger.debug("Suppressed %s alert: %s %s", outcome, alert.attacker, alert.text)
+
+    def handle_ai_alert_update(self, alert: AiAlert):
+        if not alert.alert:
+            return
+        with self.lock:
+            threat = self.threats.get(alert.region_id)
+            replaces = threat is not None and threat.partial
+            if replaces:
+                threat.partial = False
+                threat.confidence = max(threat.confidence, alert.confidence or 0.0)
+                threat.attackers.add(normalize_text(alert.attacker or ''))
+                threat.fingerprints.add(self.fingerprint(alert))
+        if replaces:
+            coalescer_alerts.labels(UPDATE).inc()
+            message_bus.publish('push_alert', alert)
+        else:
+            # The early alert was coalesced, so the complete verdict is judged on its own
+            self.handle_ai_alert(alert)
+
+    def handle_clear(self, region):
+        # After a clear the next alert for the region is news again
+        with self.lock:
+            for region_id in (region.id, None):
+                threat = self.threats.pop(region_id, None)
+                if threat is not None and threat.suppressed:
+                    logger.info(f"Suppressed {threat.suppressed} repeated alerts for {region.name_en if region_id is not None else 'all regions'}")
@@ -1,14 +1,24 @@
+import re
 import threading
-import time
 from datetime import datetime, timezone
 from dataclasses import dataclass
-from telegram import fetch_latest_messages
+from typing import List, Optional, Tuple
+from alert_sources import AlertReport, JsonApiAlertSource, SourceStatsTable, TelegramAlertSource
+from poll_scheduler import poll_scheduler
+from state_store import StateStore
 from message_bus import message_bus
 from config import Settings
 import app_logger
+import metrics
 
 logger = app_logger.get(__name__)
 
+source_lag = metrics.histogram('pyalerts_alert_source_lag_seconds', 'Time from a region state change being posted to a source reporting it', ['source'])
+source_reports = metrics.counter('pyalerts_alert_source_reports_total', 'Alert source reports by outcome', ['source', 'outcome'])
+
+ALERT_KEYWORD = "Повітряна тривога"
+CLEAR_KEYWORD = "Відбій"
+
 
 @dataclass
 class Region:
@@ -19,80 +29,165 @@ class Region:
     changed: datetime
 
 
+def create_regions() -> List[Region]:
+    return [
+        Region(id=1, name="Вінницька область", name_en="Vinnytsia oblast", alert=False, changed=None),
+        Region(id=2, name="Волинська область", name_en="Volyn oblast", alert=False, changed=None),
+        Region(id=3, name="Дніпропетровська область", name_en="Dnipropetrovsk oblast", alert=False, changed=None),
+        Region(id=4, name="Донецька область", name_en="Donetsk oblast", alert=False, changed=None),
+        Region(id=5, name="Житомирська область", name_en="Zhytomyr oblast", alert=False, changed=None),
+        Region(id=6, name="Закарпатська область", name_en="Zakarpattia oblast", alert=False, changed=None),
+        Region(id=7, name="Запорізька область", name_en="Zaporizhzhia oblast", alert=False, changed=None),
+        Region(id=8, name="Івано-Франківська область", name_en="Ivano-Frankivsk oblast", alert=False, changed=None),
+        Region(id=9, name="Київська область", name_en="Kyiv oblast", alert=False, changed=None),
+        Region(id=10, name="Кіровоградська область", name_en="Kirovohrad oblast", alert=False, changed=None),
+        Region(id=11, name="Луганська область", name_en="Luhansk oblast", alert=False, changed=None),
+        Region(id=12, name="Львівська область", name_en="Lviv oblast", alert=False, changed=None),
+        Region(id=13, name="Миколаївська область", name_en="Mykolaiv oblast", alert=False, changed=None),
+        Region(id=14, name="Одеська область", name_en="Odesa oblast", alert=False, changed=None),
+        Region(id=15, name="Полтавська область", name_en="Poltava oblast", alert=False, changed=None),
+        Region(id=16, name="Рівненська область", name_en="Rivne oblast", alert=False, changed=None),
+        Region(id=17, name="Сумська область", name_en="Sumy oblast", alert=False, changed=None),
+        Region(id=18, name="Тернопільська область", name_en="Ternopil oblast", alert=False, changed=None),
+        Region(id=19, name="Харківська область", name_en="Kharkiv oblast", alert=False, changed=None),
+        Region(id=20, name="Херсонська область", name_en="Kherson oblast", alert=False, changed=None),
+        Region(id=21, name="Хмельницька область", name_en="Khmelnytskyi oblast", alert=False, changed=None),
+        Region(id=22, name="Черкаська область", name_en="Cherkasy oblast", alert=False, changed=None),
+        Region(id=23, name="Чернівецька область", name_en="Chernivtsi oblast", alert=False, changed=None),
+        Region(id=24, name="Чернігівська область", name_en="Chernihiv oblast", alert=False, changed=None),
+        Region(id=25, name="м. Київ", name_en="Kyiv", alert=False, changed=None),
+    ]
+
+
+class AlertMatcher:
+    def __init__(self, regions: List[Region]):
+        self.regions_by_name = {region.name: region for region in regions}
+        tokens = [ALERT_KEYWORD, CLEAR_KEYWORD] + sorted(self.regions_by_name, key=len, reverse=True)
+        self.pattern = re.compile('|'.join(re.escape(token) for token in tokens))
+
+    def match(self, text: str) -> Tuple[Optional[bool], List[Region]]:
+        tokens = dict.fromkeys(self.pattern.findall(text))
+        if ALERT_KEYWORD in tokens:
+            alert = True
+        elif CLEAR_KEYWORD in tokens:
+            alert = False
+        else:
+            return None, []
+        return alert, [self.regions_by_name[token] for token in tokens if token in self.regions_by_name]
+
+
 class AlertMonitor:
-    def __init__(self, settings: Settings):
-        self.channel_name = settings.alert_channel
-        self.interval = settings.alert_polling_interval
-        self.backoff_interval = settings.alert_backoff_polling_interval
-        self.last_checked = None
-        self.region_id = settings.region_to_monitor
-        self.alert = False
-        self.regions = [
-            Region(id=1, name="Вінницька область", name_en="Vinnytsia oblast", alert=False, changed=None),
-            Region(id=2, name="Волинська область", name_en="Volyn oblast", alert=False, changed=None),
-            Region(id=3, name="Дніпропетровська область", name_en="Dnipropetrovsk oblast", alert=False, changed=None),
-            Region(id=4, name="Донецька область", name_en="Donetsk oblast", alert=False, changed=None),
-            Region(id=5, name="Житомирська область", name_en="Zhytomyr oblast", alert=False, changed=None),
-            Region(id=6, name="Закарпатська область", name_en="Zakarpattia oblast", alert=False, changed=None),
-            Region(id=7, name="Запорізька область", name_en="Zaporizhzhia oblast", alert=False, changed=None),
-            Region(id=8, name="Івано-Франківська область", name_en="Ivano-Frankivsk oblast", alert=False, changed=None),
-            Region(id=9, name="Київська область", name_en="Kyiv oblast", alert=False, changed=None),
-            Region(id=10, name="Кіровоградська область", name_en="Kirovohrad oblast", alert=False, changed=None),
-            Region(id=11, name="Луганська область", name_en="Luhansk oblast", alert=False, changed=None),
-            Region(id=12, name="Львівська область", name_en="Lviv oblast", alert=False, changed=None),
-            Region(id=13, name="Миколаївська область", name_en="Mykolaiv oblast", alert=False, changed=None),
-            Region(id=14, name="Одеська область", name_en="Odesa oblast", alert=False, changed=None),
-            Region(id=15, name="Полтавська область", name_en="Poltava oblast", alert=False, changed=None),
-            Region(id=16, name="Рівненська область", name_en="Rivne oblast", alert=False, changed=None),
-            Region(id=17, name="Сумська область", name_en="Sumy oblast", alert=False, changed=None),
-            Region(id=18, name="Тернопільська область", name_en="Ternopil oblast", alert=False, changed=None),
-            Region(id=19, name="Харківська область", name_en="Kharkiv oblast", alert=False, changed=None),
-            Region(id=20, name="Херсонська область", name_en="Kherson oblast", alert=False, changed=None),
-            Region(id=21, name="Хмельницька область", name_en="Khmelnytskyi oblast", alert=False, changed=None),
-            Region(id=22, name="Черкаська область", name_en="Cherkasy oblast", alert=False, changed=None),
-            Region(id=23, name="Чернівецька область", name_en="Chernivtsi oblast", alert=False, changed=None),
-            Region(id=24, name="Чернігівська область", name_en="Chernihiv oblast", alert=False, changed=None),
-            Region(id=25, name="м. Київ", name_en="Kyiv", alert=False, changed=None),
-        ]
-
-    def check_alerts(self):
-        logger.debug("Checking for alerts")
+    # Polls every alert source in its own thread and fuses their reports per region:
+    # the first source to report a newer state wins, later copies of it are dropped
+    def __init__(self, settings: Settings, store: StateStore = None, sources: list = None):
+        self.store = store
+        self.scheduler = poll_scheduler
+        self.region_ids = set(settings.regions_to_monitor)
+        self.alert_region_ids = set()
+        self.regions = create_regions()
+        self.matcher = AlertMatcher(self.regions)
+        self.lock = threading.Lock()
+        self.source_stats = SourceStatsTable()
+        # (source, region id) -> transition that source has already been credited for
+        self.confirmed = {}
+        # Set after the first successful poll of any source
+        self.ready = threading.Event()
+        if sources is None:
+            sources = [
+                TelegramAlertSource(channel.name, self.matcher, self.scheduler, channel.polling_interval, channel.min_polling_interval,
+                                    channel.backoff_polling_interval)
+                for channel in settings.alert_channels
+            ]
+            sources += [JsonApiAlertSource.from_config(config, self.regions) for config in settings.alert_api_sources]
+        self.sources = sources
+        if self.store is not None:
+            self._restore()
+
+    def _restore(self):
+        state = self.store.restored
+        for region in self.regions:
+            if region.id in state.regions:
+                region.alert, region.changed = state.regions[region.id]
+        self.alert_region_ids = {region.id for region in self.regions if region.alert and region.id in self.region_ids}
+        for source in self.sources:
+            source.restore(state)
+            source.set_alerting(bool(self.alert_region_ids))
+        logger.info(f"Restored alert state, alerting regions: {sorted(self.alert_region_ids)}")
+
+    def fuse(self, source, reports: List[AlertReport]):
+        now = datetime.now(timezone.utc)
+        with self.lock:
+            alerting = bool(self.alert_region_ids)
+            for report in reports:
+                region = report.region
+                changed = report.changed
+                key = (source.name, region.id)
+                if region.alert == report.alert:
+                    # Already known; credit the source once per transition with its lag behind the event
+                    if region.changed is not None and self.confirmed.get(key) != region.changed:
+                        self.confirmed[key] = region.changed
+                        lag = (now - region.changed).total_seconds()
+                        self.source_stats.add(source.name, lag=lag, duplicates=1)
+                        source_lag.labels(source.name).observe(lag)
+                        source_reports.labels(source.name, 'duplicate').inc()
+                    continue
+                if region.changed is not None and (changed is None or changed < region.changed):
+                    # A slower source still reports the state before the latest change. A report
+                    # without a timestamp counts as older than any timestamped one: stamping it with
+                    # the poll time would let a lagging API override a fresher channel post.
+                    self.source_stats.add(source.name, stale=1)
+                    source_reports.labels(source.name, 'stale').inc()
+                    continue
+
+                region.alert = report.alert
+                region.changed = changed
+                self.confirmed[key] = changed
+                lag = (now - report.changed).total_seconds() if report.changed else None
+                self.source_stats.add(source.name, lag=lag, won=1)
+                source_reports.labels(source.name, 'won').inc()
+                if lag is not None:
+                    source_lag.labels(source.name).observe(lag)
+                if self.store is not None:
+                    self.store.put_region(region.id, report.alert, changed)
+                logger.debug("Alert status for %s is %s, first reported by %s", region.name, report.alert, source.name)
+                if region.id in self.region_ids:
+                    logger.info(f"{'Alert' if report.alert else 'Clear'} for {region.name_en} first reported by {source.name}"
+                                + (f" {lag:.1f}s after it was posted" if lag is not None else ''))
+                    if report.alert:
+                        self.alert_region_ids.add(region.id)
+                        message_bus.publish("alert", region)
+                    else:
+                        self.alert_region_ids.discard(region.id)
+                        message_bus.publish("clear", region)
+            changed_alerting = bool(self.alert_region_ids) != alerting
+        if changed_alerting:
+            for each in self.sources:
+                each.set_alerting(bool(self.alert_region_ids))
+
+    def poll_source(self, source):
         while True:
+            source.wait()
             try:
-                messages = fetch_latest_messages(self.channel_name, newer_than=self.last_checked)
-                self.last_checked = datetime.utcnow().replace(tzinfo=timezone.utc)
-                for message in messages:
-                    # Parse the message to identify whether an alert is active for one of the predefined regions
-                    # Update the alert status and changed time for the corresponding region
-
-                    if "Повітряна тривога" in message.text:
-                        alert = True
-                    elif "Відбій" in message.text:
-                        alert = False
-                    else:
-                        continue
-
-                    for region in self.regions:
-                        if region.name in message.text:
-                            region.alert = alert
-                            region.changed = message.date
-                            logger.debug(f"Alert status for {region.name} is {alert}")
-                            if self.region_id == region.id:
-                                if alert:
-                                    message_bus.publish("alert", region)
-                                    self.alert = True
-                                else:
-                                    message_bus.publish("clear", region)
-                                    self.alert = False
-                            break
+                reports = source.poll()
+                self.source_stats.add(source.name, polls=1)
+                if not self.ready.is_set():
+                    logger.info(f"First alert poll completed by {source.name}")
+                    self.ready.set()
+                if reports:
+                    self.fuse(source, reports)
+                if self.store is not None:
+                    source.save(self.store)
             except Exception as e:
-                logger.error(f"Error checking for alerts: {e}")
+                self.source_stats.add(source.name, polls=1, errors=1)
+                source_reports.labels(source.name, 'error').inc()
+                logger.error(f"Error checking for alerts in {source.name}: {e}")
 
-            if self.alert:
-                time.sleep(self.backoff_interval)
-            else:
-                time.sleep(self.interval)
+    def log_stats(self):
+        for name, stats in sorted(self.source_stats.snapshot().items()):
+            logger.info(f"Alert source {name}: {stats.won} first reports, {stats.duplicates} duplicates, {stats.stale} stale, "
+                        f"{stats.errors}/{stats.polls} failed polls, lag avg {stats.lag_avg:.1f}s")
 
     def start(self):
-        logger.info("Starting alert monitor")
-        threading.Thread(target=self.check_alerts, daemon=True).start()
+        logger.info(f"Starting alert monitor with {len(self.sources)} sources")
+        for source in self.sources:
+            threading.Thread(target=self.poll_source, args=(source,), name=f'alert-{source.name}', daemon=True).start()
@@ -0,0 +1,200 @@
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import requests
+from telegram import ChannelCursor, RateLimitedError, fetch_new_messages
+from poll_scheduler import PollScheduler
+from state_store import StateStore, StoredState
+import app_logger
+
+logger = app_logger.get(__name__)
+
+TRUE_VALUES = frozenset({'true', '1', 'yes', 'active', 'alert', 'on'})
+
+
+@dataclass
+class AlertReport:
+    # One source's claim that a region entered (alert=True) or left an alert at `changed`
+    region: object
+    alert: bool
+    changed: Optional[datetime]
+
+
+class TelegramAlertSource:
+    # An alert channel on t.me, polled through the shared scheduler and request budget
+    def __init__(self, channel_name: str, matcher, scheduler: PollScheduler, interval: float, min_interval: float, backoff_interval: float):
+        self.name = channel_name
+        self.matcher = matcher
+        self.scheduler = scheduler
+        self.interval = interval
+        self.min_interval = min_interval
+        self.backoff_interval = backoff_interval
+        self.cursor = ChannelCursor()
+        self.scheduler.add(self.name, interval, min_interval, interval)
+
+    @property
+    def state_key(self) -> str:
+        return f"alert:{self.name}"
+
+    def restore(self, state: StoredState):
+        self.cursor.last_id = state.cursors.get(self.state_key)
+
+    def save(self, store: StateStore):
+        store.put_cursor(self.state_key, self.cursor.last_id)
+
+    def set_alerting(self, alerting: bool):
+        # While a monitored region is alerting only the clear is awaited, so the channel may back off further
+        if alerting:
+            self.scheduler.set_bounds(self.name, self.interval, self.backoff_interval)
+        else:
+            self.scheduler.set_bounds(self.name, self.min_interval, self.interval)
+
+    def wait(self):
+        names = [self.name]
+        while not self.scheduler.due(names):
+            time.sleep(max(0.05, self.scheduler.next_wakeup(names)))
+
+    def poll(self) -> List[AlertReport]:
+        try:
+            messages = fetch_new_messages(self.name, self.cursor, raise_errors=True)
+        except RateLimitedError as e:
+            self.scheduler.rate_limited(self.name, e.retry_after)
+            return []
+        except Exception:
+            self.scheduler.failed(self.name)
+            raise
+        self.scheduler.record(self.name, len(messages))
+        reports = []
+        for message in messages:
+            alert, regions = self.matcher.match(message.text)
+            if alert is not None:
+                reports.extend(AlertReport(region, alert, message.date) for region in regions)
+        return reports
+
+
+class JsonApiAlertSource:
+    # A JSON alert API returning the current state of every region, e.g.
+    # [{"region_id": 14, "alert": true, "changed": "2024-03-01T21:03:00+00:00"}, ...].
+    # Field names are configurable; regions match by id, Ukrainian or English name.
+    def __init__(self, name: str, url: str, regions: list, interval: float = 5.0, timeout: float = 5.0, headers: Dict[str, str] = None,
+                 items_key: str = None, region_field: str = 'region_id', alert_field: str = 'alert', changed_field: str = 'changed',
+                 session: requests.Session = None):
+        self.name = name
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+        self.headers = dict(headers or {})
+        self.items_key = items_key
+        self.region_field = region_field
+        self.alert_field = alert_field
+        self.changed_field = changed_field
+        self.session = session or requests.Session()
+        self.regions = {}
+        for region in regions:
+            for key in (str(region.id), region.name, region.name_en):
+                self.regions[key] = region
+        self.etag = None
+        self.next_poll = 0.0
+
+    @staticmethod
+    def from_config(config: dict, regions: list, session: requests.Session = None):
+        return JsonApiAlertSource(
+            name=config.get('name') or config['url'],
+            url=config['url'],
+            regions=regions,
+            interval=config.get('interval', 5.0),
+            timeout=config.get('timeout', 5.0),
+            headers=config.get('headers'),
+            items_key=config.get('items_key'),
+            region_field=config.get('region_field', 'region_id'),
+            alert_field=config.get('alert_field', 'alert'),
+            changed_field=config.get('changed_field', 'changed'),
+            session=session,
+        )
+
+    def restore(self, state: StoredState):
+        pass
+
+    def save(self, store: StateStore):
+        pass
+
+    def set_alerting(self, alerting: bool):
+        pass
+
+    def wait(self):
+        delay = self.next_poll - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_poll = time.monotonic() + self.interval
+
+    @staticmethod
+    def _parse_alert(value) -> bool:
+        if isinstance(value, str):
+            return value.strip().lower() in TRUE_VALUES
+        return bool(value)
+
+    @staticmethod
+    def _parse_changed(value) -> Optional[datetime]:
+        if not value:
+            return None
+        if isinstance(value, (int, float)):
+            return datetime.fromtimestamp(value, timezone.utc)
+        changed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return changed if changed.tzinfo else changed.replace(tzinfo=timezone.utc)
+
+    def poll(self) -> List[AlertReport]:
+        headers = dict(self.headers)
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        response = self.session.get(self.url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            return []
+        response.raise_for_status()
+        self.etag = response.headers.get('ETag')
+        data = response.json()
+        items = data[self.items_key] if self.items_key else data
+        reports = []
+        for item in items:
+            region = self.regions.get(str(item.get(self.region_field)))
+            if region is None:
+                continue
+            reports.append(AlertReport(region, self._parse_alert(item.get(self.alert_field)), self._parse_changed(item.get(self.changed_field))))
+        return reports
+
+
+@dataclass
+class SourceStats:
+    polls: int = 0
+    errors: int = 0
+    won: int = 0
+    duplicates: int = 0
+    stale: int = 0
+    lag_total: float = 0.0
+    lag_count: int = 0
+
+    @property
+    def lag_avg(self) -> float:
+        return self.lag_total / self.lag_count if self.lag_count else 0.0
+
+
+class SourceStatsTable:
+    def __init__(self):
+        self.stats: Dict[str, SourceStats] = {}
+        self.lock = threading.Lock()
+
+    def add(self, source_name: str, lag: Optional[float] = None, **counters):
+        with self.lock:
+            stats = self.stats.get(source_name)
+            if stats is None:
+                stats = self.stats[source_name] = SourceStats()
+            for name, value in counters.items():
+                setattr(stats, name, getattr(stats, name) + value)
+            if lag is not None:
+                stats.lag_total += lag
+                stats.lag_count += 1
+
+    def snapshot(self) -> Dict[str, SourceStats]:
+        with self.lock:
+            return {name: SourceStats(**vars(stats)) for name, stats in self.stats.items()}
@@ -1,16 +1,129 @@
+import atexit
+import gzip
+import json
 import logging
-from logging.handlers import TimedRotatingFileHandler
+import os
+import queue
+import shutil
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
-logging.basicConfig(
-    level=logging.WARNING,
-    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s"
-)
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+LOG_FILE = '/var/log/pyalerts/execution.log'
+QUEUE_SIZE = 10000
 
 log_level = logging.INFO
 loggers = []
-log_rotation_handler = TimedRotatingFileHandler('/var/log/pyalerts/execution.log', when="midnight", interval=1, backupCount=10, encoding='utf-8')
-log_rotation_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - %(message)s"))
-log_rotation_handler.setLevel(logging.DEBUG)
+persistent_names = set()
+
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line; fields passed with extra={...} are kept as keys
+    RESERVED = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in self.RESERVED)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _gzip_rotator(source, dest):
+    with open(source, 'rb') as source_file, gzip.open(dest, 'wb') as dest_file:
+        shutil.copyfileobj(source_file, dest_file)
+    os.remove(source)
+
+
+class CompressedRotatingFileHandler(RotatingFileHandler):
+    # Size-capped rotation; rotated files are gzipped by the writer thread
+    def __init__(self, filename, max_bytes, backup_count):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        self.namer = lambda name: name + '.gz'
+        self.rotator = _gzip_rotator
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    # Hands records to the writer thread as they are: message formatting happens
+    # there, and a full queue drops the record instead of stalling the caller
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class PersistentFilter(logging.Filter):
+    def filter(self, record):
+        return record.name in persistent_names
+
+
+class Lazy:
+    # Defers building an expensive log argument until a handler formats the record
+    __slots__ = ('function', 'args', 'kwargs')
+
+    def __init__(self, function, *args, **kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
+        return str(self.function(*self.args, **self.kwargs))
+
+
+def lazy(function, *args, **kwargs) -> Lazy:
+    return Lazy(function, *args, **kwargs)
+
+
+def _file_handler(log_file, log_format, max_bytes, backup_count):
+    handler = CompressedRotatingFileHandler(log_file, max_bytes, backup_count)
+    handler.setFormatter(JsonFormatter() if log_format == 'json' else logging.Formatter(LOG_FORMAT))
+    handler.addFilter(PersistentFilter())
+    return handler
+
+
+def _console_handler(log_format):
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if log_format == 'json' else logging.Formatter(LOG_FORMAT))
+    return handler
+
+
+log_queue = queue.Queue(QUEUE_SIZE)
+queue_handler = NonBlockingQueueHandler(log_queue)
+listener = QueueListener(log_queue, _console_handler('text'), _file_handler(LOG_FILE, 'text', 50 * 1024 * 1024, 10), respect_handler_level=True)
+logging.root.setLevel(logging.WARNING)
+logging.root.addHandler(queue_handler)
+listener.start()
+
+
+def _stop_listener():
+    # Flushes whatever is still queued and closes the files
+    if listener._thread is not None:
+        listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+atexit.register(_stop_listener)
+
+
+def configure(log_format: str = 'text', log_file: str = LOG_FILE, max_bytes: int = 50 * 1024 * 1024, backup_count: int = 10):
+    global listener
+    _stop_listener()
+    listener = QueueListener(log_queue, _console_handler(log_format), _file_handler(log_file, log_format, max_bytes, backup_count), respect_handler_level=True)
+    listener.start()
 
 
 def set_log_level(level):
@@ -31,7 +144,5 @@ def get(name):
 def get_persistent(name):
     logger = logging.getLogger(name)
     logger.setLevel(logging.DEBUG)
-    for handler in logger.handlers:
-        logger.removeHandler(handler)
-    logger.addHandler(log_rotation_handler)
+    persistent_names.add(name)
     return logger
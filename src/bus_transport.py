@@ -0,0 +1,321 @@
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from telegram import Message
+from alert_monitor import Region
+from ai_worker import AiAlert
+import app_logger
+import metrics
+
+logger = app_logger.get(__name__)
+
+transport_events = metrics.counter('pyalerts_transport_events_total', 'Bus events carried between processes', ['topic', 'direction'])
+
+HEADER = struct.Struct('!I')
+MAX_FRAME = 16 * 1024 * 1024
+PUBLISH = b'P'
+SUBSCRIBE = b'S'
+OUTBOX_SIZE = 10000
+
+
+def _encode_date(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _decode_date(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _encode(value):
+    # Bus payloads as single-key objects holding positional fields
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if isinstance(value, Message):
+        return {'M': [value.id, value.author, value.text, _encode_date(value.date)]}
+    if isinstance(value, Region):
+        return {'R': [value.id, value.name, value.name_en, value.alert, _encode_date(value.changed)]}
+    if isinstance(value, AiAlert):
+        # detected is a monotonic reading; it travels as wall-clock time and is mapped back on arrival
+        detected = time.time() - (time.monotonic() - value.detected) if value.detected is not None else None
+        return {'A': [value.alert, value.attacker, value.text, value.confidence, value.original_text, value.region_id, detected]}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    if isinstance(value, dict) and len(value) == 1:
+        (tag, fields), = value.items()
+        if tag == 'M':
+            id, author, text, date = fields
+            return Message(id=id, author=author, text=text, date=_decode_date(date))
+        if tag == 'R':
+            id, name, name_en, alert, changed = fields
+            return Region(id=id, name=name, name_en=name_en, alert=alert, changed=_decode_date(changed))
+        if tag == 'A':
+            alert, attacker, text, confidence, original_text, region_id, detected = fields
+            detected = time.monotonic() - (time.time() - detected) if detected is not None else None
+            return AiAlert(alert=alert, attacker=attacker, text=text, confidence=confidence, original_text=original_text,
+                           region_id=region_id, detected=detected)
+    return value
+
+
+def encode_event(topic: str, message) -> bytes:
+    payload = json.dumps(_encode(message), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return PUBLISH + topic.encode('utf-8') + b'\n' + payload
+
+
+def decode_event(frame: bytes):
+    topic, payload = frame[1:].split(b'\n', 1)
+    return topic.decode('utf-8'), _decode(json.loads(payload))
+
+
+def frame_topic(frame: bytes) -> str:
+    return frame[1:frame.index(b'\n')].decode('utf-8')
+
+
+def send_frame(sock: socket.socket, frame: bytes):
+    sock.sendall(HEADER.pack(len(frame)) + frame)
+
+
+def _read_exactly(stream, size) -> Optional[bytes]:
+    data = stream.read(size)
+    return data if data and len(data) == size else None
+
+
+def read_frame(stream) -> Optional[bytes]:
+    # stream is a buffered socket file; None means the peer closed the connection
+    header = _read_exactly(stream, HEADER.size)
+    if header is None:
+        return None
+    size, = HEADER.unpack(header)
+    if size > MAX_FRAME:
+        raise ValueError(f"Frame of {size} bytes exceeds the {MAX_FRAME} byte limit")
+    return _read_exactly(stream, size)
+
+
+class _Peer:
+    # A broker connection with its own outbox and writer thread, so one slow
+    # process never holds up delivery to the others
+    def __init__(self, sock: socket.socket, name: str):
+        self.sock = sock
+        self.name = name
+        self.topics = frozenset()
+        self.group = None
+        self.outbox = queue.Queue(OUTBOX_SIZE)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._write, name=f'broker-{name}', daemon=True)
+        self.thread.start()
+
+    def put(self, frame: bytes):
+        try:
+            self.outbox.put_nowait(frame)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f"Broker outbox for {self.name} is full, {self.dropped} events dropped")
+
+    def close(self):
+        self.outbox.put(None)
+
+    def _write(self):
+        while True:
+            frame = self.outbox.get()
+            if frame is None:
+                return
+            try:
+                send_frame(self.sock, frame)
+            except OSError as e:
+                logger.warning(f"Broker lost {self.name}: {e}")
+                return
+
+
+class BusBroker:
+    # Unix-socket broker: processes subscribe to topics, optionally as part of a
+    # group, and published frames are forwarded without being decoded. Every
+    # plain subscriber gets each event; a group gets it once, round-robin.
+
+    def __init__(self, path: str):
+        self.path = path
+        self.peers: List[_Peer] = []
+        self.lock = threading.Lock()
+        self.rotation: Dict[tuple, int] = {}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path):
+            os.remove(path)
+        self.server = socketserver.ThreadingUnixStreamServer(path, self._handler())
+        self.server.daemon_threads = True
+
+    def _handler(self):
+        broker = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                peer = _Peer(self.request, f"peer{id(self.request) % 10000}")
+                with broker.lock:
+                    broker.peers.append(peer)
+                try:
+                    while True:
+                        frame = read_frame(self.rfile)
+                        if frame is None:
+                            return
+                        if frame[:1] == SUBSCRIBE:
+                            subscription = json.loads(frame[1:])
+                            with broker.lock:
+                                peer.topics = frozenset(subscription['topics'])
+                                peer.group = subscription.get('group')
+                                peer.name = subscription.get('name') or peer.name
+                            logger.info(f"{peer.name} subscribed to {sorted(peer.topics)}" + (f" in group {peer.group}" if peer.group else ''))
+                        elif frame[:1] == PUBLISH:
+                            broker.route(frame, peer)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Broker connection {peer.name} failed: {e}")
+                finally:
+                    with broker.lock:
+                        broker.peers.remove(peer)
+                    peer.close()
+
+        return Handler
+
+    def route(self, frame: bytes, sender: _Peer):
+        topic = frame_topic(frame)
+        with self.lock:
+            targets = []
+            groups = {}
+            for peer in self.peers:
+                if peer is sender or topic not in peer.topics:
+                    continue
+                if peer.group is None:
+                    targets.append(peer)
+                else:
+                    groups.setdefault(peer.group, []).append(peer)
+            for group, members in groups.items():
+                index = self.rotation.get((group, topic), 0)
+                targets.append(members[index % len(members)])
+                self.rotation[(group, topic)] = index + 1
+        for peer in targets:
+            peer.put(frame)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='bus-broker', daemon=True).start()
+        logger.info(f"Bus broker listening on {self.path}")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class BusTransport:
+    # Connects a process's MessageBus to the broker: events published locally on
+    # `outgoing` topics are forwarded, and events on `incoming` topics from other
+    # processes are republished locally. Reconnects with backoff; events published
+    # while disconnected are kept in a bounded outbox.
+
+    def __init__(self, path: str, bus, outgoing: Iterable[str] = (), incoming: Iterable[str] = (), group: str = None,
+                 name: str = None, reconnect_delay: float = 0.5, max_reconnect_delay: float = 10.0):
+        self.path = path
+        self.bus = bus
+        self.outgoing = frozenset(outgoing)
+        self.incoming = frozenset(incoming)
+        self.group = group
+        self.name = name
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.outbox = queue.Queue(OUTBOX_SIZE)
+        self.dropped = 0
+        self.sock = None
+        self.connected = threading.Event()
+        self.stopped = threading.Event()
+
+    def send(self, topic: str, message):
+        # Called from MessageBus.publish; encoding and I/O happen on the writer thread
+        try:
+            self.outbox.put_nowait((topic, message))
+        except queue.Full:
+            self.dropped += 1
+            transport_events.labels(topic, 'dropped').inc()
+
+    def _connect(self) -> socket.socket:
+        delay = self.reconnect_delay
+        while not self.stopped.is_set():
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.path)
+                subscription = {'topics': sorted(self.incoming), 'group': self.group, 'name': self.name}
+                send_frame(sock, SUBSCRIBE + json.dumps(subscription).encode('utf-8'))
+                logger.info(f"Connected to bus broker at {self.path}")
+                return sock
+            except OSError as e:
+                logger.warning(f"Cannot connect to bus broker at {self.path}: {e}, retrying in {delay:.1f}s")
+                self.stopped.wait(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+        return None
+
+    def _read(self, sock: socket.socket):
+        stream = sock.makefile('rb')
+        try:
+            while True:
+                frame = read_frame(stream)
+                if frame is None:
+                    break
+                try:
+                    topic, message = decode_event(frame)
+                except (ValueError, TypeError, KeyError) as e:
+                    logger.error(f"Dropping undecodable bus event: {e}")
+                    continue
+                transport_events.labels(topic, 'in').inc()
+                self.bus.publish_local(topic, message)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Bus broker connection lost: {e}")
+        finally:
+            stream.close()
+
+    def _run(self):
+        pending = None
+        while not self.stopped.is_set():
+            sock = self._connect()
+            if sock is None:
+                return
+            self.sock = sock
+            reader = threading.Thread(target=self._read, args=(sock,), name='bus-transport-reader', daemon=True)
+            reader.start()
+            self.connected.set()
+            try:
+                while reader.is_alive():
+                    if pending is None:
+                        try:
+                            pending = self.outbox.get(timeout=0.5)
+                        except queue.Empty:
+                            continue
+                    topic, message = pending
+                    try:
+                        frame = encode_event(topic, message)
+                    except (TypeError, ValueError) as e:
+                        logger.error(f"Dropping unencodable {topic} event: {e}")
+                        pending = None
+                        continue
+                    send_frame(sock, frame)
+                    transport_events.labels(topic, 'out').inc()
+                    pending = None
+            except OSError as e:
+                logger.warning(f"Bus broker connection lost while sending: {e}")
+            self.connected.clear()
+            sock.close()
+
+    def start(self):
+        self.bus.set_transport(self)
+        threading.Thread(target=self._run, name='bus-transport', daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.sock is not None:
+            self.sock.close()
@@ -0,0 +1,54 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+import telegram
+from telegram import ChannelCursor, Message, RateLimitedError, fetch_new_messages
+from poll_scheduler import PollScheduler
+import app_logger
+
+logger = app_logger.get(__name__)
+
+
+class ChannelFetcher:
+    def __init__(self, max_workers: int = 8, per_host_limit: int = 4, scheduler: PollScheduler = None):
+        self.scheduler = scheduler
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='channel-fetcher')
+        self.per_host_limit = per_host_limit
+        self.host_semaphores = {}
+        self.host_semaphores_lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(max_workers, per_host_limit))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _host_semaphore(self, host):
+        with self.host_semaphores_lock:
+            if host not in self.host_semaphores:
+                self.host_semaphores[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self.host_semaphores[host]
+
+    def _fetch_channel(self, channel_name, cursor, newer_than, stop_list) -> List[Message]:
+        host = urlparse(telegram.channel_url(channel_name)).netloc
+        with self._host_semaphore(host):
+            try:
+                messages = fetch_new_messages(channel_name, cursor, newer_than=newer_than, stop_list=stop_list, http=self.session)
+            except RateLimitedError as e:
+                if self.scheduler is None:
+                    logger.warning(str(e))
+                else:
+                    self.scheduler.rate_limited(channel_name, e.retry_after)
+                return []
+        if self.scheduler is not None:
+            self.scheduler.record(channel_name, len(messages))
+        return messages
+
+    def fetch_all(self, cursors: Dict[str, ChannelCursor], newer_than: datetime = None, stop_list: List[str] = []) -> Dict[str, List[Message]]:
+        futures = {
+            channel_name: self.executor.submit(self._fetch_channel, channel_name, cursor, newer_than, stop_list)
+            for channel_name, cursor in cursors.items()
+        }
+        return {channel_name: future.result() for channel_name, future in futures.items()}
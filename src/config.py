@@ -1,24 +1,98 @@
 from dataclasses import dataclass
-from typing import List
+from typing import Dict, List, Optional
 import yaml
 
 
 @dataclass
 class Settings:
     alert_channel: str
+    alert_channels: List['AlertChannelConfig']
+    alert_api_sources: List[dict]
     alert_polling_interval: int
     alert_backoff_polling_interval: int
+    alert_min_polling_interval: float
     info_channels: List[str]
     info_polling_interval: int
+    info_min_polling_interval: float
+    info_max_polling_interval: float
+    info_fetch_workers: int
+    telegram_host_concurrency: int
+    telegram_base_url: str
+    telegram_parser: str
+    telegram_rate_limit: float
+    telegram_rate_burst: float
+    poll_jitter: float
     timezone_name: str
     region_to_monitor: int
+    regions_to_monitor: List[int]
+    ai_per_region: bool
     analyzer_prompt: str
+    ai_model: str
+    ai_max_tokens: int
+    ai_streaming: bool
+    ai_json_mode: bool
+    ai_workers: int
+    ai_history_size: int
+    ai_history_token_budget: int
+    ai_history_trim_ratio: float
+    openai_base_url: Optional[str]
+    ai_deadline: float
+    ai_hedging: bool
+    ai_hedge_delay: Optional[float]
+    ai_hedge_percentile: float
+    ai_hedge_min_delay: float
+    ai_fallback_model: Optional[str]
+    ai_fallback_base_url: Optional[str]
+    ai_max_concurrent_requests: int
+    ai_cache_size: int
+    ai_cache_ttl: int
+    ai_near_duplicate_threshold: Optional[float]
+    ai_gate_threshold: float
+    ai_instant_alert_threshold: Optional[float]
+    pre_classifier_rules: List[dict]
     webhooks: List['WebhookConfig']
+    webhook_outbox_size: int
+    webhook_max_retries: int
+    webhook_retry_backoff: float
+    webhook_breaker_threshold: int
+    webhook_breaker_reset: float
     firebase_credentials_path: str
+    token_sweep_interval: int
+    push_workers: int
+    push_max_retries: int
+    push_retry_backoff: float
+    push_delivery: str
+    fcm_topic_prefix: str
+    message_bus_topics: Dict[str, dict]
+    bus_socket: str
+    health_file: str
+    health_interval: float
+    startup_timeout: float
+    metrics_port: Optional[int]
+    metrics_host: str
+    profiler_enabled: bool
+    profiler_interval: float
     log_level: str
+    log_format: str
+    log_file: str
+    log_max_bytes: int
+    log_backup_count: int
+    state_path: str
+    state_flush_interval: float
+    alert_dedup_window: int
+    alert_coalesce_window: float
+    alert_escalation_step: float
     stop_list: List[str]
 
 
+@dataclass
+class AlertChannelConfig:
+    name: str
+    polling_interval: float
+    min_polling_interval: float
+    backoff_polling_interval: float
+
+
 @dataclass
 class WebhookConfig:
     name: str
@@ -26,6 +100,8 @@ class WebhookConfig:
     url: str
     query_args: List['QueryArg']
     payload: dict
+    events: List[str]
+    timeout: float
 
 
 @dataclass
@@ -43,28 +119,108 @@ def load_settings(file_path):
 def parse_settings(config):
     settings = Settings(
         alert_channel=config.get('alert_channel', ''),
+        alert_channels=[parse_alert_channel(channel, config) for channel in config.get('alert_channels', [config['alert_channel']] if config.get('alert_channel') else [])],
+        alert_api_sources=config.get('alert_api_sources', []),
         alert_polling_interval=config.get('alert_polling_interval', 5),
         alert_backoff_polling_interval=config.get('alert_backoff_polling_interval', 60),
+        alert_min_polling_interval=config.get('alert_min_polling_interval', 2),
         info_channels=config.get('info_channels', []),
         info_polling_interval=config.get('info_polling_interval', 5),
+        info_min_polling_interval=config.get('info_min_polling_interval', 2),
+        info_max_polling_interval=config.get('info_max_polling_interval', 60),
+        info_fetch_workers=config.get('info_fetch_workers', 8),
+        telegram_host_concurrency=config.get('telegram_host_concurrency', 4),
+        telegram_base_url=config.get('telegram_base_url', 'https://t.me'),
+        telegram_parser=config.get('telegram_parser', 'stream'),
+        telegram_rate_limit=config.get('telegram_rate_limit', 4.0),
+        telegram_rate_burst=config.get('telegram_rate_burst', 8),
+        poll_jitter=config.get('poll_jitter', 0.1),
         timezone_name=config.get('timezone_name', 'Europe/Kyiv'),
         region_to_monitor=config.get('region_to_monitor', 14),
+        regions_to_monitor=config.get('regions_to_monitor', [config.get('region_to_monitor', 14)]),
+        ai_per_region=config.get('ai_per_region', False),
         analyzer_prompt=config.get('analyzer_prompt', ''),
+        ai_model=config.get('ai_model', 'gpt-3.5-turbo'),
+        ai_max_tokens=config.get('ai_max_tokens', 256),
+        ai_streaming=config.get('ai_streaming', True),
+        ai_json_mode=config.get('ai_json_mode', True),
+        ai_workers=config.get('ai_workers', 1),
+        ai_history_size=config.get('ai_history_size', 10),
+        ai_history_token_budget=config.get('ai_history_token_budget', 1500),
+        ai_history_trim_ratio=config.get('ai_history_trim_ratio', 0.75),
+        openai_base_url=config.get('openai_base_url'),
+        ai_deadline=config.get('ai_deadline', 20.0),
+        ai_hedging=config.get('ai_hedging', True),
+        ai_hedge_delay=config.get('ai_hedge_delay'),
+        ai_hedge_percentile=config.get('ai_hedge_percentile', 0.95),
+        ai_hedge_min_delay=config.get('ai_hedge_min_delay', 0.5),
+        ai_fallback_model=config.get('ai_fallback_model'),
+        ai_fallback_base_url=config.get('ai_fallback_base_url'),
+        ai_max_concurrent_requests=config.get('ai_max_concurrent_requests', 4),
+        ai_cache_size=config.get('ai_cache_size', 4096),
+        ai_cache_ttl=config.get('ai_cache_ttl', 1800),
+        ai_near_duplicate_threshold=config.get('ai_near_duplicate_threshold', 0.8),
+        ai_gate_threshold=config.get('ai_gate_threshold', 0.3),
+        ai_instant_alert_threshold=config.get('ai_instant_alert_threshold', 0.85),
+        pre_classifier_rules=config.get('pre_classifier_rules', []),
         webhooks=[parse_webhook(webhook) for webhook in config.get('webhooks', [])],
+        webhook_outbox_size=config.get('webhook_outbox_size', 100),
+        webhook_max_retries=config.get('webhook_max_retries', 3),
+        webhook_retry_backoff=config.get('webhook_retry_backoff', 0.5),
+        webhook_breaker_threshold=config.get('webhook_breaker_threshold', 5),
+        webhook_breaker_reset=config.get('webhook_breaker_reset', 60),
         firebase_credentials_path=config.get('firebase_credentials_path', '/etc/pyalerts/account.json'),
+        token_sweep_interval=config.get('token_sweep_interval', 3600),
+        push_workers=config.get('push_workers', 8),
+        push_max_retries=config.get('push_max_retries', 3),
+        push_retry_backoff=config.get('push_retry_backoff', 0.5),
+        push_delivery=config.get('push_delivery', 'tokens'),
+        fcm_topic_prefix=config.get('fcm_topic_prefix', 'region-'),
+        message_bus_topics=config.get('message_bus_topics', {}),
+        bus_socket=config.get('bus_socket', '/run/pyalerts/bus.sock'),
+        health_file=config.get('health_file', '/run/pyalerts/health.json'),
+        health_interval=config.get('health_interval', 5.0),
+        startup_timeout=config.get('startup_timeout', 30.0),
+        metrics_port=config.get('metrics_port', 9108),
+        metrics_host=config.get('metrics_host', '127.0.0.1'),
+        profiler_enabled=config.get('profiler_enabled', False),
+        profiler_interval=config.get('profiler_interval', 0.01),
         log_level=config.get('log_level', 'INFO'),
+        log_format=config.get('log_format', 'text'),
+        log_file=config.get('log_file', '/var/log/pyalerts/execution.log'),
+        log_max_bytes=config.get('log_max_bytes', 50 * 1024 * 1024),
+        log_backup_count=config.get('log_backup_count', 10),
+        state_path=config.get('state_path', '/var/lib/pyalerts/state.db'),
+        state_flush_interval=config.get('state_flush_interval', 1.0),
+        alert_dedup_window=config.get('alert_dedup_window', 300),
+        alert_coalesce_window=config.get('alert_coalesce_window', 120),
+        alert_escalation_step=config.get('alert_escalation_step', 0.1),
         stop_list=config.get('stop_list', []),
     )
     return settings
 
 
+def parse_alert_channel(channel, config):
+    # Entries are channel names or mappings that override the alert_*polling_interval defaults
+    if isinstance(channel, str):
+        channel = {'name': channel}
+    return AlertChannelConfig(
+        name=channel.get('name', ''),
+        polling_interval=channel.get('polling_interval', config.get('alert_polling_interval', 5)),
+        min_polling_interval=channel.get('min_polling_interval', config.get('alert_min_polling_interval', 2)),
+        backoff_polling_interval=channel.get('backoff_polling_interval', config.get('alert_backoff_polling_interval', 60)),
+    )
+
+
 def parse_webhook(webhook):
     return WebhookConfig(
         name=webhook.get('name', ''),
         method=webhook.get('method', ''),
         url=webhook.get('url', ''),
         query_args=[parse_query_arg(arg) for arg in webhook.get('query_args', [])],
-        payload=webhook.get('payload', {})
+        payload=webhook.get('payload', {}),
+        events=webhook.get('events', ['ai_alert', 'ai_alert_update', 'alert', 'clear']),
+        timeout=webhook.get('timeout', 5.0),
     )
 
 
@@ -0,0 +1,77 @@
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+# No app_logger here: the check command below runs on every health probe and must stay cheap
+
+STARTING = 'starting'
+READY = 'ready'
+STOPPING = 'stopping'
+
+
+class HealthFile:
+    # Process state for container health checks. Liveness is the file being rewritten
+    # every health_interval seconds; readiness is every watched component having set
+    # its `ready` event, e.g. AlertMonitor after its first successful poll.
+    def __init__(self, path: str, role: str, started: float = None):
+        self.path = path
+        self.role = role
+        self.started = started or time.time()
+        self.components: Dict[str, List] = {}
+        self.ready_at = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def watch(self, component):
+        # Components without a ready event are ready once started
+        event = getattr(component, 'ready', None)
+        self.components.setdefault(type(component).__name__, []).append(event)
+
+    def component_states(self) -> Dict[str, bool]:
+        return {name: all(event is None or event.is_set() for event in events) for name, events in self.components.items()}
+
+    def write(self, stopping: bool = False) -> str:
+        components = self.component_states()
+        ready = all(components.values())
+        if ready and self.ready_at is None:
+            self.ready_at = time.time()
+        state = {
+            'role': self.role,
+            'pid': os.getpid(),
+            'status': STOPPING if stopping else READY if ready else STARTING,
+            'started': self.started,
+            'updated': time.time(),
+            'ready_after': self.ready_at - self.started if self.ready_at is not None else None,
+            'components': components,
+        }
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w') as file:
+            json.dump(state, file)
+        os.replace(temporary, self.path)
+        return state['status']
+
+
+def check(path: str, max_age: float, require_ready: bool) -> bool:
+    try:
+        with open(path) as file:
+            state = json.load(file)
+    except (OSError, ValueError):
+        return False
+    if time.time() - state['updated'] > max_age:
+        return False
+    return state['status'] == READY or not require_ready and state['status'] == STARTING
+
+
+if __name__ == '__main__':
+    # Health check command: exits 0 while the process is live (and with --ready, ready)
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Check a pyalerts health file')
+    parser.add_argument('path', type=str, nargs='?', default='/run/pyalerts/health.json')
+    parser.add_argument('--max-age', type=float, default=30.0, help='Seconds after which a stale file means the process is hung')
+    parser.add_argument('--ready', action='store_true', help='Also require every component to be ready')
+    args = parser.parse_args()
+    sys.exit(0 if check(args.path, args.max_age, args.ready) else 1)
@@ -1,7 +1,10 @@
 import threading
-import time
-from datetime import timedelta, timezone, datetime
-from telegram import fetch_latest_messages
+from datetime import datetime, timedelta, timezone
+import telegram
+from telegram import ChannelCursor
+from channel_fetcher import ChannelFetcher
+from poll_scheduler import poll_scheduler
+from state_store import StateStore
 from message_bus import message_bus
 from config import Settings
 import app_logger
@@ -10,44 +13,91 @@ logger = app_logger.get(__name__)
 
 
 class InfoMonitor:
-    def __init__(self, settings: Settings):
+    def __init__(self, settings: Settings, store: StateStore = None):
         self.channel_names = settings.info_channels
+        self.store = store
         self.interval = settings.info_polling_interval
         self.stop_list = settings.stop_list
-        self.channel_last_fetched = {channel_name: None for channel_name in self.channel_names}
+        self.channel_cursors = {channel_name: ChannelCursor() for channel_name in self.channel_names}
+        self.newer_than = None
+        self.alert_region_ids = set()
         self.sync_event = threading.Event()
+        self.wake_event = threading.Event()
+        self.scheduler = poll_scheduler
+        for channel_name in self.channel_names:
+            self.scheduler.add(channel_name, self.interval, settings.info_min_polling_interval, settings.info_max_polling_interval)
+        self.fetcher = ChannelFetcher(max_workers=settings.info_fetch_workers, per_host_limit=settings.telegram_host_concurrency, scheduler=self.scheduler)
+        if self.store is not None:
+            self._restore()
+
+    def _restore(self):
+        state = self.store.restored
+        values = state.values.get('info_monitor')
+        if not values or not values.get('alert_region_ids'):
+            return
+        self.alert_region_ids = set(values['alert_region_ids'])
+        self.newer_than = datetime.fromisoformat(values['newer_than']) if values.get('newer_than') else None
+        for channel_name in self.channel_names:
+            last_id = state.cursors.get(f"info:{channel_name}")
+            if last_id is not None:
+                self.channel_cursors[channel_name] = ChannelCursor(last_id=last_id)
+        self.sync_event.set()
+        logger.info(f'Resuming message fetching for alerts in {len(self.alert_region_ids)} regions')
+
+    def _save_state(self):
+        if self.store is not None:
+            self.store.put_value('info_monitor', {
+                'alert_region_ids': sorted(self.alert_region_ids),
+                'newer_than': self.newer_than.isoformat() if self.newer_than else None,
+            })
 
     def start(self):
         message_bus.subscribe('alert', self.process_alert_event)
         message_bus.subscribe('clear', self.process_clear_event)
-        threading.Thread(target=self.fetch_messages_thread, daemon=True).start()
+        threading.Thread(target=self.fetch_messages_thread, name='info-monitor', daemon=True).start()
         logger.info('InfoMonitor started')
 
     def process_alert_event(self, region):
-        for channel_name in self.channel_names:
-            self.channel_last_fetched[channel_name] = region.changed - timedelta(minutes=5)
+        if not self.alert_region_ids:
+            self.channel_cursors = {channel_name: ChannelCursor() for channel_name in self.channel_names}
+            # A source without timestamps leaves changed unset; the alert was only just seen then
+            self.newer_than = (region.changed or datetime.now(timezone.utc)) - timedelta(minutes=5)
+            self.scheduler.reset(self.channel_names, self.interval)
+        self.alert_region_ids.add(region.id)
+        self._save_state()
         self.sync_event.set()
-        logger.info('Alert event received, fetching new messages')
+        self.wake_event.set()
+        logger.info(f'Alert event received for {region.name_en}, fetching new messages')
 
-    def process_clear_event(self, _):
+    def process_clear_event(self, region):
+        self.alert_region_ids.discard(region.id)
+        self._save_state()
+        if self.alert_region_ids:
+            logger.info(f'Clear event received for {region.name_en}, alerts still active in {len(self.alert_region_ids)} regions')
+            return
         self.sync_event.clear()
         logger.info('Clear event received, stopping fetching new messages')
 
     def fetch_messages_thread(self):
         while self.sync_event.wait():
+            due = self.scheduler.due(self.channel_names)
+            if not due:
+                self.wake_event.wait(self.scheduler.next_wakeup(self.channel_names))
+                self.wake_event.clear()
+                continue
+            logger.debug('Fetching messages from %d of %d channels', len(due), len(self.channel_names))
+            cursors = {channel_name: self.channel_cursors[channel_name] for channel_name in due}
+            channel_messages = self.fetcher.fetch_all(cursors, newer_than=self.newer_than, stop_list=self.stop_list)
             messages = []
-            for channel_name in self.channel_names:
-                logger.debug(f'Fetching messages from {channel_name}')
-                channel_messages = fetch_latest_messages(channel_name, newer_than=self.channel_last_fetched[channel_name], stop_list=self.stop_list)
-                self.channel_last_fetched[channel_name] = datetime.utcnow().replace(tzinfo=timezone.utc)
-                if len(channel_messages) > 0:
-                    logger.info(f'Fetched {len(channel_messages)} messages from {channel_name}')
-                messages.extend(channel_messages)
-                time.sleep(0.3)
+            for channel_name, fetched in channel_messages.items():
+                if len(fetched) > 0:
+                    logger.info(f'Fetched {len(fetched)} messages from {channel_name}')
+                    if self.store is not None:
+                        self.store.put_cursor(f"info:{channel_name}", cursors[channel_name].last_id)
+                messages.extend(fetched)
+            logger.debug('Fetch stats: %s', telegram.fetch_stats)
 
             sorted_messages = sorted(messages, key=lambda m: m.date)
 
             if sorted_messages:
                 message_bus.publish('new_messages', sorted_messages)
-
-            time.sleep(self.interval)
@@ -0,0 +1,74 @@
+import json
+
+WHITESPACE = ' \t\n\r'
+
+
+def _skip_whitespace(buffer, position):
+    while position < len(buffer) and buffer[position] in WHITESPACE:
+        position += 1
+    return position
+
+
+class JsonFieldStream:
+    # Incremental parser for the top-level fields of a streamed JSON object.
+    # A field is reported as soon as its value is complete; a number or literal is
+    # held back until a delimiter follows it, since more of it may still arrive.
+
+    def __init__(self):
+        self.buffer = ''
+        self.position = 0
+        self.started = False
+        self.finished = False
+        self.fields = {}
+        self.decoder = json.JSONDecoder()
+
+    def feed(self, chunk: str) -> dict:
+        self.buffer += chunk
+        completed = {}
+        while not self.finished:
+            if not self.started:
+                start = self.buffer.find('{', self.position)
+                if start < 0:
+                    self.position = len(self.buffer)
+                    break
+                self.started = True
+                self.position = start + 1
+                continue
+
+            position = _skip_whitespace(self.buffer, self.position)
+            if position >= len(self.buffer):
+                break
+            if self.buffer[position] == '}':
+                self.finished = True
+                self.position = position + 1
+                break
+            if self.buffer[position] == ',':
+                self.position = position + 1
+                continue
+
+            try:
+                key, key_end = self.decoder.raw_decode(self.buffer, position)
+            except ValueError:
+                break
+            colon = _skip_whitespace(self.buffer, key_end)
+            if colon >= len(self.buffer):
+                break
+            if self.buffer[colon] != ':':
+                raise ValueError(f"Expected ':' at position {colon}")
+            value_start = _skip_whitespace(self.buffer, colon + 1)
+            if value_start >= len(self.buffer):
+                break
+            try:
+                value, value_end = self.decoder.raw_decode(self.buffer, value_start)
+            except ValueError:
+                break
+            if not isinstance(value, (str, list, dict)):
+                # A number or literal is complete only once a delimiter follows it:
+                # '0.' decodes as 0 and 'tru' not at all until the rest arrives
+                if value_end >= len(self.buffer) or self.buffer[value_end] not in WHITESPACE + ',}':
+                    break
+
+            self.fields[key] = value
+            completed[key] = value
+            self.position = value_end
+        return completed
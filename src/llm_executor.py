@@ -0,0 +1,175 @@
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence
+from config import Settings
+import app_logger
+import metrics
+
+logger = app_logger.get(__name__)
+
+llm_attempts = metrics.counter('pyalerts_llm_attempts_total', 'LLM request attempts by backend and outcome', ['backend', 'outcome'])
+llm_hedge_delay = metrics.gauge('pyalerts_llm_hedge_delay_seconds', 'Current delay before a hedged LLM request is sent')
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Cancelled(Exception):
+    # Raised by an attempt that noticed it lost to another one
+    pass
+
+
+@dataclass(frozen=True)
+class LlmBackend:
+    name: str
+    model: str
+    base_url: Optional[str]
+
+
+class LatencyWindow:
+    # Recent primary request latencies. A primary that lost to a hedge is recorded when
+    # its own request ends, so hedging does not hide the slow tail; a primary that
+    # failed is left out.
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.samples = deque(maxlen=size)
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class _Attempt:
+    __slots__ = ('index', 'backend', 'started', 'cancelled', 'done')
+
+    def __init__(self, index: int, backend: LlmBackend):
+        self.index = index
+        self.backend = backend
+        self.started = time.monotonic()
+        self.cancelled = threading.Event()
+        self.done = False
+
+
+class HedgedExecutor:
+    # Runs an LLM call against a deadline. When the primary attempt has not answered
+    # after the hedge delay (by default the primary's p95 latency), or fails, a second
+    # attempt goes to the next backend: a fallback model or endpoint, or the primary
+    # again. The first valid response wins and the other attempt is cancelled.
+    # At most max_concurrent attempts run at once; a hedge that finds no free slot is
+    # skipped rather than queued, so hedging never adds load when all slots are busy.
+    # A cancelled attempt keeps its slot until its thread returns: a blocking request
+    # cannot be interrupted and still counts against the provider until its timeout.
+
+    def __init__(self, deadline: float = 20.0, hedge_delay: Optional[float] = None, hedge_percentile: float = 0.95,
+                 min_hedge_delay: float = 0.5, max_concurrent: int = 4, hedging: bool = True):
+        self.deadline = deadline
+        self.fixed_hedge_delay = hedge_delay
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.hedging = hedging
+        self.latencies = LatencyWindow()
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+
+    @staticmethod
+    def from_settings(settings: Settings):
+        return HedgedExecutor(
+            deadline=settings.ai_deadline,
+            hedge_delay=settings.ai_hedge_delay,
+            hedge_percentile=settings.ai_hedge_percentile,
+            min_hedge_delay=settings.ai_hedge_min_delay,
+            max_concurrent=settings.ai_max_concurrent_requests,
+            hedging=settings.ai_hedging,
+        )
+
+    def hedge_delay(self) -> float:
+        if self.fixed_hedge_delay is not None:
+            return self.fixed_hedge_delay
+        # Until enough samples exist, hedge only calls that are clearly slow
+        percentile = self.latencies.percentile(self.hedge_percentile)
+        delay = max(self.min_hedge_delay, percentile if percentile is not None else self.deadline / 4)
+        llm_hedge_delay.set(delay)
+        return delay
+
+    def _run(self, attempt: _Attempt, call: Callable, deadline_at: float, outcomes: queue.Queue):
+        try:
+            result = call(attempt.backend, attempt.cancelled, max(0.1, deadline_at - time.monotonic()))
+            error = None
+        except Exception as e:
+            result, error = None, e
+        finally:
+            self.slots.release()
+        if attempt.index == 0 and (error is None or isinstance(error, Cancelled)):
+            self.latencies.add(time.monotonic() - attempt.started)
+        outcomes.put((attempt, result, error))
+
+    def _launch(self, attempts: List[_Attempt], backend: LlmBackend, call: Callable, deadline_at: float, outcomes: queue.Queue, timeout: Optional[float]) -> bool:
+        # timeout None means do not wait for a slot at all
+        acquired = self.slots.acquire(timeout=timeout) if timeout is not None else self.slots.acquire(blocking=False)
+        if not acquired:
+            return False
+        attempt = _Attempt(len(attempts), backend)
+        attempts.append(attempt)
+        threading.Thread(target=self._run, args=(attempt, call, deadline_at, outcomes), name=f'llm-{backend.name}', daemon=True).start()
+        return True
+
+    def call(self, call: Callable, backends: Sequence[LlmBackend]):
+        # call(backend, cancelled, timeout) performs one attempt and returns a parsed,
+        # valid result or raises; it should give up when `cancelled` is set
+        started = time.monotonic()
+        deadline_at = started + self.deadline
+        outcomes = queue.Queue()
+        attempts: List[_Attempt] = []
+        if not self._launch(attempts, backends[0], call, deadline_at, outcomes, timeout=self.deadline):
+            raise DeadlineExceeded(f"No free LLM request slot within {self.deadline:g}s")
+        backup = backends[1] if len(backends) > 1 else backends[0]
+        hedged = not self.hedging
+        hedge_at = started + self.hedge_delay()
+        while True:
+            wait_until = deadline_at if hedged else min(hedge_at, deadline_at)
+            try:
+                attempt, result, error = outcomes.get(timeout=max(0.0, wait_until - time.monotonic()))
+            except queue.Empty:
+                if time.monotonic() >= deadline_at:
+                    self._finish(attempts, None)
+                    raise DeadlineExceeded(f"No valid LLM response within {self.deadline:g}s")
+                hedged = True
+                if self._launch(attempts, backup, call, deadline_at, outcomes, timeout=None):
+                    logger.debug("Hedging LLM call to %s after %.2fs", backup.name, time.monotonic() - started)
+                else:
+                    llm_attempts.labels(backup.name, 'skipped').inc()
+                continue
+
+            attempt.done = True
+            if error is None:
+                llm_attempts.labels(attempt.backend.name, 'won').inc()
+                self._finish(attempts, attempt)
+                return result
+            if not isinstance(error, Cancelled):
+                llm_attempts.labels(attempt.backend.name, 'failed').inc()
+                logger.warning(f"LLM request to {attempt.backend.name} failed: {error}")
+            if not hedged:
+                # A failed primary is retried on the backup right away
+                hedged = True
+                if self._launch(attempts, backup, call, deadline_at, outcomes, timeout=max(0.0, deadline_at - time.monotonic())):
+                    continue
+            if all(each.done for each in attempts):
+                raise error
+
+    def _finish(self, attempts: List[_Attempt], winner: Optional[_Attempt]):
+        for attempt in attempts:
+            if attempt is winner or attempt.done:
+                continue
+            attempt.cancelled.set()
+            llm_attempts.labels(attempt.backend.name, 'cancelled').inc()
@@ -1,41 +1,193 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
 from datetime import datetime, timezone
+import os
+import signal
+import socket
+import threading
 import time
 from message_bus import message_bus
 from config import load_settings
-from alert_monitor import AlertMonitor, Region
+from alert_monitor import AlertMonitor, Region, create_regions
 from info_monitor import InfoMonitor
 from ai_worker import AiWorker
+from llm_executor import HedgedExecutor
+from alert_coalescer import AlertCoalescer
 from notifications_sender import NotificationsSender
+from webhook_sender import WebhookSender
+import telegram
+from metrics import MetricsServer
+from sampling_profiler import SamplingProfiler
+from poll_scheduler import poll_scheduler
+from state_store import StateStore
+from bus_transport import BusBroker, BusTransport
+from health import HealthFile, READY
 from telegram import Message
 import app_logger
 
 logger = app_logger.get(__name__)
 
+ROLES = ('all', 'broker', 'scraper', 'analyzer', 'sender')
+# Topics each role hands to other processes and the ones it needs from them
+ROLE_TOPICS = {
+    'scraper': (('alert', 'clear', 'new_messages'), ('alert', 'clear')),
+    'analyzer': (('ai_alert', 'ai_alert_update', 'push_alert'), ('alert', 'clear', 'new_messages')),
+    'sender': ((), ('ai_alert', 'ai_alert_update', 'push_alert', 'alert', 'clear')),
+}
+
+
+def role_path(path, name):
+    # Processes of a split deployment each keep their own log and state files
+    if name == 'all':
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}-{name}{extension}"
+
+
+def create_store(settings, name):
+    if not settings.state_path:
+        return None
+    return StateStore(role_path(settings.state_path, name), settings.state_flush_interval)
+
+
+def create_ai_workers(settings, store):
+    if not settings.ai_per_region:
+        return [AiWorker(settings, store=store)]
+    # One history and alert state per region; the thread pool is shared, and so are the
+    # LLM client, which openai_client creates once in the background, and the request
+    # executor, so that ai_max_concurrent_requests and the hedge delay are per process
+    regions = {region.id: region for region in create_regions()}
+    executor = ThreadPoolExecutor(max_workers=settings.ai_workers, thread_name_prefix='ai-worker')
+    llm = HedgedExecutor.from_settings(settings)
+    return [AiWorker(settings, store=store, region=regions[region_id], executor=executor, llm=llm) for region_id in settings.regions_to_monitor]
+
+
+def handle_signals():
+    # SIGTERM from docker stop or systemd, and Ctrl+C, end the main loop instead of killing the process
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        logger.info(f"Received {signal.Signals(signum).name}, shutting down")
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    return stopping
+
+
+def write_health(health, stopping):
+    try:
+        return health.write(stopping=stopping.is_set())
+    except OSError as e:
+        logger.warning(f"Cannot write health file {health.path}: {e}")
+        return None
+
+
+def parse_shard(value):
+    index, count = (int(part) for part in value.split('/'))
+    if not 0 <= index < count:
+        raise ValueError(f"Invalid shard {value}, expected INDEX/COUNT with 0 <= INDEX < COUNT")
+    return index, count
+
 
 if __name__ == '__main__':
+    started = time.time()
     import argparse
 
     parser = argparse.ArgumentParser(description='Process command line arguments')
     parser.add_argument('--settings', type=str, help='Path to settings.yaml file', default='/etc/pyalerts/settings.yml')
     parser.add_argument('--log-level', type=str, choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='INFO', help='Log level')
+    parser.add_argument('--role', type=str, choices=ROLES, default='all',
+                        help='Run every stage in this process (all), or one stage connected to the others through the bus broker')
+    parser.add_argument('--shard', type=parse_shard, default=(0, 1),
+                        help='For --role scraper: INDEX/COUNT of the info channels to poll; shard 0 also watches the alert channel')
+    parser.add_argument('--metrics-host', type=str, help='Address the metrics server listens on, overriding metrics_host (default 127.0.0.1)')
 
     args = parser.parse_args()
 
     settings_path = args.settings
     log_level = args.log_level
+    role = args.role
+    shard_index, shard_count = args.shard
     app_logger.set_log_level(log_level)
     settings = load_settings(settings_path)
+    name = f"scraper{shard_index}" if role == 'scraper' else role
+    # Scaled-out senders share a state file (SQLite handles concurrent writers) but not a rotating log
+    log_name = f"{name}-{socket.gethostname()}" if role == 'sender' else name
+    app_logger.configure(settings.log_format, role_path(settings.log_file, log_name), settings.log_max_bytes, settings.log_backup_count)
+    telegram.set_base_url(settings.telegram_base_url)
+    telegram.set_parser(settings.telegram_parser)
+    poll_scheduler.configure(settings.telegram_rate_limit, settings.telegram_rate_burst, settings.poll_jitter)
+    for topic, policy in settings.message_bus_topics.items():
+        message_bus.set_policy(topic, **policy)
+
+    if settings.metrics_port:
+        profiler = SamplingProfiler(settings.profiler_interval) if settings.profiler_enabled else None
+        MetricsServer(settings.metrics_port, args.metrics_host or settings.metrics_host, profiler=profiler).start()
 
-    alert_monitor = AlertMonitor(settings)
-    info_monitor = InfoMonitor(settings)
-    ai_worker = AiWorker(settings)
-    notifications_sender = NotificationsSender(settings)
+    stopping = handle_signals()
+    health = HealthFile(role_path(settings.health_file, log_name), name, started)
 
+    if role == 'broker':
+        broker = BusBroker(settings.bus_socket)
+        broker.start()
+        while not stopping.wait(settings.health_interval):
+            write_health(health, stopping)
+        write_health(health, stopping)
+        broker.stop()
+        raise SystemExit(0)
+
+    store = create_store(settings, name)
+    components = []
+    alert_monitor = None
+    if role in ('all', 'scraper'):
+        if shard_index == 0:
+            alert_monitor = AlertMonitor(settings, store=store)
+            components.append(alert_monitor)
+        components.append(InfoMonitor(replace(settings, info_channels=settings.info_channels[shard_index::shard_count]), store=store))
+    if role in ('all', 'analyzer'):
+        components.extend(create_ai_workers(settings, store))
+        components.append(AlertCoalescer(settings))
+    if role in ('all', 'sender'):
+        components.append(NotificationsSender(settings, store=store))
+        if settings.webhooks:
+            components.append(WebhookSender(settings))
+
+    if role != 'all':
+        outgoing, incoming = ROLE_TOPICS[role]
+        if role == 'scraper' and shard_index == 0:
+            incoming = ()
+        # Senders form a group so that each alert is pushed by exactly one of them
+        BusTransport(settings.bus_socket, message_bus, outgoing, incoming, group='sender' if role == 'sender' else None, name=name).start()
+
+    for component in components:
+        health.watch(component)
+    write_health(health, stopping)
+
+    # AlertMonitor is first in components and starts polling before the rest start;
+    # their slow clients (OpenAI, Firebase) are created in the background
+    if store is not None:
+        store.start()
     message_bus.start()
-    alert_monitor.start()
-    info_monitor.start()
-    ai_worker.start()
-    notifications_sender.start()
+    for component in components:
+        component.start()
+    logger.info(f"Started {name} in {time.time() - started:.2f}s")
+
+    status = None
+    next_stats = time.monotonic() + 60
+    while not stopping.wait(settings.health_interval):
+        previous, status = status, write_health(health, stopping)
+        if status == READY and previous != READY:
+            logger.info(f"Ready {health.ready_at - started:.2f}s after start")
+        if time.monotonic() >= next_stats:
+            next_stats += 60
+            message_bus.log_stats()
+            if alert_monitor is not None:
+                alert_monitor.log_stats()
 
-    while True:
-        time.sleep(1)
+    write_health(health, stopping)
+    for component in components:
+        if hasattr(component, 'stop'):
+            component.stop()
+    # The state store flushes and the log queue drains from their atexit handlers
+    logger.info(f"Stopped {name}")
@@ -1,61 +1,244 @@
+import heapq
+import inspect
+import itertools
 import threading
-import queue
+import time
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Optional
 import app_logger
+import metrics
 
 logger = app_logger.get(__name__)
 
+delivery_seconds = metrics.histogram('pyalerts_bus_delivery_seconds', 'Time from publish to delivery to a subscriber', ['topic'])
+queue_depth = metrics.gauge('pyalerts_bus_queue_depth', 'Messages waiting in subscriber queues', ['topic'])
+topic_messages = metrics.counter('pyalerts_bus_messages_total', 'Messages seen by the bus by outcome', ['topic', 'outcome'])
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+COALESCE = 'coalesce'
+OVERFLOW_POLICIES = (BLOCK, DROP_OLDEST, COALESCE)
+
+
+@dataclass
+class TopicPolicy:
+    priority: int = 5
+    max_size: int = 1000
+    overflow: str = BLOCK
+
+
+# Lower priority values are delivered first. alert and clear share a priority so
+# a subscriber always sees them in the order they were published.
+DEFAULT_POLICIES = {
+    'ai_alert': TopicPolicy(priority=0, overflow=BLOCK),
+    'push_alert': TopicPolicy(priority=0, overflow=BLOCK),
+    'alert': TopicPolicy(priority=0, overflow=BLOCK),
+    'clear': TopicPolicy(priority=0, overflow=BLOCK),
+    'ai_alert_update': TopicPolicy(priority=1, max_size=100, overflow=DROP_OLDEST),
+    'new_messages': TopicPolicy(priority=2, max_size=16, overflow=COALESCE),
+}
+
+
+def coalesce(pending, message):
+    # Lists of messages are merged; anything else is superseded by the latest value
+    if isinstance(pending, list) and isinstance(message, list):
+        return pending + message
+    return message
+
+
+@dataclass
+class TopicStats:
+    published: int = 0
+    delivered: int = 0
+    dropped: int = 0
+    coalesced: int = 0
+    errors: int = 0
+    depth: int = 0
+    max_depth: int = 0
+    latency_total: float = 0.0
+    latency_max: float = 0.0
+
+    @property
+    def latency_avg(self) -> float:
+        return self.latency_total / self.delivered if self.delivered else 0.0
+
+
+class _Entry:
+    __slots__ = ('priority', 'sequence', 'topic', 'message', 'callbacks', 'published', 'cancelled')
+
+    def __init__(self, priority, sequence, topic, message, callbacks, published):
+        self.priority = priority
+        self.sequence = sequence
+        self.topic = topic
+        self.message = message
+        self.callbacks = callbacks
+        self.published = published
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+class _Subscriber:
+    # Callbacks bound to the same object share one queue and one thread, so their
+    # relative order is preserved while a slow subscriber cannot stall the others
+
+    def __init__(self, bus, name):
+        self.bus = bus
+        self.name = name
+        self.callbacks = {}
+        self.heap = []
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name=f"bus-{self.name}", daemon=True)
+            self.thread.start()
+
+    def put(self, topic, message, policy: TopicPolicy, sequence, published):
+        with self.condition:
+            pending = self.pending.setdefault(topic, deque())
+            while len(pending) >= policy.max_size:
+                if policy.overflow == COALESCE:
+                    pending[-1].message = coalesce(pending[-1].message, message)
+                    self.bus._count(topic, coalesced=1)
+                    return
+                if policy.overflow == DROP_OLDEST:
+                    pending.popleft().cancelled = True
+                    self.bus._count(topic, dropped=1, depth=-1)
+                    continue
+                self.condition.wait()
+            entry = _Entry(policy.priority, sequence, topic, message, list(self.callbacks[topic]), published)
+            pending.append(entry)
+            heapq.heappush(self.heap, entry)
+            self.bus._count(topic, depth=1)
+            self.condition.notify_all()
+
+    def _take(self):
+        with self.condition:
+            while True:
+                while not self.heap:
+                    self.condition.wait()
+                entry = heapq.heappop(self.heap)
+                if entry.cancelled:
+                    continue
+                self.pending[entry.topic].popleft()
+                self.condition.notify_all()
+                return entry
+
+    def _run(self):
+        while True:
+            entry = self._take()
+            latency = time.monotonic() - entry.published
+            self.bus._count(entry.topic, delivered=1, depth=-1, latency=latency)
+            delivery_seconds.labels(entry.topic).observe(latency)
+            for callback in entry.callbacks:
+                try:
+                    callback(entry.message)
+                except Exception as e:
+                    self.bus._count(entry.topic, errors=1)
+                    logger.error(f"Error in {callback} handling {entry.topic}: {e}")
+
 
 class MessageBus:
-    def __init__(self):
+    def __init__(self, policies: Optional[Dict[str, TopicPolicy]] = None):
+        self.policies = dict(DEFAULT_POLICIES)
+        self.policies.update(policies or {})
         self.subscribers = {}
-        self.message_queue = queue.Queue()
+        self.topics = {}
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+        self.sequence = itertools.count()
+        self.started = False
+        self.transport = None
+
+    def set_policy(self, topic, priority=None, max_size=None, overflow=None):
+        policy = self.policy(topic)
+        if overflow is not None and overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow}', expected one of {', '.join(OVERFLOW_POLICIES)}")
+        self.policies[topic] = TopicPolicy(
+            priority=policy.priority if priority is None else priority,
+            max_size=policy.max_size if max_size is None else max_size,
+            overflow=policy.overflow if overflow is None else overflow,
+        )
+
+    def policy(self, topic) -> TopicPolicy:
+        return self.policies.get(topic) or TopicPolicy()
 
     def subscribe(self, topic, callback):
-        if topic not in self.subscribers:
-            self.subscribers[topic] = []
-        self.subscribers[topic].append(callback)
-        logger.debug(f"Subscribed {callback} to {topic}")
+        bound = inspect.ismethod(callback)
+        owner = callback.__self__ if bound else callback
+        subscriber = self.subscribers.get(id(owner))
+        if subscriber is None:
+            subscriber = _Subscriber(self, type(owner).__name__ if bound else getattr(callback, '__name__', 'callback'))
+            self.subscribers[id(owner)] = subscriber
+            if self.started:
+                subscriber.start()
+        with subscriber.condition:
+            subscriber.callbacks.setdefault(topic, []).append(callback)
+        if subscriber not in self.topics.setdefault(topic, []):
+            self.topics[topic].append(subscriber)
+        logger.debug("Subscribed %s to %s", callback, topic)
+
+    def set_transport(self, transport):
+        # Topics in transport.outgoing are also handed to other processes
+        self.transport = transport
 
     def publish(self, topic, message):
-        self.message_queue.put((topic, message))
-        logger.debug(f"Published message to {topic}")
-
-    def _process_messages(self):
-        logger.debug("Starting message processing loop")
-        while True:
-            topic, message = self.message_queue.get()
-            if topic in self.subscribers:
-                logger.debug(f"Processing message for {topic}")
-                for callback in self.subscribers[topic]:
-                    callback(message)
+        self.publish_local(topic, message)
+        if self.transport is not None and topic in self.transport.outgoing:
+            self.transport.send(topic, message)
+
+    def publish_local(self, topic, message):
+        policy = self.policy(topic)
+        sequence = next(self.sequence)
+        published = time.monotonic()
+        self._count(topic, published=1)
+        for subscriber in self.topics.get(topic, ()):
+            subscriber.put(topic, message, policy, sequence, published)
+        logger.debug("Published message to %s", topic)
+
+    def _count(self, topic, depth=0, latency=None, **counters):
+        with self.stats_lock:
+            stats = self.stats.get(topic)
+            if stats is None:
+                stats = self.stats[topic] = TopicStats()
+            for name, value in counters.items():
+                setattr(stats, name, getattr(stats, name) + value)
+            stats.depth += depth
+            stats.max_depth = max(stats.max_depth, stats.depth)
+            if latency is not None:
+                stats.latency_total += latency
+                stats.latency_max = max(stats.latency_max, latency)
+        for outcome, value in counters.items():
+            topic_messages.labels(topic, outcome).inc(value)
+
+    def topic_stats(self) -> Dict[str, TopicStats]:
+        with self.stats_lock:
+            return {topic: TopicStats(**vars(stats)) for topic, stats in self.stats.items()}
+
+    def collect_metrics(self):
+        for topic, stats in self.topic_stats().items():
+            queue_depth.labels(topic).set(stats.depth)
+
+    def log_stats(self):
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        for topic, stats in sorted(self.topic_stats().items()):
+            logger.debug("Topic %s: %d published, %d delivered, %d dropped, %d coalesced, depth %d (max %d), latency avg %.1f ms max %.1f ms",
+                         topic, stats.published, stats.delivered, stats.dropped, stats.coalesced, stats.depth, stats.max_depth,
+                         stats.latency_avg * 1000, stats.latency_max * 1000)
 
     def start(self):
-        logger.info("Starting message processing thread")
-        threading.Thread(target=self._process_messages, daemon=True).start()
+        logger.info("Starting message processing threads")
+        self.started = True
+        for subscriber in list(self.subscribers.values()):
+            subscriber.start()
 
 
 message_bus = MessageBus()
-
-# Example usage
-# def worker1_callback(message):
-#     print(f"Worker 1 received: {message}")
-
-# def worker2_callback(message):
-#     print(f"Worker 2 received: {message}")
-
-# # Create a MessageBus instance
-# message_bus = MessageBus()
-
-# # Subscribe workers to topics
-# message_bus.subscribe("topic1", worker1_callback)
-# message_bus.subscribe("topic2", worker2_callback)
-
-# # Start the message processing thread
-# message_bus.start()
-
-# # Workers publish messages
-# message_bus.publish("topic1", "Hello from Worker 1!")
-# message_bus.publish("topic2", "Greetings from Worker 2!")
-
-# # Sleep to allow processing time
-# time.sleep(1)
+metrics.registry.add_collector(message_bus.collect_metrics)
@@ -1,96 +1,167 @@
-from dataclasses import dataclass
-from typing import List
-from datetime import datetime, timedelta
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import messaging
-from firebase_admin import firestore
+import threading
+import time
+from typing import TYPE_CHECKING, List, Optional
+from datetime import timedelta
 from message_bus import message_bus
 from ai_worker import AiAlert
+from ai_cache import content_key, normalize_text
+from token_registry import TokenRegistry
 from config import Settings
+from state_store import StateStore
 import app_logger
+import metrics
 
-logger = app_logger.get(__name__)
-
+if TYPE_CHECKING:
+    from push_fanout import FanoutReport, PushTemplate
 
-@dataclass
-class FcmTokenRecord:
-    timestamp: datetime
-    token: str
-    uid: str
+logger = app_logger.get(__name__)
 
-    @staticmethod
-    def from_dict(data: dict):
-        return FcmTokenRecord(
-            timestamp=datetime.utcfromtimestamp(data.get('timestamp') / 1000),
-            token=data.get('token'),
-            uid=data.get('uid')
-        )
+alert_to_push_seconds = metrics.histogram('pyalerts_alert_to_push_seconds', 'From the triggering messages reaching AiWorker to push fan-out completion')
 
 
 class NotificationsSender:
-    def __init__(self, settings: Settings):
-        cred = credentials.Certificate(settings.firebase_credentials_path)
-        firebase_admin.initialize_app(cred)
-        self.db = firestore.client()
+    def __init__(self, settings: Settings, db=None, store: StateStore = None):
+        self.settings = settings
+        self.db = db
         self.token_deadline = timedelta(weeks=8)
+        self.registry = None
+        self.fanout = None
+        # Set once Firebase is connected; without an injected db that happens in the background
+        self.ready = threading.Event()
+        self.backend_timeout = settings.startup_timeout
+        self.delivery = settings.push_delivery
+        self.topic_prefix = settings.fcm_topic_prefix
+        self.store = store
+        self.dedup_window = settings.alert_dedup_window
+        # Fingerprint -> wall-clock time sent by the previous run. AlertCoalescer decides what is
+        # news for devices; this only keeps a restart from pushing what replayed messages trigger again.
+        self.sent_before_restart = dict(store.restored.sent_alerts) if store is not None else {}
+        if db is not None:
+            self._init_backend()
+
+    def _init_backend(self):
+        # firebase_admin and the Firestore client take most of a second to import and
+        # connect, so a production start does this off the path to the first alert poll
+        from push_fanout import PushFanout
+        if self.db is None:
+            import firebase_admin
+            from firebase_admin import credentials, firestore
+            firebase_admin.initialize_app(credentials.Certificate(self.settings.firebase_credentials_path))
+            self.db = firestore.client()
+        self.registry = TokenRegistry(self.db, self.token_deadline, self.settings.token_sweep_interval)
+        self.fanout = PushFanout(max_workers=self.settings.push_workers, max_retries=self.settings.push_max_retries, backoff=self.settings.push_retry_backoff)
+        self.ready.set()
+
+    def _connect(self):
+        try:
+            if not self.ready.is_set():
+                self._init_backend()
+            if self.delivery != 'topics':
+                self.registry.start()
+        except Exception as e:
+            logger.error(f"Error connecting to Firebase: {e}")
 
     def start(self):
-        message_bus.subscribe('ai_alert', self.handle_ai_alert)
+        # AlertCoalescer forwards ai_alerts that are news for devices as push_alert
+        message_bus.subscribe('push_alert', self.handle_ai_alert)
+        if self.ready.is_set():
+            self._connect()
+        else:
+            threading.Thread(target=self._connect, name='firebase-init', daemon=True).start()
         logger.info("NotificationsSender started")
 
+    def stop(self):
+        if self.registry is not None:
+            self.registry.stop()
+
+    @staticmethod
+    def fingerprint(alert: AiAlert) -> str:
+        # Includes the confidence, so an escalation of the same text is not taken for a replay
+        return content_key(normalize_text(f"{alert.region_id} {alert.attacker} {alert.text} {alert.confidence or 0.0:.2f}"))
+
+    def already_sent(self, alert: AiAlert) -> bool:
+        # An alert the previous run already pushed, triggered again by the messages replayed after a restart
+        if not self.dedup_window or not alert.text:
+            return False
+        now = time.time()
+        fingerprint = self.fingerprint(alert)
+        sent_at = self.sent_before_restart.pop(fingerprint, None)
+        if sent_at is not None and now - sent_at < self.dedup_window:
+            return True
+        if self.store is not None:
+            self.store.put_sent_alert(fingerprint, now)
+        return False
+
     def handle_ai_alert(self, alert: AiAlert):
+        if not self.ready.wait(self.backend_timeout):
+            logger.error(f"Firebase is not connected, dropping alert: {alert.attacker} {alert.text}")
+            return
         try:
-            tokens = self.fetch_notification_tokens()
-            self.send_push_notifications(tokens, alert)
-            logger.info(f"Push notifications sent to {len(tokens)} devices")
+            if self.already_sent(alert):
+                logger.info(f"Skipping alert already sent before the restart: {alert.attacker} {alert.text}")
+                return
+            if self.delivery == 'topics':
+                topic = self.topic(alert.region_id)
+                report = self.send_topic_notification(topic, alert)
+                logger.info(f"Push notification sent to topic {topic} in {report.duration:.2f}s")
+            else:
+                tokens = self.fetch_notification_tokens(alert.region_id)
+                report = self.send_push_notifications(tokens, alert)
+                logger.info(f"Push notifications sent to {report.delivered}/{report.tokens} devices in {report.duration:.2f}s "
+                            f"(p50 {report.percentile(0.5):.2f}s, p99 {report.percentile(0.99):.2f}s)")
+            if alert.detected is not None:
+                alert_to_push_seconds.observe(time.monotonic() - alert.detected)
+            if report.failed:
+                logger.warning(f"Failed to send push notifications to {report.failed} devices: {dict(report.errors)}")
+            if report.invalid_tokens:
+                self.prune_tokens(report.invalid_tokens)
         except Exception as e:
             logger.error(f"Error sending push notifications: {e}")
 
-    def fetch_notification_tokens(self):
-        collection_ref = self.db.collection('fcm_tokens')
-        docs = collection_ref.get()
-        tokens = []
-        for doc in docs:
-            token_record = FcmTokenRecord.from_dict(doc.to_dict())
-            if datetime.utcnow() - token_record.timestamp > self.token_deadline:
-                logger.info(f"Token {token_record.token} is expired, deleting")
-                doc.reference.delete()
-            else:
-                tokens.append(token_record.token)
-
-        return tokens
-
-    def send_push_notifications(self, tokens: List[str], alert: AiAlert):
-        batch_size = 500
-        total_tokens = len(tokens)
-        num_batches = (total_tokens + batch_size - 1) // batch_size
-
-        for i in range(num_batches):
-            start_index = i * batch_size
-            end_index = min((i + 1) * batch_size, total_tokens)
-            batch_tokens = tokens[start_index:end_index]
-            message = messaging.MulticastMessage(
-                data={
-                    "alert": str(alert.alert),
-                    "attacker": alert.attacker,
-                    "text": alert.text,
-                    "confidence": "{:.2f}".format(alert.confidence),
-                    "original_text": alert.original_text,
-                },
-                notification=messaging.Notification(
-                    title="Alert: {}".format(alert.attacker),
-                    body=alert.text,
-                ),
-                android=messaging.AndroidConfig(
-                    priority="high",
-                ),
-                tokens=batch_tokens,
-            )
-
-            response = messaging.send_multicast(message)
-            if response.failure_count > 0:
-                logger.warning("Failed to send push notifications to some devices")
-                for idx, error in enumerate(response.responses):
-                    if 'error' in error:
-                        logger.warning(f"Error sending push notification to {batch_tokens[idx]}: {error['error']}")
+    def fetch_notification_tokens(self, region_id: Optional[int] = None):
+        return self.registry.tokens(region_id)
+
+    def topic(self, region_id: Optional[int]) -> str:
+        return f"{self.topic_prefix}{region_id if region_id is not None else 'all'}"
+
+    def prune_tokens(self, tokens: List[str]):
+        logger.info(f"Removing {len(tokens)} unregistered notification tokens")
+        threading.Thread(target=self.registry.remove_tokens, args=(tokens,), daemon=True).start()
+
+    @staticmethod
+    def collapse_key(alert: AiAlert) -> str:
+        # One notification slot per region: an escalation replaces what the device shows
+        return f"alert-{alert.region_id if alert.region_id is not None else 'all'}"
+
+    @staticmethod
+    def build_template(alert: AiAlert) -> 'PushTemplate':
+        from firebase_admin import messaging
+        from push_fanout import PushTemplate
+        collapse_key = NotificationsSender.collapse_key(alert)
+        data = {
+            "alert": str(alert.alert),
+            "attacker": alert.attacker,
+            "text": alert.text,
+            "confidence": "{:.2f}".format(alert.confidence),
+            "original_text": alert.original_text,
+        }
+        if alert.region_id is not None:
+            data["region"] = str(alert.region_id)
+        return PushTemplate(
+            data=data,
+            notification=messaging.Notification(
+                title="Alert: {}".format(alert.attacker),
+                body=alert.text,
+            ),
+            android=messaging.AndroidConfig(
+                priority="high",
+                collapse_key=collapse_key,
+                notification=messaging.AndroidNotification(tag=collapse_key),
+            ),
+        )
+
+    def send_push_notifications(self, tokens: List[str], alert: AiAlert) -> 'FanoutReport':
+        return self.fanout.send(tokens, self.build_template(alert))
+
+    def send_topic_notification(self, topic: str, alert: AiAlert) -> 'FanoutReport':
+        return self.fanout.send_topic(topic, self.build_template(alert))
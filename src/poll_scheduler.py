@@ -0,0 +1,184 @@
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+import app_logger
+
+logger = app_logger.get(__name__)
+
+DEFAULT_RETRY_AFTER = 30.0
+MAX_ERROR_BACKOFF = 300.0
+
+
+@dataclass
+class ChannelSchedule:
+    name: str
+    min_interval: float
+    max_interval: float
+    interval: float
+    next_due: float = 0.0
+    posts_seen: float = 0.0
+    time_observed: float = 0.0
+    last_poll: Optional[float] = None
+    polls: int = 0
+    failures: int = 0
+
+    @property
+    def post_rate(self) -> float:
+        return self.posts_seen / self.time_observed if self.time_observed else 0.0
+
+
+class RateBudget:
+    # Token bucket shared by every poller. The rate is cut in half on 429 and
+    # grows back linearly to the configured rate over recovery_time seconds.
+
+    def __init__(self, rate: float, burst: float, recovery_time: float = 600.0, clock=time.monotonic):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.recovery_time = recovery_time
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.rate = min(self.max_rate, self.rate + elapsed * self.max_rate / self.recovery_time)
+        self.updated = now
+
+    def try_acquire(self, now) -> bool:
+        self._refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def time_until_available(self, now) -> float:
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def decrease(self):
+        self.rate = max(self.max_rate / 16, self.rate / 2)
+        self.tokens = min(self.tokens, 0)
+
+
+class PollScheduler:
+    # Splits the request budget between channels in proportion to the square root
+    # of their observed post rate, which minimizes the average detection delay for
+    # a fixed number of requests. Channels without a rate estimate yet keep their
+    # interval, and a channel that just posted is polled sooner until the rate catches up.
+
+    def __init__(self, rate: float = 4.0, burst: float = 8.0, jitter: float = 0.1, utilization: float = 0.5, rate_horizon: float = 900.0,
+                 speedup: float = 0.5, clock=time.monotonic, rng: random.Random = None):
+        self.clock = clock
+        self.budget = RateBudget(rate, burst, clock=clock)
+        self.jitter = jitter
+        self.utilization = utilization
+        self.rate_horizon = rate_horizon
+        self.speedup = speedup
+        self.random = rng or random.Random()
+        self.channels: Dict[str, ChannelSchedule] = {}
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def configure(self, rate: float, burst: float, jitter: float):
+        with self.lock:
+            self.budget = RateBudget(rate, burst, clock=self.clock)
+            self.jitter = jitter
+
+    def add(self, name, interval: float, min_interval: float, max_interval: float):
+        with self.lock:
+            self.channels[name] = ChannelSchedule(name, min_interval, max_interval, min(max(interval, min_interval), max_interval), next_due=self.clock())
+
+    def set_bounds(self, name, min_interval: float, max_interval: float):
+        with self.lock:
+            schedule = self.channels[name]
+            schedule.min_interval = min_interval
+            schedule.max_interval = max_interval
+            schedule.interval = min(max(schedule.interval, min_interval), max_interval)
+            schedule.next_due = min(schedule.next_due, (schedule.last_poll or 0.0) + schedule.interval)
+
+    def reset(self, names: Iterable[str], interval: Optional[float] = None):
+        # Makes the channels due right away, e.g. when an alert starts
+        now = self.clock()
+        with self.lock:
+            for name in names:
+                schedule = self.channels[name]
+                if interval is not None:
+                    schedule.interval = min(max(interval, schedule.min_interval), schedule.max_interval)
+                schedule.next_due = now
+
+    def due(self, names: Iterable[str]) -> List[str]:
+        # Channels that are due and fit in the request budget, most overdue first
+        now = self.clock()
+        with self.lock:
+            if now < self.paused_until:
+                return []
+            overdue = sorted((self.channels[name] for name in names if self.channels[name].next_due <= now), key=lambda schedule: schedule.next_due)
+            granted = []
+            for schedule in overdue:
+                if not self.budget.try_acquire(now):
+                    break
+                granted.append(schedule.name)
+            return granted
+
+    def next_wakeup(self, names: Iterable[str]) -> float:
+        # Seconds until due() may return something for these channels
+        now = self.clock()
+        with self.lock:
+            next_due = min((self.channels[name].next_due for name in names), default=now + 1.0)
+            wakeup = max(next_due, self.paused_until, now + self.budget.time_until_available(now))
+            return max(0.0, wakeup - now)
+
+    def _target_interval(self, schedule: ChannelSchedule) -> float:
+        rate = schedule.post_rate
+        if not rate:
+            return schedule.max_interval if schedule.time_observed >= schedule.max_interval else schedule.interval
+        scale = sum(math.sqrt(other.post_rate) for other in self.channels.values()) / (self.budget.rate * self.utilization)
+        return scale / math.sqrt(rate)
+
+    def record(self, name, new_posts: int):
+        now = self.clock()
+        with self.lock:
+            schedule = self.channels[name]
+            if schedule.last_poll is not None and now > schedule.last_poll:
+                elapsed = now - schedule.last_poll
+                decay = math.exp(-elapsed / self.rate_horizon)
+                schedule.posts_seen = schedule.posts_seen * decay + new_posts
+                schedule.time_observed = schedule.time_observed * decay + elapsed
+            schedule.last_poll = now
+            schedule.polls += 1
+            schedule.failures = 0
+            interval = self._target_interval(schedule)
+            if new_posts:
+                interval = min(interval, schedule.interval * self.speedup)
+            schedule.interval = min(max(interval, schedule.min_interval), schedule.max_interval)
+            schedule.next_due = now + schedule.interval * (1 + self.random.uniform(-self.jitter, self.jitter))
+
+    def failed(self, name):
+        # A failed fetch says nothing about the post rate; the channel is retried after its
+        # interval, doubled on every consecutive failure, instead of being due right away
+        now = self.clock()
+        with self.lock:
+            schedule = self.channels[name]
+            schedule.failures += 1
+            backoff = schedule.interval * 2 ** min(schedule.failures - 1, 16)
+            schedule.next_due = now + min(backoff, max(schedule.interval, MAX_ERROR_BACKOFF))
+
+    def rate_limited(self, name, retry_after: Optional[float] = None):
+        now = self.clock()
+        retry_after = retry_after or DEFAULT_RETRY_AFTER
+        with self.lock:
+            self.paused_until = max(self.paused_until, now + retry_after)
+            self.budget.decrease()
+            schedule = self.channels.get(name)
+            if schedule is not None:
+                schedule.next_due = max(schedule.next_due, self.paused_until)
+        logger.warning(f"Rate limited while polling {name}, pausing for {retry_after:.0f}s at {self.budget.rate:.2f} requests/s")
+
+
+poll_scheduler = PollScheduler()
+
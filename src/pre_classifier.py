@@ -0,0 +1,75 @@
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+from telegram import Message
+
+
+@dataclass
+class KeywordRule:
+    pattern: str
+    # A negative weight suppresses: a match scales the whole score by 1 + weight
+    weight: float
+    attacker: Optional[str] = None
+
+
+@dataclass
+class Score:
+    value: float
+    attacker: Optional[str]
+
+
+DEFAULT_RULES = [
+    KeywordRule(r'ракет', 0.7, 'MISSILE'),
+    KeywordRule(r'крилат', 0.7, 'MISSILE'),
+    KeywordRule(r'калібр', 0.6, 'MISSILE'),
+    KeywordRule(r'швидкісн\w* ціл', 0.7, 'MISSILE'),
+    KeywordRule(r'балістик|балістичн', 0.8, 'BALLISTIC'),
+    KeywordRule(r'кинджал|іскандер', 0.8, 'BALLISTIC'),
+    KeywordRule(r'шахед|шахєд|мопед|герань', 0.7, 'DRONE'),
+    KeywordRule(r'бпла|ударн\w* дрон', 0.7, 'DRONE'),
+    KeywordRule(r'авіабомб|каб\b|керован\w* бомб', 0.7, 'AIRCRAFT'),
+    KeywordRule(r'курсом на|у напрямку|в напрямку|рухаєт|летить|летять|заходять', 0.5),
+    KeywordRule(r'вибух', 0.5),
+    KeywordRule(r'пуск|зліт', 0.4),
+    KeywordRule(r'загроз|небезпек|укритт', 0.3),
+    KeywordRule(r'ппо|працює', 0.3),
+    # All-clear and interception reports name the threat too, but must never trigger an
+    # instant alert; mixed messages still score high enough to reach the LLM
+    KeywordRule(r'відбій|відбою|відмін|скасов|збит|знешкоджен', -0.6),
+]
+
+
+def parse_rules(rules) -> List[KeywordRule]:
+    if not rules:
+        return DEFAULT_RULES
+    return [KeywordRule(pattern=rule['pattern'], weight=rule.get('weight', 0.5), attacker=rule.get('attacker')) for rule in rules]
+
+
+class PreClassifier:
+    def __init__(self, rules: List[KeywordRule] = DEFAULT_RULES):
+        self.rules = rules
+        # Rules are matched against lowercased text, which is cheaper than re.IGNORECASE
+        self.pattern = re.compile('|'.join(f'(?P<r{index}>{rule.pattern})' for index, rule in enumerate(rules)))
+
+    def score(self, text: str) -> Score:
+        miss = 1.0
+        suppress = 1.0
+        attacker = None
+        attacker_weight = 0.0
+        matched = set()
+        for match in self.pattern.finditer(text.lower()):
+            index = int(match.lastgroup[1:])
+            if index in matched:
+                continue
+            matched.add(index)
+            rule = self.rules[index]
+            if rule.weight < 0:
+                suppress *= 1.0 + rule.weight
+                continue
+            miss *= 1.0 - rule.weight
+            if rule.attacker and rule.weight > attacker_weight:
+                attacker, attacker_weight = rule.attacker, rule.weight
+        return Score(value=(1.0 - miss) * suppress, attacker=attacker)
+
+    def score_batch(self, messages: List[Message]) -> List[Score]:
+        return [self.score(message.text) for message in messages]
@@ -0,0 +1,91 @@
+import threading
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Tuple
+from telegram import Message
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough cl100k estimate for mixed Cyrillic/Latin text plus per-message overhead
+    return len(text) // 3 + 4
+
+
+@dataclass(eq=False)
+class PromptEntry:
+    # A message rendered once, when it enters the history
+    message: Message
+    line: str
+    history: dict
+    tokens: int
+
+
+@dataclass
+class Prompt:
+    messages: List[dict]
+    tokens: int
+    # Leading tokens identical to the previous request, which provider prompt caching can reuse
+    reused_tokens: int
+
+
+class PromptBuilder:
+    # Keeps AiWorker's history as pre-rendered entries and lays a request out as a stable
+    # prefix (system prompt, history oldest first) followed by a small suffix (the new
+    # messages and the local time). When the history overflows it is trimmed to
+    # `trim_ratio` of its limits rather than by one entry, so that the prefix, and the
+    # provider's cache of it, stays the same for several calls in a row.
+    def __init__(self, system_prompt: str, target_timezone, max_messages: int, token_budget: int, trim_ratio: float = 0.75):
+        self.system = {"role": "system", "content": system_prompt}
+        self.system_tokens = estimate_tokens(system_prompt)
+        self.target_timezone = target_timezone
+        self.max_messages = max_messages
+        self.token_budget = token_budget
+        self.trim_ratio = trim_ratio
+        self.entries = deque()
+        self.tokens = 0
+        self.last_prefix: Tuple[PromptEntry, ...] = ()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def messages(self) -> List[Message]:
+        return [entry.message for entry in self.entries]
+
+    def render(self, message: Message) -> PromptEntry:
+        line = f"{message.date.astimezone(self.target_timezone).strftime('%H:%M:%S')} {message.author}: {message.text}"
+        history = {"role": "user", "content": f"> HISTORY {line}"}
+        return PromptEntry(message=message, line=line, history=history, tokens=estimate_tokens(history["content"]))
+
+    def clear(self):
+        self.entries.clear()
+        self.tokens = 0
+
+    def append(self, messages: List[Message]) -> List[PromptEntry]:
+        added = [self.render(message) for message in messages]
+        self.entries.extend(added)
+        self.tokens += sum(entry.tokens for entry in added)
+        if len(self.entries) > self.max_messages or self.tokens > self.token_budget:
+            max_messages = int(self.max_messages * self.trim_ratio)
+            token_budget = int(self.token_budget * self.trim_ratio)
+            while self.entries and (len(self.entries) > max_messages or self.tokens > token_budget):
+                self.tokens -= self.entries.popleft().tokens
+        return added
+
+    def prefix(self) -> Tuple[PromptEntry, ...]:
+        return tuple(self.entries)
+
+    def build(self, prefix: Tuple[PromptEntry, ...], new_entries: List[PromptEntry]) -> Prompt:
+        new_messages = [{"role": "user", "content": f"> NEW {entry.line}"} for entry in new_entries]
+        local_time = {"role": "assistant", "content": f"Local time: {datetime.now(self.target_timezone).isoformat()}"}
+        tokens = self.system_tokens + sum(entry.tokens for entry in prefix) + sum(estimate_tokens(message["content"]) for message in new_messages)
+        tokens += estimate_tokens(local_time["content"])
+        with self.lock:
+            reused = self.system_tokens
+            for entry, previous in zip(prefix, self.last_prefix):
+                if entry is not previous:
+                    break
+                reused += entry.tokens
+            self.last_prefix = prefix
+        return Prompt(messages=[self.system] + [entry.history for entry in prefix] + new_messages + [local_time], tokens=tokens, reused_tokens=reused)
@@ -0,0 +1,192 @@
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List
+from firebase_admin import exceptions
+from firebase_admin import messaging
+import app_logger
+import metrics
+
+logger = app_logger.get(__name__)
+
+batch_seconds = metrics.histogram('pyalerts_fcm_batch_seconds', 'FCM multicast call duration')
+notifications = metrics.counter('pyalerts_fcm_notifications_total', 'Notifications by outcome', ['outcome'])
+failures = metrics.counter('pyalerts_fcm_failures_total', 'Failed FCM sends by error code', ['code'])
+
+# Only these mean the token itself is dead. INVALID_ARGUMENT is usually about the payload
+# (data keys, size, TTL) and is the same for every token, so it must never prune.
+INVALID_TOKEN_ERRORS = (messaging.UnregisteredError, messaging.SenderIdMismatchError)
+TRANSIENT_ERRORS = (exceptions.UnavailableError, exceptions.InternalError, exceptions.ResourceExhaustedError, exceptions.DeadlineExceededError, exceptions.UnknownError)
+
+
+@dataclass
+class PushTemplate:
+    data: dict
+    notification: messaging.Notification
+    android: messaging.AndroidConfig
+
+    def for_tokens(self, tokens: List[str]) -> messaging.MulticastMessage:
+        return messaging.MulticastMessage(tokens=tokens, data=self.data, notification=self.notification, android=self.android)
+
+    def for_topic(self, topic: str) -> messaging.Message:
+        return messaging.Message(topic=topic, data=self.data, notification=self.notification, android=self.android)
+
+
+@dataclass
+class BatchResult:
+    delivered: int = 0
+    failed: int = 0
+    retried: int = 0
+    invalid_tokens: List[str] = field(default_factory=list)
+    errors: Counter = field(default_factory=Counter)
+    completed: float = 0.0
+
+
+@dataclass
+class FanoutReport:
+    tokens: int
+    delivered: int = 0
+    failed: int = 0
+    retried: int = 0
+    invalid_tokens: List[str] = field(default_factory=list)
+    errors: Counter = field(default_factory=Counter)
+    batch_completions: List[float] = field(default_factory=list)
+    duration: float = 0.0
+
+    def percentile(self, fraction: float) -> float:
+        if not self.batch_completions:
+            return 0.0
+        ordered = sorted(self.batch_completions)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class PushFanout:
+    def __init__(self, max_workers: int = 8, batch_size: int = 500, max_retries: int = 3, backoff: float = 0.5, send_multicast=None, send_message=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='push-fanout')
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.send_multicast = send_multicast or messaging.send_multicast
+        self.send_message = send_message or messaging.send
+
+    def _sleep_backoff(self, attempt):
+        time.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+
+    def _send_batch(self, tokens: List[str], template: PushTemplate, started: float) -> BatchResult:
+        result = BatchResult()
+        pending = tokens
+        attempt = 0
+        while pending:
+            started_call = time.monotonic()
+            try:
+                response = self.send_multicast(template.for_tokens(pending))
+            except TRANSIENT_ERRORS as e:
+                batch_seconds.observe(time.monotonic() - started_call)
+                failures.labels(e.code).inc(len(pending))
+                if attempt >= self.max_retries:
+                    result.failed += len(pending)
+                    result.errors[e.code] += len(pending)
+                    break
+                self._sleep_backoff(attempt)
+                attempt += 1
+                continue
+            except exceptions.InvalidArgumentError as e:
+                batch_seconds.observe(time.monotonic() - started_call)
+                failures.labels(e.code).inc(len(pending))
+                logger.error(f"FCM rejected a batch of {len(pending)} notifications: {e}")
+                result.failed += len(pending)
+                result.errors[e.code] += len(pending)
+                break
+
+            batch_seconds.observe(time.monotonic() - started_call)
+            retry = []
+            rejected = 0
+            for token, send_response in zip(pending, response.responses):
+                if send_response.success:
+                    result.delivered += 1
+                    continue
+                error = send_response.exception
+                code = getattr(error, 'code', type(error).__name__)
+                result.errors[code] += 1
+                failures.labels(code).inc()
+                if isinstance(error, INVALID_TOKEN_ERRORS):
+                    result.invalid_tokens.append(token)
+                    result.failed += 1
+                elif isinstance(error, TRANSIENT_ERRORS) and attempt < self.max_retries:
+                    retry.append(token)
+                else:
+                    rejected += isinstance(error, exceptions.InvalidArgumentError)
+                    result.failed += 1
+            if rejected:
+                logger.error(f"FCM rejected {rejected} notifications as invalid arguments, check the payload")
+            if retry:
+                result.retried += len(retry)
+                self._sleep_backoff(attempt)
+                attempt += 1
+            pending = retry
+        result.completed = time.monotonic() - started
+        notifications.labels('delivered').inc(result.delivered)
+        notifications.labels('failed').inc(result.failed)
+        notifications.labels('retried').inc(result.retried)
+        return result
+
+    def send(self, tokens: List[str], template: PushTemplate) -> FanoutReport:
+        started = time.monotonic()
+        futures = [
+            self.executor.submit(self._send_batch, tokens[start:start + self.batch_size], template, started)
+            for start in range(0, len(tokens), self.batch_size)
+        ]
+        report = FanoutReport(tokens=len(tokens))
+        for future in futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Error sending push notification batch: {e}")
+                continue
+            report.delivered += result.delivered
+            report.failed += result.failed
+            report.retried += result.retried
+            report.invalid_tokens.extend(result.invalid_tokens)
+            report.errors.update(result.errors)
+            report.batch_completions.append(result.completed)
+        report.duration = time.monotonic() - started
+        return report
+
+    def send_topic(self, topic: str, template: PushTemplate) -> FanoutReport:
+        # One request whatever the audience size; FCM expands the topic to its subscribers
+        started = time.monotonic()
+        report = FanoutReport(tokens=1)
+        attempt = 0
+        while True:
+            started_call = time.monotonic()
+            try:
+                self.send_message(template.for_topic(topic))
+            except TRANSIENT_ERRORS as e:
+                batch_seconds.observe(time.monotonic() - started_call)
+                failures.labels(e.code).inc()
+                if attempt >= self.max_retries:
+                    report.failed = 1
+                    report.errors[e.code] += 1
+                    break
+                report.retried += 1
+                self._sleep_backoff(attempt)
+                attempt += 1
+                continue
+            except exceptions.InvalidArgumentError as e:
+                batch_seconds.observe(time.monotonic() - started_call)
+                failures.labels(e.code).inc()
+                logger.error(f"FCM rejected the notification for topic {topic}: {e}")
+                report.failed = 1
+                report.errors[e.code] += 1
+                break
+            batch_seconds.observe(time.monotonic() - started_call)
+            report.delivered = 1
+            break
+        notifications.labels('delivered').inc(report.delivered)
+        notifications.labels('failed').inc(report.failed)
+        notifications.labels('retried').inc(report.retried)
+        report.duration = time.monotonic() - started
+        report.batch_completions.append(report.duration)
+        return report
@@ -0,0 +1,74 @@
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Iterable, Optional
+import app_logger
+
+logger = app_logger.get(__name__)
+
+
+class SamplingProfiler:
+    # Samples the stacks of running threads at a fixed rate and returns them in the
+    # folded format understood by flamegraph.pl and speedscope. Nothing runs until
+    # start() is called, so it can stay wired up in production.
+
+    def __init__(self, interval: float = 0.01, max_duration: float = 300.0):
+        self.interval = interval
+        self.max_duration = max_duration
+        self.stacks = Counter()
+        self.samples = 0
+        self.thread_prefixes = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, threads: Optional[Iterable[str]] = None):
+        # threads limits sampling to threads whose name starts with one of the prefixes
+        with self.lock:
+            if self.running:
+                return
+            self.stacks = Counter()
+            self.samples = 0
+            self.thread_prefixes = tuple(threads) if threads else None
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self.thread.start()
+        logger.info(f"Sampling profiler started every {self.interval * 1000:.0f} ms")
+
+    def stop(self) -> str:
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        with self.lock:
+            folded = '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+        logger.info(f"Sampling profiler stopped after {self.samples} samples")
+        return folded + '\n'
+
+    def _run(self):
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + self.max_duration
+        while not self.stop_event.wait(self.interval) and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            with self.lock:
+                self.samples += 1
+                for thread_id, frame in frames.items():
+                    name = names.get(thread_id, str(thread_id))
+                    if thread_id == own_id or (self.thread_prefixes and not name.startswith(self.thread_prefixes)):
+                        continue
+                    self.stacks[self._fold(name, frame)] += 1
+
+    @staticmethod
+    def _fold(thread_name, frame) -> str:
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+            frame = frame.f_back
+        parts.append(thread_name)
+        return ';'.join(reversed(parts))
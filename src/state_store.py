@@ -0,0 +1,160 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from telegram import Message
+import app_logger
+
+logger = app_logger.get(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS regions (id INTEGER PRIMARY KEY, alert INTEGER NOT NULL, changed TEXT);
+CREATE TABLE IF NOT EXISTS cursors (channel TEXT PRIMARY KEY, last_id INTEGER);
+CREATE TABLE IF NOT EXISTS ai_history (scope TEXT PRIMARY KEY, messages TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS sent_alerts (fingerprint TEXT PRIMARY KEY, sent_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def _encode_date(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _decode_date(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def encode_messages(messages: List[Message]) -> str:
+    return json.dumps([[message.id, message.author, message.text, _encode_date(message.date)] for message in messages], ensure_ascii=False)
+
+
+def decode_messages(data: str) -> List[Message]:
+    return [Message(id=id, author=author, text=text, date=_decode_date(date)) for id, author, text, date in json.loads(data)]
+
+
+@dataclass
+class StoredState:
+    regions: Dict[int, Tuple[bool, Optional[datetime]]] = field(default_factory=dict)
+    cursors: Dict[str, int] = field(default_factory=dict)
+    ai_history: Dict[str, List[Message]] = field(default_factory=dict)
+    sent_alerts: Dict[str, float] = field(default_factory=dict)
+    values: Dict[str, object] = field(default_factory=dict)
+
+
+class StateStore:
+    # SQLite in WAL mode. Components only record the latest value in memory; a
+    # writer thread commits everything pending in one transaction per interval.
+
+    def __init__(self, path: str, flush_interval: float = 1.0, sent_retention: float = 86400.0):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        self.flush_interval = flush_interval
+        self.sent_retention = sent_retention
+        self.lock = threading.Lock()
+        self.db_lock = threading.Lock()
+        self.pending = self._empty_pending()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.writes = 0
+        self._restored = None
+
+    @property
+    def restored(self) -> StoredState:
+        # State as it was on disk at startup, loaded once and shared by all components
+        if self._restored is None:
+            self._restored = self.load()
+        return self._restored
+
+    @staticmethod
+    def _empty_pending():
+        return {'regions': {}, 'cursors': {}, 'ai_history': {}, 'sent_alerts': {}, 'state': {}}
+
+    def load(self) -> StoredState:
+        started = time.perf_counter()
+        state = StoredState()
+        with self.db_lock:
+            for region_id, alert, changed in self.connection.execute('SELECT id, alert, changed FROM regions'):
+                state.regions[region_id] = (bool(alert), _decode_date(changed))
+            state.cursors = dict(self.connection.execute('SELECT channel, last_id FROM cursors'))
+            for scope, messages in self.connection.execute('SELECT scope, messages FROM ai_history'):
+                state.ai_history[scope] = decode_messages(messages)
+            oldest = time.time() - self.sent_retention
+            state.sent_alerts = dict(self.connection.execute('SELECT fingerprint, sent_at FROM sent_alerts WHERE sent_at >= ?', (oldest,)))
+            state.values = {key: json.loads(value) for key, value in self.connection.execute('SELECT key, value FROM state')}
+        logger.info(f"Restored state in {(time.perf_counter() - started) * 1000:.1f} ms: {len(state.regions)} regions, "
+                    f"{len(state.cursors)} cursors, {len(state.ai_history)} AI histories, {len(state.sent_alerts)} sent alerts")
+        return state
+
+    def put_region(self, region_id: int, alert: bool, changed: Optional[datetime]):
+        with self.lock:
+            self.pending['regions'][region_id] = (int(alert), _encode_date(changed))
+
+    def put_cursor(self, channel: str, last_id: Optional[int]):
+        with self.lock:
+            self.pending['cursors'][channel] = last_id
+
+    def put_history(self, scope: str, messages: List[Message]):
+        # Encoding is deferred to the writer; the list must not be mutated afterwards
+        with self.lock:
+            self.pending['ai_history'][scope] = messages
+
+    def put_sent_alert(self, fingerprint: str, sent_at: float):
+        with self.lock:
+            self.pending['sent_alerts'][fingerprint] = sent_at
+
+    def put_value(self, key: str, value):
+        with self.lock:
+            self.pending['state'][key] = value
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, self._empty_pending()
+        if not any(pending.values()):
+            return
+        with self.db_lock:
+            connection = self.connection
+            connection.execute('BEGIN')
+            try:
+                connection.executemany('INSERT OR REPLACE INTO regions (id, alert, changed) VALUES (?, ?, ?)',
+                                       [(region_id, alert, changed) for region_id, (alert, changed) in pending['regions'].items()])
+                connection.executemany('INSERT OR REPLACE INTO cursors (channel, last_id) VALUES (?, ?)', pending['cursors'].items())
+                connection.executemany('INSERT OR REPLACE INTO ai_history (scope, messages) VALUES (?, ?)',
+                                       [(scope, encode_messages(messages)) for scope, messages in pending['ai_history'].items()])
+                connection.executemany('INSERT OR REPLACE INTO sent_alerts (fingerprint, sent_at) VALUES (?, ?)', pending['sent_alerts'].items())
+                connection.executemany('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)',
+                                       [(key, json.dumps(value, default=str)) for key, value in pending['state'].items()])
+                connection.execute('DELETE FROM sent_alerts WHERE sent_at < ?', (time.time() - self.sent_retention,))
+                connection.execute('COMMIT')
+                self.writes += 1
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+
+    def _writer_thread(self):
+        while not self.stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error writing state: {e}")
+
+    def start(self):
+        self.thread = threading.Thread(target=self._writer_thread, name='state-writer', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def close(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
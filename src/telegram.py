@@ -1,12 +1,38 @@
-from typing import List
+import hashlib
+import re
+import threading
+import time
+from html.parser import HTMLParser
+from typing import List, Optional
 import requests
-from dataclasses import dataclass
+from requests.adapters import HTTPAdapter
+from dataclasses import dataclass, field
 from datetime import datetime
-from bs4 import BeautifulSoup, SoupStrainer
 import app_logger
+import metrics
 
 logger = app_logger.get(__name__)
 
+fetch_seconds = metrics.histogram('pyalerts_fetch_seconds', 't.me page request duration', ['channel'])
+fetch_bytes = metrics.counter('pyalerts_fetch_bytes_total', 't.me page bytes received', ['channel'])
+fetch_responses = metrics.counter('pyalerts_fetch_responses_total', 't.me responses by status', ['channel', 'status'])
+fetch_parses_skipped = metrics.counter('pyalerts_fetch_parses_skipped_total', 't.me pages not parsed because they had not changed', ['channel', 'reason'])
+fetch_bytes_saved = metrics.counter('pyalerts_fetch_bytes_saved_total', 't.me page bytes not downloaded thanks to 304 Not Modified', ['channel'])
+parse_seconds = metrics.histogram('pyalerts_parse_seconds', 'Channel page parse time', ['parser'], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+
+PAGE_SIZE = 20
+MAX_PAGES = 5
+VOID_ELEMENTS = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track', 'wbr'])
+IGNORED_TEXT_ELEMENTS = frozenset(['script', 'style', 'template', 'rt', 'rp'])
+POST_ID_PATTERN = re.compile(rb'data-post="[^"/]+/(\d+)"')
+
+base_url = "https://t.me"
+parser_backend = 'stream'
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+
 @dataclass
 class Message:
     id: int
@@ -14,30 +40,317 @@ class Message:
     text: str
     date: datetime
 
+    @property
+    def post_id(self) -> int:
+        return int(str(self.id).rsplit('/', 1)[-1])
+
+
+@dataclass
+class ChannelCursor:
+    last_id: Optional[int] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    body_digest: Optional[bytes] = None
+    body_size: int = 0
+
+    def advance(self, last_id):
+        self.last_id = last_id
+        self.etag = None
+        self.last_modified = None
+        self.body_digest = None
+        self.body_size = 0
+
+
+@dataclass
+class FetchStats:
+    requests: int = 0
+    not_modified: int = 0
+    parses_skipped: int = 0
+    empty_polls: int = 0
+    rate_limited: int = 0
+    bytes_received: int = 0
+    bytes_saved: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def add(self, **counters):
+        with self.lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+
+fetch_stats = FetchStats()
+
+
+class RateLimitedError(Exception):
+    def __init__(self, channel_name, retry_after: Optional[float] = None):
+        super().__init__(f"Rate limited by {base_url} while fetching {channel_name}, retry after {retry_after}s")
+        self.channel_name = channel_name
+        self.retry_after = retry_after
+
+
+def _retry_after(response) -> Optional[float]:
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def set_base_url(url):
+    global base_url
+    base_url = url.rstrip('/')
+
+
+def channel_url(channel_name):
+    return f"{base_url}/s/{channel_name}"
+
+
+def parse_messages_soup(content, channel_name, stop_list: List[str] = []) -> List[Message]:
+    # bs4 is only imported when this backend is selected; the default stream parser does not need it
+    from bs4 import BeautifulSoup, SoupStrainer
+    soup = BeautifulSoup(content, 'html.parser', parse_only=SoupStrainer('div', attrs={'class': lambda L: 'tgme_widget_message' in L.split()}))
+    messages = []
+    for message_div in soup:
+        id = message_div['data-post']
+        author = channel_name
+        text_node = message_div.css.select_one('.tgme_widget_message_bubble > .tgme_widget_message_text')
+        if text_node:
+            stripped_strings = text_node.stripped_strings
+            text = ' '.join([s for s in stripped_strings if s not in stop_list])
+        else:
+            continue
+        date_str = message_div.select_one(
+            '.tgme_widget_message_footer time[datetime]')['datetime']
+        date = datetime.fromisoformat(date_str)
+        messages.append(Message(id=id, author=author, text=text, date=date))
+    return messages
+
+
+class MessageExtractor(HTMLParser):
+    # Single-pass equivalent of parse_messages_soup: tracks only the open elements
+    # of the current tgme_widget_message block instead of building a tree.
+
+    def __init__(self, channel_name, stop_list: List[str] = []):
+        super().__init__(convert_charrefs=True)
+        self.channel_name = channel_name
+        self.stop_set = frozenset(stop_list)
+        self.messages = []
+        self.data = []
+        self.stack = None
 
-def fetch_latest_messages(channel_name, limit=20, newer_than: datetime = None, stop_list: List[str] = []) -> List[Message]:
-    url = f"https://t.me/s/{channel_name}"
+    def _begin_message(self, attrs):
+        self.post_id = attrs['data-post']
+        self.strings = None
+        self.text_depth = None
+        self.footer_depth = 0
+        self.date_str = None
+
+    def _end_message(self):
+        self.stack = None
+        if self.strings is None:
+            return
+        if self.date_str is None:
+            raise ValueError(f"Message {self.post_id} has no date")
+        self.messages.append(Message(id=self.post_id, author=self.channel_name, text=' '.join(self.strings), date=datetime.fromisoformat(self.date_str)))
+
+    def _flush(self):
+        if not self.data:
+            return
+        if self.text_depth is not None and self.stack[-1][0] not in IGNORED_TEXT_ELEMENTS:
+            string = ''.join(self.data).strip()
+            if string and (not self.stop_set or string not in self.stop_set):
+                self.strings.append(string)
+        self.data = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.stack is None:
+            if tag == 'div':
+                attrs = dict(attrs)
+                classes = (attrs.get('class') or '').split()
+                if 'tgme_widget_message' in classes:
+                    self._begin_message(attrs)
+                    self.stack = [(tag, classes)]
+            return
+        self._flush()
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        if self.strings is None and 'tgme_widget_message_text' in classes and 'tgme_widget_message_bubble' in self.stack[-1][1]:
+            self.strings = []
+            self.text_depth = len(self.stack)
+        if self.date_str is None and tag == 'time' and self.footer_depth and 'datetime' in attrs:
+            self.date_str = attrs['datetime'] or ''
+        if tag in VOID_ELEMENTS:
+            return
+        if 'tgme_widget_message_footer' in classes:
+            self.footer_depth += 1
+        self.stack.append((tag, classes))
+
+    def handle_endtag(self, tag):
+        if self.stack is None or tag in VOID_ELEMENTS:
+            return
+        self._flush()
+        for index in range(len(self.stack) - 1, -1, -1):
+            if self.stack[index][0] == tag:
+                break
+        else:
+            return
+        while len(self.stack) > index:
+            _, classes = self.stack.pop()
+            if 'tgme_widget_message_footer' in classes:
+                self.footer_depth -= 1
+            if self.text_depth is not None and len(self.stack) == self.text_depth:
+                self.text_depth = None
+        if not self.stack:
+            self._end_message()
+
+    def handle_data(self, data):
+        if self.stack is not None:
+            self.data.append(data)
+
+    def handle_comment(self, data):
+        if self.stack is not None:
+            self._flush()
+
+    def close(self):
+        super().close()
+        if self.stack is not None:
+            self._flush()
+            self._end_message()
+
+
+def parse_messages_stream(content, channel_name, stop_list: List[str] = []) -> List[Message]:
+    if isinstance(content, bytes):
+        content = content.decode('utf-8', errors='replace')
+    extractor = MessageExtractor(channel_name, stop_list)
+    extractor.feed(content)
+    extractor.close()
+    return extractor.messages
+
+
+parsers = {
+    'soup': parse_messages_soup,
+    'stream': parse_messages_stream,
+}
+
+
+def set_parser(name):
+    global parser_backend
+    if name not in parsers:
+        raise ValueError(f"Unknown parser backend: {name}")
+    parser_backend = name
+
+
+def parse_messages(content, channel_name, stop_list: List[str] = []) -> List[Message]:
+    started = time.perf_counter()
+    messages = parsers[parser_backend](content, channel_name, stop_list)
+    parse_seconds.labels(parser_backend).observe(time.perf_counter() - started)
+    return messages
+
+
+def fetch_latest_messages(channel_name, limit=20, newer_than: datetime = None, stop_list: List[str] = [], http: requests.Session = None) -> List[Message]:
+    url = channel_url(channel_name)
     try:
-        response = requests.get(url, timeout=5)
-        soup = BeautifulSoup(response.content, 'html.parser', parse_only=SoupStrainer('div', attrs={'class': lambda L: 'tgme_widget_message' in L.split()}))
-        messages = []
-        for message_div in soup:
-            id = message_div['data-post']
-            author = channel_name
-            text_node = message_div.css.select_one('.tgme_widget_message_bubble > .tgme_widget_message_text')
-            if text_node:
-                stripped_strings = text_node.stripped_strings
-                text = ' '.join([s for s in stripped_strings if s not in stop_list])
-            else:
-                continue
-            date_str = message_div.select_one(
-                '.tgme_widget_message_footer time[datetime]')['datetime']
-            date = datetime.fromisoformat(date_str)
-            message = Message(id=id, author=author, text=text, date=date)
-            if newer_than and message.date < newer_than:
-                continue
-            messages.append(message)
+        response = (http or session).get(url, timeout=5)
+        messages = [
+            message for message in parse_messages(response.content, channel_name, stop_list)
+            if not newer_than or message.date >= newer_than
+        ]
         return messages[-limit:]
     except Exception as e:
         logger.error(f"Error fetching messages from {channel_name}: {e}")
         return []
+
+
+def _fetch_page(channel_name, http, params=None, cursor: ChannelCursor = None):
+    headers = {}
+    if cursor and cursor.etag:
+        headers['If-None-Match'] = cursor.etag
+    if cursor and cursor.last_modified:
+        headers['If-Modified-Since'] = cursor.last_modified
+    started = time.perf_counter()
+    response = http.get(channel_url(channel_name), params=params, headers=headers, timeout=5)
+    fetch_seconds.labels(channel_name).observe(time.perf_counter() - started)
+    fetch_responses.labels(channel_name, response.status_code).inc()
+    if response.status_code == 304:
+        fetch_stats.add(requests=1, not_modified=1, parses_skipped=1, bytes_saved=cursor.body_size)
+        fetch_parses_skipped.labels(channel_name, 'not_modified').inc()
+        fetch_bytes_saved.labels(channel_name).inc(cursor.body_size)
+        return None
+    if response.status_code == 429:
+        fetch_stats.add(requests=1, rate_limited=1)
+        raise RateLimitedError(channel_name, _retry_after(response))
+    response.raise_for_status()
+    content = response.content
+    fetch_stats.add(requests=1, bytes_received=len(content))
+    fetch_bytes.labels(channel_name).inc(len(content))
+    if cursor:
+        digest = hashlib.blake2b(content, digest_size=16).digest()
+        if digest == cursor.body_digest:
+            fetch_stats.add(parses_skipped=1)
+            fetch_parses_skipped.labels(channel_name, 'unchanged').inc()
+            return None
+        cursor.etag = response.headers.get('ETag')
+        cursor.last_modified = response.headers.get('Last-Modified')
+        cursor.body_digest = digest
+        cursor.body_size = len(content)
+    return content
+
+
+def page_post_ids(content) -> List[int]:
+    # Every post on a page, including media-only and service posts that have no text and
+    # so never become a Message; the cursor has to move past those as well
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return [int(post_id) for post_id in POST_ID_PATTERN.findall(content)]
+
+
+def fetch_new_messages(channel_name, cursor: ChannelCursor, newer_than: datetime = None, stop_list: List[str] = [], http: requests.Session = None,
+                       raise_errors: bool = False) -> List[Message]:
+    # raise_errors lets callers with a fallback tell a failed fetch from an empty one
+    http = http or session
+    try:
+        if cursor.last_id is None:
+            content = _fetch_page(channel_name, http)
+            messages = parse_messages(content, channel_name, stop_list)
+            last_seen = max(page_post_ids(content), default=None)
+            pages = 1
+            while newer_than and len(messages) >= PAGE_SIZE and messages[0].date >= newer_than and pages < MAX_PAGES:
+                older = parse_messages(_fetch_page(channel_name, http, params={'before': messages[0].post_id}), channel_name, stop_list)
+                if not older:
+                    break
+                messages = [message for message in older if message.post_id < messages[0].post_id] + messages
+                pages += 1
+            if last_seen is not None:
+                cursor.advance(last_seen)
+            if newer_than:
+                messages = [message for message in messages if message.date >= newer_than]
+        else:
+            content = _fetch_page(channel_name, http, params={'after': cursor.last_id}, cursor=cursor)
+            if content is None:
+                fetch_stats.add(empty_polls=1)
+                return []
+            last_seen = cursor.last_id
+            messages = []
+            pages = 0
+            while content is not None and pages < MAX_PAGES:
+                post_ids = [post_id for post_id in page_post_ids(content) if post_id > last_seen]
+                if not post_ids:
+                    break
+                messages.extend(message for message in parse_messages(content, channel_name, stop_list) if message.post_id > last_seen)
+                last_seen = max(post_ids)
+                pages += 1
+                if len(post_ids) < PAGE_SIZE:
+                    break
+                content = _fetch_page(channel_name, http, params={'after': last_seen})
+            if last_seen > cursor.last_id:
+                cursor.advance(last_seen)
+
+        if not messages:
+            fetch_stats.add(empty_polls=1)
+        return messages
+    except RateLimitedError:
+        raise
+    except Exception as e:
+        if raise_errors:
+            raise
+        logger.error(f"Error fetching messages from {channel_name}: {e}")
+        return []
@@ -0,0 +1,119 @@
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional
+import app_logger
+
+logger = app_logger.get(__name__)
+
+FIRESTORE_BATCH_LIMIT = 500
+
+
+@dataclass
+class FcmTokenRecord:
+    timestamp: datetime
+    token: str
+    uid: str
+    # Regions the device subscribed to; None means every region
+    regions: Optional[frozenset] = None
+
+    @staticmethod
+    def from_dict(data: dict):
+        regions = data.get('regions')
+        return FcmTokenRecord(
+            timestamp=datetime.utcfromtimestamp(data.get('timestamp') / 1000),
+            token=data.get('token'),
+            uid=data.get('uid'),
+            regions=frozenset(regions) if regions is not None else None,
+        )
+
+    def wants(self, region_id: Optional[int]) -> bool:
+        return region_id is None or self.regions is None or region_id in self.regions
+
+
+class TokenRegistry:
+    def __init__(self, db, token_deadline: timedelta, sweep_interval: float, collection: str = 'fcm_tokens'):
+        self.db = db
+        self.token_deadline = token_deadline
+        self.sweep_interval = sweep_interval
+        self.collection = collection
+        self.records = {}
+        # Per-region partitions of the active tokens, rebuilt lazily after any change
+        self.active_tokens = {}
+        self.lock = threading.Lock()
+        self.loaded = threading.Event()
+        self.stopped = threading.Event()
+        self.watch = None
+
+    def start(self):
+        self.watch = self.db.collection(self.collection).on_snapshot(self._on_snapshot)
+        threading.Thread(target=self._sweep_thread, daemon=True).start()
+        logger.info("TokenRegistry started")
+
+    def stop(self):
+        self.stopped.set()
+        if self.watch is not None:
+            self.watch.unsubscribe()
+
+    def _on_snapshot(self, _docs, changes, _read_time):
+        with self.lock:
+            for change in changes:
+                doc = change.document
+                if change.type.name == 'REMOVED':
+                    self.records.pop(doc.id, None)
+                    continue
+                try:
+                    self.records[doc.id] = FcmTokenRecord.from_dict(doc.to_dict())
+                except Exception as e:
+                    logger.warning(f"Skipping malformed token document {doc.id}: {e}")
+            self.active_tokens = {}
+        if not self.loaded.is_set():
+            logger.info(f"Loaded {len(self.records)} notification tokens")
+            self.loaded.set()
+
+    def tokens(self, region_id: Optional[int] = None, timeout: float = 10) -> List[str]:
+        if not self.loaded.wait(timeout):
+            logger.warning("Notification tokens are not loaded yet")
+        with self.lock:
+            tokens = self.active_tokens.get(region_id)
+            if tokens is None:
+                oldest = datetime.utcnow() - self.token_deadline
+                tokens = [record.token for record in self.records.values() if record.timestamp >= oldest and record.wants(region_id)]
+                self.active_tokens[region_id] = tokens
+            return tokens
+
+    def remove(self, doc_ids: List[str]):
+        with self.lock:
+            for doc_id in doc_ids:
+                self.records.pop(doc_id, None)
+            self.active_tokens = {}
+        collection_ref = self.db.collection(self.collection)
+        for start in range(0, len(doc_ids), FIRESTORE_BATCH_LIMIT):
+            batch = self.db.batch()
+            for doc_id in doc_ids[start:start + FIRESTORE_BATCH_LIMIT]:
+                batch.delete(collection_ref.document(doc_id))
+            batch.commit()
+
+    def remove_tokens(self, tokens: List[str]):
+        tokens = set(tokens)
+        with self.lock:
+            doc_ids = [doc_id for doc_id, record in self.records.items() if record.token in tokens]
+        if doc_ids:
+            self.remove(doc_ids)
+
+    def sweep_expired(self):
+        oldest = datetime.utcnow() - self.token_deadline
+        with self.lock:
+            expired = [doc_id for doc_id, record in self.records.items() if record.timestamp < oldest]
+        if expired:
+            logger.info(f"Deleting {len(expired)} expired notification tokens")
+            self.remove(expired)
+
+    def _sweep_thread(self):
+        self.loaded.wait()
+        while not self.stopped.is_set():
+            try:
+                self.sweep_expired()
+            except Exception as e:
+                logger.error(f"Error deleting expired notification tokens: {e}")
+            self.stopped.wait(self.sweep_interval)
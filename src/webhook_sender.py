@@ -0,0 +1,271 @@
+import random
+import string
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, List
+import requests
+from requests.adapters import HTTPAdapter
+from message_bus import message_bus
+from ai_worker import AiAlert
+from config import Settings, WebhookConfig
+import app_logger
+import metrics
+
+logger = app_logger.get(__name__)
+
+webhook_seconds = metrics.histogram('pyalerts_webhook_seconds', 'Webhook request duration', ['webhook'])
+webhook_deliveries = metrics.counter('pyalerts_webhook_deliveries_total', 'Webhook events by outcome', ['webhook', 'outcome'])
+
+EVENTS = ('ai_alert', 'ai_alert_update', 'alert', 'clear')
+# Fields a payload or query argument template may reference as {name}
+FIELDS = frozenset({
+    'event', 'time', 'alert', 'attacker', 'text', 'confidence', 'original_text',
+    'region_id', 'region', 'region_en', 'changed',
+})
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def compile_template(value) -> Callable[[dict], object]:
+    # Parses placeholders once; rendering is then list joins and dict lookups. A string that is
+    # exactly one placeholder keeps the field's type, so "{confidence}" stays a number in JSON.
+    if isinstance(value, dict):
+        items = [(key, compile_template(item)) for key, item in value.items()]
+        return lambda context: {key: render(context) for key, render in items}
+    if isinstance(value, list):
+        renders = [compile_template(item) for item in value]
+        return lambda context: [render(context) for render in renders]
+    if not isinstance(value, str):
+        return lambda context: value
+
+    parts = []
+    for literal, field, format_spec, conversion in string.Formatter().parse(value):
+        if literal:
+            parts.append((literal, None, None))
+        if field is None:
+            continue
+        if field not in FIELDS:
+            raise ValueError(f"Unknown webhook template field '{field}', expected one of {', '.join(sorted(FIELDS))}")
+        parts.append((None, field, format_spec))
+    if len(parts) == 1 and parts[0][1] is not None and not parts[0][2]:
+        field = parts[0][1]
+        return lambda context: context.get(field)
+    if all(field is None for _, field, _ in parts):
+        return lambda context: value
+
+    def render(context):
+        return ''.join(literal if field is None else ('' if context.get(field) is None else format(context[field], format_spec))
+                       for literal, field, format_spec in parts)
+    return render
+
+
+class CircuitBreaker:
+    # Opens after `threshold` consecutive failed deliveries and lets a single probe
+    # through once `reset_timeout` has passed; a successful probe closes it again
+    def __init__(self, threshold: int = 5, reset_timeout: float = 60.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+        return self.state != OPEN
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> bool:
+        # Returns True when this failure opened the breaker
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.threshold:
+            opened = self.state != OPEN
+            self.state = OPEN
+            self.opened_at = self.clock()
+            return opened
+        return False
+
+
+class WebhookEndpoint:
+    # One configured webhook with its own bounded outbox and delivery thread, so a slow
+    # or failing partner only ever delays its own events
+    def __init__(self, config: WebhookConfig, session: requests.Session, outbox_size: int = 100, max_retries: int = 3,
+                 backoff: float = 0.5, breaker: CircuitBreaker = None):
+        self.config = config
+        self.name = config.name or config.url
+        self.method = (config.method or 'POST').upper()
+        self.events = frozenset(config.events)
+        unknown = self.events.difference(EVENTS)
+        if unknown:
+            raise ValueError(f"Unknown webhook events {', '.join(sorted(unknown))}, expected any of {', '.join(EVENTS)}")
+        self.timeout = config.timeout
+        self.render_payload = compile_template(config.payload)
+        self.render_query = [(arg.name, compile_template(arg.value)) for arg in config.query_args]
+        self.session = session
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.outbox = deque(maxlen=outbox_size)
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.stopped = False
+        self.thread = None
+
+    def put(self, context: dict):
+        with self.condition:
+            if len(self.outbox) == self.outbox.maxlen:
+                self.dropped += 1
+                webhook_deliveries.labels(self.name, 'dropped').inc()
+            self.outbox.append(context)
+            self.condition.notify()
+
+    def request(self, context: dict) -> dict:
+        params = [(name, render(context)) for name, render in self.render_query]
+        request = dict(method=self.method, url=self.config.url, params=params, timeout=self.timeout)
+        if self.method != 'GET':
+            request['json'] = self.render_payload(context)
+        return request
+
+    def _sleep_backoff(self, attempt):
+        time.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+
+    def deliver(self, context: dict) -> bool:
+        if not self.breaker.allow():
+            webhook_deliveries.labels(self.name, 'rejected').inc()
+            return False
+        request = self.request(context)
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._sleep_backoff(attempt - 1)
+            started = time.monotonic()
+            try:
+                response = self.session.request(**request)
+                webhook_seconds.labels(self.name).observe(time.monotonic() - started)
+                if response.status_code < 400:
+                    self.breaker.record_success()
+                    webhook_deliveries.labels(self.name, 'delivered').inc()
+                    return True
+                error = f"HTTP {response.status_code}"
+                if response.status_code not in RETRY_STATUSES:
+                    break
+            except requests.RequestException as e:
+                webhook_seconds.labels(self.name).observe(time.monotonic() - started)
+                error = str(e)
+        webhook_deliveries.labels(self.name, 'failed').inc()
+        logger.warning(f"Webhook {self.name} failed for {context['event']}: {error}")
+        if self.breaker.record_failure():
+            logger.warning(f"Webhook {self.name} circuit opened for {self.breaker.reset_timeout:.0f}s")
+        return False
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.outbox and not self.stopped:
+                    self.condition.wait()
+                if not self.outbox:
+                    return
+                context = self.outbox.popleft()
+            try:
+                self.deliver(context)
+            except Exception as e:
+                logger.error(f"Error delivering webhook {self.name}: {e}")
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name=f'webhook-{self.name}', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = None):
+        # Lets the thread drain what is already queued
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+
+class WebhookSender:
+    def __init__(self, settings: Settings, session: requests.Session = None):
+        self.session = session or requests.Session()
+        if session is None:
+            # Each endpoint thread holds at most one connection, even when endpoints share a host
+            adapter = HTTPAdapter(pool_connections=max(1, len(settings.webhooks)), pool_maxsize=max(1, len(settings.webhooks)))
+            self.session.mount('https://', adapter)
+            self.session.mount('http://', adapter)
+        self.endpoints: List[WebhookEndpoint] = [
+            WebhookEndpoint(
+                config,
+                self.session,
+                outbox_size=settings.webhook_outbox_size,
+                max_retries=settings.webhook_max_retries,
+                backoff=settings.webhook_retry_backoff,
+                breaker=CircuitBreaker(settings.webhook_breaker_threshold, settings.webhook_breaker_reset),
+            )
+            for config in settings.webhooks
+        ]
+
+    def start(self):
+        for endpoint in self.endpoints:
+            endpoint.start()
+        message_bus.subscribe('ai_alert', self.handle_ai_alert)
+        message_bus.subscribe('ai_alert_update', self.handle_ai_alert_update)
+        message_bus.subscribe('alert', self.handle_alert)
+        message_bus.subscribe('clear', self.handle_clear)
+        logger.info(f"WebhookSender started with {len(self.endpoints)} endpoints")
+
+    def stop(self, timeout: float = 5.0):
+        for endpoint in self.endpoints:
+            endpoint.stop(timeout)
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    def handle_ai_alert(self, alert: AiAlert, event: str = 'ai_alert'):
+        self.dispatch({
+            'event': event,
+            'time': self._now(),
+            'alert': alert.alert,
+            'attacker': alert.attacker,
+            'text': alert.text,
+            'confidence': alert.confidence,
+            'original_text': alert.original_text,
+            'region_id': alert.region_id,
+        })
+
+    def handle_ai_alert_update(self, alert: AiAlert):
+        # The complete verdict for a streamed ai_alert, which had no text or confidence yet
+        if alert.alert:
+            self.handle_ai_alert(alert, 'ai_alert_update')
+
+    def handle_alert(self, region):
+        self._region_event('alert', region)
+
+    def handle_clear(self, region):
+        self._region_event('clear', region)
+
+    def _region_event(self, event, region):
+        # Region objects are shared and mutable, so the state comes from the topic
+        self.dispatch({
+            'event': event,
+            'time': self._now(),
+            'alert': event == 'alert',
+            'region_id': region.id,
+            'region': region.name,
+            'region_en': region.name_en,
+            'changed': region.changed.isoformat() if region.changed else None,
+        })
+
+    def dispatch(self, context: dict):
+        for endpoint in self.endpoints:
+            if context['event'] in endpoint.events:
+                endpoint.put(context)
@@ -0,0 +1,188 @@
+import json
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from enum import Enum
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# In-process stand-ins for external services, shared by the tests
+
+
+class WebhookStubServer:
+    # Partner endpoint stand-in. behaviours maps a path to {"delay": s, "status": code, "fail_first": n};
+    # every request is recorded with its arrival time, and new TCP connections are counted
+    def __init__(self, behaviours=None):
+        self.behaviours = behaviours or {}
+        self.received = []
+        self.connections = 0
+        self.attempts = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server.server_address[1]}{path}"
+
+    def requests_for(self, path):
+        with self.lock:
+            return [request for request in self.received if request["path"] == path]
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with stub.lock:
+                    stub.connections += 1
+
+            def handle_request(self):
+                url = urlparse(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                behaviour = stub.behaviours.get(url.path, {})
+                with stub.lock:
+                    attempt = stub.attempts[url.path] = stub.attempts.get(url.path, 0) + 1
+                if behaviour.get("delay"):
+                    time.sleep(behaviour["delay"])
+                status = behaviour.get("status", 200)
+                if attempt <= behaviour.get("fail_first", 0):
+                    status = 503
+                if status < 400:
+                    with stub.lock:
+                        stub.received.append({"path": url.path, "method": self.command, "query": parse_qs(url.query), "json": body, "at": time.monotonic()})
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            do_GET = do_POST = do_PUT = handle_request
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeChangeType(Enum):
+    ADDED = 1
+    MODIFIED = 2
+    REMOVED = 3
+
+
+@dataclass
+class FakeDocumentChange:
+    type: FakeChangeType
+    document: 'FakeDocument'
+
+
+class FakeDocumentReference:
+    def __init__(self, collection, doc_id):
+        self.collection = collection
+        self.id = doc_id
+
+    def delete(self):
+        time.sleep(self.collection.rpc_latency)
+        self.collection.remove([self.id])
+
+    def set(self, data):
+        self.collection.put(self.id, data)
+
+
+class FakeDocument:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.data = data
+
+    def to_dict(self):
+        return dict(self.data)
+
+
+class FakeWatch:
+    def __init__(self, collection, callback):
+        self.collection = collection
+        self.callback = callback
+
+    def unsubscribe(self):
+        self.collection.watches.remove(self)
+
+
+class FakeCollection:
+    def __init__(self, rpc_latency):
+        self.rpc_latency = rpc_latency
+        self.documents = {}
+        self.watches = []
+        self.lock = threading.Lock()
+
+    def document(self, doc_id):
+        return FakeDocumentReference(self, doc_id)
+
+    def get(self):
+        time.sleep(self.rpc_latency)
+        with self.lock:
+            return [FakeDocument(self.document(doc_id), data) for doc_id, data in self.documents.items()]
+
+    def _notify(self, changes):
+        for watch in list(self.watches):
+            watch.callback(None, changes, datetime.now(timezone.utc))
+
+    def put(self, doc_id, data):
+        with self.lock:
+            change_type = FakeChangeType.MODIFIED if doc_id in self.documents else FakeChangeType.ADDED
+            self.documents[doc_id] = data
+        self._notify([FakeDocumentChange(change_type, FakeDocument(self.document(doc_id), data))])
+
+    def remove(self, doc_ids):
+        with self.lock:
+            removed = [FakeDocument(self.document(doc_id), self.documents.pop(doc_id)) for doc_id in doc_ids if doc_id in self.documents]
+        self._notify([FakeDocumentChange(FakeChangeType.REMOVED, document) for document in removed])
+
+    def on_snapshot(self, callback):
+        watch = FakeWatch(self, callback)
+        documents = self.get()
+        self.watches.append(watch)
+        threading.Thread(target=callback, args=(documents, [FakeDocumentChange(FakeChangeType.ADDED, document) for document in documents], datetime.now(timezone.utc)), daemon=True).start()
+        return watch
+
+
+class FakeBatch:
+    def __init__(self, firestore):
+        self.firestore = firestore
+        self.deletes = []
+
+    def delete(self, reference):
+        self.deletes.append(reference)
+
+    def commit(self):
+        time.sleep(self.firestore.rpc_latency)
+        for collection in {id(reference.collection): reference.collection for reference in self.deletes}.values():
+            collection.remove([reference.id for reference in self.deletes if reference.collection is collection])
+        self.firestore.batch_commits += 1
+
+
+class FakeFirestore:
+    # In-memory stand-in for the parts of the Firestore client the sender uses
+    def __init__(self, rpc_latency=0.0):
+        self.rpc_latency = rpc_latency
+        self.collections = {}
+        self.batch_commits = 0
+
+    def collection(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(self.rpc_latency)
+        return self.collections[name]
+
+    def batch(self):
+        return FakeBatch(self)
@@ -0,0 +1,45 @@
+from datetime import datetime, timezone
+import pytest
+import metrics
+from ai_cache import AnalysisCache
+from ai_worker import AiAlert
+from telegram import Message
+
+
+def exposed():
+    # Sample name with labels -> value, as a scrape of /metrics would see it
+    samples = {}
+    for line in metrics.registry.expose().splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+def message(index, text):
+    return Message(id=f"channel/{index}", author='channel', text=text, date=datetime(2024, 3, 1, 20, index, tzinfo=timezone.utc))
+
+
+def test_hits_and_saved_calls_are_exported():
+    before = exposed()
+    cache = AnalysisCache(max_size=100, ttl=600, near_duplicate_threshold=0.8)
+    text = 'Група ударних БпЛА з півдня курсом на Одесу, перебувайте в укриттях'
+    first = cache.lookup([message(1, text), message(2, 'Тиша в небі над областю')])
+    assert len(first.fresh) == 2
+    cache.record(first.fresh, AiAlert(alert=True, attacker='DRONE', text=text, confidence=0.9, original_text=text))
+
+    repost = cache.lookup([message(3, text), message(4, text + ' негайно')])
+    assert repost.fresh == [] and len(repost.verdicts) == 2
+    cache.record_saved_call(1.5, reused=True)
+
+    after = exposed()
+
+    def delta(sample):
+        return after.get(sample, 0.0) - before.get(sample, 0.0)
+
+    assert delta('pyalerts_ai_cache_lookups_total') == 4
+    assert delta('pyalerts_ai_cache_hits_total{kind="exact"}') == 1
+    assert delta('pyalerts_ai_cache_hits_total{kind="near"}') == 1
+    assert delta('pyalerts_ai_cache_calls_saved_total{reused="true"}') == 1
+    assert delta('pyalerts_ai_cache_saved_seconds_total') == pytest.approx(1.5)
+    assert cache.stats.hit_rate == pytest.approx(0.5)
@@ -0,0 +1,48 @@
+import time
+import pytest
+from ai_worker import AiAlert, AiWorker
+from config import parse_settings
+from message_bus import message_bus
+
+
+@pytest.fixture
+def published(monkeypatch):
+    messages = []
+    monkeypatch.setattr(message_bus, 'publish', lambda topic, message: messages.append((topic, message)))
+    return messages
+
+
+@pytest.fixture
+def worker():
+    return AiWorker(parse_settings({'analyzer_prompt': 'Classify threats'}), client=object())
+
+
+def analyze(worker, streamed_fields, verdict):
+    def request_analysis(history, entries, on_fields=None):
+        if streamed_fields:
+            on_fields(streamed_fields)
+        return verdict
+
+    worker.request_analysis = request_analysis
+    worker.sequence += 1
+    worker.in_flight += 1
+    worker._analyze(worker.sequence, worker.generation, (), [], time.monotonic())
+
+
+def test_streamed_alert_is_completed_by_an_update(worker, published):
+    verdict = AiAlert(alert=True, attacker='DRONE', text='Група БпЛА', confidence=0.9, original_text='Група БпЛА')
+    analyze(worker, {'alert': True, 'attacker': 'DRONE'}, verdict)
+    assert [topic for topic, _ in published] == ['ai_alert', 'ai_alert_update']
+    assert published[0][1].text == ''
+    assert published[1][1] is verdict
+
+
+def test_false_verdict_after_streamed_alert_is_not_an_update(worker, published):
+    analyze(worker, {'alert': True, 'attacker': 'DRONE'}, AiAlert(alert=False, attacker='NONE', text='', confidence=0.1, original_text=''))
+    assert [topic for topic, _ in published] == ['ai_alert']
+    assert worker.in_flight == 0
+
+
+def test_false_verdict_without_streamed_alert_publishes_nothing(worker, published):
+    analyze(worker, {'alert': False}, AiAlert(alert=False))
+    assert published == []
@@ -0,0 +1,47 @@
+import pytest
+from ai_worker import AiAlert
+from alert_coalescer import AlertCoalescer
+from config import parse_settings
+from message_bus import message_bus
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def pushed(monkeypatch):
+    alerts = []
+    monkeypatch.setattr(message_bus, 'publish', lambda topic, message: alerts.append(message) if topic == 'push_alert' else None)
+    return alerts
+
+
+@pytest.fixture
+def coalescer():
+    return AlertCoalescer(parse_settings({'alert_coalesce_window': 120, 'alert_escalation_step': 0.15}), clock=FakeClock())
+
+
+def alert(attacker='DRONE', text='Група БпЛА курсом на місто', confidence=0.6, alert=True):
+    return AiAlert(alert=alert, attacker=attacker, text=text, confidence=confidence, original_text=text, region_id=14)
+
+
+def test_update_replaces_a_streamed_alert(coalescer, pushed):
+    early = alert(text='', confidence=0.0)
+    coalescer.handle_ai_alert(early)
+    complete = alert(confidence=0.9)
+    coalescer.handle_ai_alert_update(complete)
+    assert pushed == [early, complete]
+    # Only the first complete verdict replaces the streamed alert
+    coalescer.handle_ai_alert_update(alert(confidence=0.7))
+    assert pushed == [early, complete]
+
+
+def test_false_update_is_not_pushed(coalescer, pushed):
+    early = alert(text='', confidence=0.0)
+    coalescer.handle_ai_alert(early)
+    coalescer.handle_ai_alert_update(alert(attacker='NONE', text='', confidence=0.1, alert=False))
+    assert pushed == [early]
@@ -0,0 +1,63 @@
+import pytest
+from fakes import WebhookStubServer
+import telegram
+from alert_sources import TelegramAlertSource
+from poll_scheduler import PollScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class NoMatcher:
+    def match(self, text):
+        return None, []
+
+
+@pytest.fixture
+def failing_channel(monkeypatch):
+    with WebhookStubServer({'/s/alerts': {'status': 502}}) as stub:
+        monkeypatch.setattr(telegram, 'base_url', stub.url(''))
+        yield stub
+
+
+def poll_for(source, clock, seconds, step=0.05):
+    errors = 0
+    for _ in range(int(seconds / step)):
+        if source.scheduler.due([source.name]):
+            try:
+                source.poll()
+            except Exception:
+                errors += 1
+        clock.now += step
+    return errors
+
+
+def test_failing_source_backs_off(failing_channel):
+    clock = FakeClock()
+    scheduler = PollScheduler(jitter=0.0, clock=clock)
+    source = TelegramAlertSource('alerts', NoMatcher(), scheduler, interval=5.0, min_interval=1.0, backoff_interval=30.0)
+
+    errors = poll_for(source, clock, 60.0)
+    # Due at 0s, then 5s, 15s and 35s later
+    assert errors == failing_channel.attempts['/s/alerts'] == 4
+    assert scheduler.channels['alerts'].failures == 4
+
+
+def test_backoff_is_capped_and_reset_by_a_successful_poll(failing_channel):
+    clock = FakeClock()
+    scheduler = PollScheduler(jitter=0.0, clock=clock)
+    source = TelegramAlertSource('alerts', NoMatcher(), scheduler, interval=5.0, min_interval=1.0, backoff_interval=30.0)
+
+    poll_for(source, clock, 3600.0, step=1.0)
+    assert scheduler.next_wakeup(['alerts']) <= 300.0
+
+    failing_channel.behaviours['/s/alerts'] = {}
+    clock.now = scheduler.channels['alerts'].next_due
+    assert source.poll() == []
+    assert scheduler.channels['alerts'].failures == 0
+    assert scheduler.next_wakeup(['alerts']) == pytest.approx(5.0)
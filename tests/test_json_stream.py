@@ -0,0 +1,53 @@
+import json
+import pytest
+from json_stream import JsonFieldStream
+
+RESPONSES = [
+    '{"risk": 0.85, "alert": true, "attacker": "DRONE", "text": "Група БпЛА, курс на місто"}',
+    '{"alert":false,"confidence":1e-3,"region":null,"tags":["a", {"b": 2}],"count":-12}',
+    '```json\n{\n  "alert": true,\n  "confidence": 0.9\n}\n```',
+]
+
+
+def feed_all(chunks):
+    stream = JsonFieldStream()
+    emitted = []
+    for chunk in chunks:
+        emitted.extend(stream.feed(chunk).items())
+    return stream, emitted
+
+
+def expected_fields(response):
+    return json.loads(response[response.index('{'):response.rindex('}') + 1])
+
+
+@pytest.mark.parametrize('response', RESPONSES)
+def test_split_at_every_offset(response):
+    expected = expected_fields(response)
+    for offset in range(len(response) + 1):
+        stream, emitted = feed_all([response[:offset], response[offset:]])
+        assert stream.finished, offset
+        assert dict(emitted) == expected, offset
+        assert len(emitted) == len(expected), offset
+
+
+@pytest.mark.parametrize('response', RESPONSES)
+def test_one_character_at_a_time(response):
+    stream, emitted = feed_all(list(response))
+    assert stream.finished
+    assert emitted == list(expected_fields(response).items())
+
+
+def test_number_cut_at_decimal_point_is_held_back():
+    stream = JsonFieldStream()
+    assert stream.feed('{"risk": 0.') == {}
+    assert stream.feed('85, "alert": true') == {'risk': 0.85}
+    assert stream.feed(', "attacker": "DRONE"') == {'alert': True, 'attacker': 'DRONE'}
+    assert stream.feed('}') == {}
+    assert stream.finished
+
+
+def test_field_is_reported_before_the_object_ends():
+    stream = JsonFieldStream()
+    assert stream.feed('{"alert": true, "attacker": "MIS') == {'alert': True}
+    assert not stream.finished
@@ -0,0 +1,14 @@
+import metrics
+from message_bus import MessageBus, TopicPolicy
+
+
+def test_outcomes_are_counted():
+    bus = MessageBus({'test_drop': TopicPolicy(max_size=1, overflow='drop_oldest')})
+    received = []
+    bus.subscribe('test_drop', received.append)
+    for index in range(3):
+        bus.publish('test_drop', index)
+
+    exposed = metrics.registry.expose()
+    assert 'pyalerts_bus_messages_total{topic="test_drop",outcome="published"} 3.0' in exposed
+    assert 'pyalerts_bus_messages_total{topic="test_drop",outcome="dropped"} 2.0' in exposed
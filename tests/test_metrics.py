@@ -0,0 +1,70 @@
+import pytest
+import requests
+import metrics
+from metrics import MetricsServer
+
+requests_total = metrics.counter('pyalerts_test_requests_total', 'Requests seen by the metrics server test', ['kind'])
+
+
+class FakeProfiler:
+    def __init__(self):
+        self.running = False
+        self.samples = 0
+
+    def start(self, threads=None):
+        self.running = True
+        self.threads = threads
+
+    def stop(self):
+        self.running = False
+        return 'report\n'
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def serve(profiler=None):
+        server = MetricsServer(0, profiler=profiler)
+        server.start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.port}"
+
+    yield serve
+    for server in servers:
+        server.stop()
+
+
+def test_listens_on_loopback_by_default():
+    server = MetricsServer(0)
+    try:
+        assert server.server.server_address[0] == '127.0.0.1'
+    finally:
+        server.server.server_close()
+
+
+def test_metrics_endpoint(serve):
+    requests_total.labels('get').inc()
+    response = requests.get(f"{serve()}/metrics")
+    assert response.status_code == 200
+    assert 'pyalerts_test_requests_total{kind="get"} 1.0' in response.text
+
+
+def test_profiler_is_controlled_by_post_only(serve):
+    profiler = FakeProfiler()
+    url = serve(profiler)
+    assert requests.get(f"{url}/debug/profile/start").status_code == 405
+    assert not profiler.running
+
+    assert requests.post(f"{url}/debug/profile/start", params={'thread': 'ai-worker'}).status_code == 200
+    assert profiler.running and profiler.threads == ['ai-worker']
+    assert requests.get(f"{url}/debug/profile/status").text == 'running=True samples=0\n'
+    assert requests.post(f"{url}/debug/profile/stop").text == 'report\n'
+    assert not profiler.running
+
+
+def test_profiler_endpoints_need_a_profiler(serve):
+    url = serve()
+    assert requests.post(f"{url}/debug/profile/start").status_code == 404
+    assert requests.get(f"{url}/debug/profile/status").status_code == 404
+    assert requests.post(f"{url}/metrics").status_code == 404
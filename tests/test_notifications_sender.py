@@ -0,0 +1,56 @@
+import time
+from types import SimpleNamespace
+import pytest
+from ai_worker import AiAlert
+from alert_coalescer import HIGHER_CONFIDENCE, NEW, AlertCoalescer
+from config import parse_settings
+from notifications_sender import NotificationsSender
+
+SETTINGS = parse_settings({'alert_dedup_window': 300, 'alert_coalesce_window': 120, 'alert_escalation_step': 0.1})
+
+
+class FakeStore:
+    def __init__(self, sent_alerts=None):
+        self.restored = SimpleNamespace(sent_alerts=dict(sent_alerts or {}))
+        self.sent_alerts = {}
+
+    def put_sent_alert(self, fingerprint, sent_at):
+        self.sent_alerts[fingerprint] = sent_at
+
+
+def alert(confidence=0.6, text='Група БпЛА курсом на місто'):
+    return AiAlert(alert=True, attacker='DRONE', text=text, confidence=confidence, original_text=text, region_id=14)
+
+
+def test_escalation_of_the_same_text_is_sent():
+    coalescer = AlertCoalescer(SETTINGS)
+    sender = NotificationsSender(SETTINGS, store=FakeStore())
+    first, escalation = alert(0.6), alert(0.8)
+    assert coalescer.offer(first) == NEW
+    assert not sender.already_sent(first)
+    assert coalescer.offer(escalation) == HIGHER_CONFIDENCE
+    assert not sender.already_sent(escalation)
+
+
+def test_repeat_within_a_run_is_left_to_the_coalescer():
+    sender = NotificationsSender(SETTINGS, store=FakeStore())
+    assert not sender.already_sent(alert())
+    assert not sender.already_sent(alert())
+
+
+def test_replay_after_restart_is_skipped_once():
+    previous = FakeStore()
+    NotificationsSender(SETTINGS, store=previous).already_sent(alert())
+    assert len(previous.sent_alerts) == 1
+
+    restarted = NotificationsSender(SETTINGS, store=FakeStore(previous.sent_alerts))
+    assert restarted.already_sent(alert())
+    assert not restarted.already_sent(alert(0.8))
+    assert not restarted.already_sent(alert())
+
+
+@pytest.mark.parametrize('age', [301, 3600])
+def test_replay_outside_the_window_is_sent(age):
+    fingerprint = NotificationsSender.fingerprint(alert())
+    restarted = NotificationsSender(SETTINGS, store=FakeStore({fingerprint: time.time() - age}))
+    assert not restarted.already_sent(alert())
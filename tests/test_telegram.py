@@ -0,0 +1,31 @@
+from types import SimpleNamespace
+import metrics
+from telegram import ChannelCursor, fetch_bytes_saved, fetch_new_messages, fetch_parses_skipped
+
+PAGE = b'<html><body><div class="tgme_channel_history"></div></body></html>'
+
+
+class FakeSession:
+    # Replays canned responses and records the conditional headers it was sent
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.headers = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.headers.append(dict(headers or {}))
+        status, content = self.responses.pop(0)
+        return SimpleNamespace(status_code=status, content=content, headers={'ETag': '"v1"'}, raise_for_status=lambda: None)
+
+
+def test_skipped_parses_and_saved_bytes_are_exported():
+    channel = 'conditional_channel'
+    session = FakeSession((200, PAGE), (304, b''), (200, PAGE))
+    cursor = ChannelCursor(last_id=100)
+    for _ in range(3):
+        assert fetch_new_messages(channel, cursor, http=session) == []
+
+    assert session.headers[1] == {'If-None-Match': '"v1"'}
+    assert fetch_parses_skipped.labels(channel, 'not_modified').value == 1
+    assert fetch_parses_skipped.labels(channel, 'unchanged').value == 1
+    assert fetch_bytes_saved.labels(channel).value == len(PAGE)
+    assert f'pyalerts_fetch_bytes_saved_total{{channel="{channel}"}} {float(len(PAGE))}' in metrics.registry.expose()
@@ -0,0 +1,97 @@
+import time
+from datetime import timedelta
+import pytest
+from fakes import FakeFirestore
+from token_registry import FIRESTORE_BATCH_LIMIT, TokenRegistry
+
+DAY_MS = 24 * 3600 * 1000
+
+
+def token_document(token, age_days=0, regions=None):
+    document = {'timestamp': int(time.time() * 1000) - age_days * DAY_MS, 'token': token, 'uid': f"uid-{token}"}
+    if regions is not None:
+        document['regions'] = regions
+    return document
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+@pytest.fixture
+def firestore():
+    return FakeFirestore()
+
+
+@pytest.fixture
+def registry(firestore):
+    collection = firestore.collection('fcm_tokens')
+    collection.documents['a'] = token_document('token-a')
+    collection.documents['b'] = token_document('token-b', regions=[14])
+    collection.documents['old'] = token_document('token-old', age_days=90)
+    registry = TokenRegistry(firestore, token_deadline=timedelta(days=60), sweep_interval=3600)
+    registry.start()
+    assert registry.loaded.wait(2)
+    # Let the first sweep delete the expired token before the test starts counting
+    assert wait_for(lambda: firestore.batch_commits == 1)
+    yield registry
+    registry.stop()
+
+
+def test_initial_snapshot_and_sweep(registry, firestore):
+    assert sorted(registry.tokens()) == ['token-a', 'token-b']
+    # The sweep thread deletes expired tokens from Firestore once the snapshot is loaded
+    assert 'old' not in firestore.collection('fcm_tokens').documents
+    assert 'old' not in registry.records
+
+
+def test_region_partitions(registry):
+    assert sorted(registry.tokens(14)) == ['token-a', 'token-b']
+    assert registry.tokens(5) == ['token-a']
+
+
+def test_snapshot_add_modify_remove(registry, firestore):
+    collection = firestore.collection('fcm_tokens')
+    assert registry.tokens(5) == ['token-a']
+
+    collection.put('c', token_document('token-c', regions=[5]))
+    assert sorted(registry.tokens(5)) == ['token-a', 'token-c']
+
+    # A modified document replaces the record, and cached partitions are rebuilt
+    collection.put('c', token_document('token-c2', regions=[7]))
+    assert registry.tokens(5) == ['token-a']
+    assert sorted(registry.tokens(7)) == ['token-a', 'token-c2']
+    collection.put('a', token_document('token-a', age_days=61))
+    assert registry.tokens(5) == []
+
+    collection.remove(['c'])
+    assert 'c' not in registry.records
+    assert registry.tokens(7) == []
+
+
+def test_malformed_document_is_skipped(registry, firestore):
+    firestore.collection('fcm_tokens').put('broken', {'token': 'token-broken'})
+    assert 'broken' not in registry.records
+    assert sorted(registry.tokens()) == ['token-a', 'token-b']
+
+
+def test_remove_tokens(registry, firestore):
+    collection = firestore.collection('fcm_tokens')
+    registry.remove_tokens(['token-b', 'token-unknown'])
+    assert 'b' not in collection.documents
+    assert 'a' in collection.documents
+    assert registry.tokens() == ['token-a']
+
+
+def test_remove_tokens_in_firestore_batches(registry, firestore):
+    collection = firestore.collection('fcm_tokens')
+    count = FIRESTORE_BATCH_LIMIT + 10
+    for index in range(count):
+        collection.put(f"device{index}", token_document(f"token-{index}"))
+    registry.remove_tokens([f"token-{index}" for index in range(count)])
+    assert firestore.batch_commits == 1 + 2
+    assert not any(doc_id.startswith('device') for doc_id in collection.documents)
+    assert sorted(registry.tokens()) == ['token-a', 'token-b']
@@ -0,0 +1,111 @@
+import time
+import pytest
+import requests
+from fakes import WebhookStubServer
+from config import WebhookConfig, parse_settings
+from webhook_sender import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, WebhookEndpoint, WebhookSender
+
+CONTEXT = {'event': 'ai_alert', 'time': '2024-03-01T20:00:00+00:00', 'alert': True, 'attacker': 'DRONE', 'text': 'Група ударних БпЛА',
+           'confidence': 0.9, 'original_text': 'Група ударних БпЛА', 'region_id': 14}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def endpoint(stub, path, max_retries=3, breaker=None):
+    config = WebhookConfig(name=path, method='POST', url=stub.url(path), query_args=[], payload={'event': '{event}', 'risk': '{confidence}'},
+                           events=['ai_alert'], timeout=2.0)
+    return WebhookEndpoint(config, requests.Session(), max_retries=max_retries, backoff=0.01, breaker=breaker)
+
+
+@pytest.fixture
+def stub():
+    with WebhookStubServer() as server:
+        yield server
+
+
+def test_retries_transient_failures_with_backoff(stub):
+    stub.behaviours['/flaky'] = {'fail_first': 2}
+    started = time.monotonic()
+    assert endpoint(stub, '/flaky').deliver(CONTEXT)
+    assert stub.attempts['/flaky'] == 3
+    # Two backoff sleeps of 0.01 * 2^attempt * [0.5, 1.5)
+    assert time.monotonic() - started >= 0.01 * 0.5 + 0.02 * 0.5
+    assert stub.requests_for('/flaky')[0]['json'] == {'event': 'ai_alert', 'risk': 0.9}
+
+
+def test_gives_up_after_max_retries(stub):
+    stub.behaviours['/down'] = {'status': 503}
+    assert not endpoint(stub, '/down', max_retries=2).deliver(CONTEXT)
+    assert stub.attempts['/down'] == 3
+
+
+def test_does_not_retry_client_errors(stub):
+    stub.behaviours['/bad'] = {'status': 400}
+    assert not endpoint(stub, '/bad').deliver(CONTEXT)
+    assert stub.attempts['/bad'] == 1
+
+
+def test_circuit_breaker_opens_and_closes(stub):
+    stub.behaviours['/down'] = {'status': 503}
+    clock = FakeClock()
+    breaker = CircuitBreaker(threshold=2, reset_timeout=30.0, clock=clock)
+    webhook = endpoint(stub, '/down', max_retries=0, breaker=breaker)
+
+    assert not webhook.deliver(CONTEXT)
+    assert breaker.state == CLOSED
+    assert not webhook.deliver(CONTEXT)
+    assert breaker.state == OPEN
+    # While open, events are rejected without a request
+    assert not webhook.deliver(CONTEXT)
+    assert stub.attempts['/down'] == 2
+
+    # After the reset timeout one probe goes through; a failed probe opens it again
+    clock.now += 30.0
+    assert not webhook.deliver(CONTEXT)
+    assert stub.attempts['/down'] == 3
+    assert breaker.state == OPEN
+
+    clock.now += 30.0
+    stub.behaviours['/down'] = {}
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert webhook.deliver(CONTEXT)
+    assert breaker.state == CLOSED
+    assert breaker.failures == 0
+
+
+def test_failing_endpoint_does_not_delay_others(stub):
+    stub.behaviours['/slow'] = {'delay': 0.5, 'status': 503}
+    settings = parse_settings({
+        'webhooks': [
+            {'name': 'slow', 'url': stub.url('/slow'), 'events': ['ai_alert']},
+            {'name': 'fast', 'url': stub.url('/fast'), 'events': ['ai_alert']},
+        ],
+        'webhook_max_retries': 1,
+        'webhook_retry_backoff': 0.01,
+        'webhook_outbox_size': 10,
+    })
+    sender = WebhookSender(settings)
+    for webhook in sender.endpoints:
+        webhook.start()
+    try:
+        started = time.monotonic()
+        for index in range(10):
+            sender.dispatch(dict(CONTEXT, text=f"alert {index}"))
+        deadline = started + 2.0
+        while len(stub.requests_for('/fast')) < 10 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(stub.requests_for('/fast')) == 10
+        assert time.monotonic() - started < 1.0
+        # Meanwhile the failing endpoint is still working through its first events
+        assert stub.attempts['/slow'] <= 3
+    finally:
+        for webhook in sender.endpoints:
+            with webhook.condition:
+                webhook.outbox.clear()
+        sender.stop(timeout=2.0)